@@ -0,0 +1,230 @@
+# File: analytics/returns.py
+# Module: Lợi nhuận theo thời gian (TWR) và theo dòng tiền (XIRR) từ lịch sử NAV của Engine
+# - Thay ROI đơn giản (NAV - vốn nạp ròng) / vốn nạp ròng: sai lệch mạnh khi tài khoản nạp/rút nhiều lần.
+# - TWR: lợi nhuận từng ngày r = NAV hôm nay / (NAV hôm qua + nạp/rút hôm nay) - 1, nối chuỗi (1 + r) -> không phụ thuộc dòng tiền.
+# - XIRR: lãi suất năm r sao cho Σ dòng tiền x (1 + r)^(-năm) = 0, giải Newton có chặn (bisection) cho MỌI bài toán cùng lúc.
+# - Nhiều tài khoản x nhiều ngày chốt (cuối tháng) x nhiều kỳ (1M/3M/YTD/1Y) -> 1 lượt NumPy, ra 1 bảng.
+
+import numpy as np
+import pandas as pd
+
+from processors.event_time import NS_PER_DAY, day_ordinal, ffill_daily
+
+WINDOWS = {'1M': 1, '3M': 3, '6M': 6, '1Y': 12, 'YTD': 'YTD', 'ALL': None}  # Kỳ -> số tháng lùi lại
+DEFAULT_WINDOWS = ('1M', '3M', 'YTD', '1Y')
+MIN_BASE = 1_000.0         # Vốn đầu ngày dưới 1.000đ coi như tài khoản trống (không tính lợi nhuận ngày)
+DAYS_PER_YEAR = 365.0      # Quy ước XIRR của Excel
+COLUMNS = ['Tài khoản', 'Ngày', 'Kỳ', 'Từ ngày', 'NAV đầu kỳ', 'Nạp/Rút ròng', 'NAV cuối kỳ', 'TWR (%)', 'XIRR (%)']
+
+
+def account_history(src, price_store=None, basis='val'):
+    """
+    (ngày [số ngày từ 1970], NAV cuối ngày, tiền nạp(+)/rút(-) trong ngày) của 1 tài khoản.
+    src: PortfolioEngine (đọc lịch sử NAV ghi trong run()) hoặc DataFrame NAV ngày cùng cột ('Ngày', 'Tổng Tài Sản (NAV)', 'Vốn Nạp Ròng').
+    Nạp/rút = chênh lệch vốn nạp ròng giữa 2 ngày (Engine chỉ đổi vốn nạp ròng ở sự kiện NAP_TIEN / RUT_TIEN)
+    + phần tiền CASH_SNAPSHOT đặt lại (số dư thực tế - số dư Engine tự tính, vd VCK chốt số dư ngày hôm nay):
+    khoản chênh này không đến từ giao dịch nào -> không tính là lãi/lỗ.
+    """
+    df = src.get_nav_chart_data(price_store=price_store, basis=basis) if hasattr(src, 'get_nav_chart_data') else src
+    if df is None or len(df) == 0: return np.empty(0, 'int64'), np.empty(0), np.empty(0)
+    days = day_ordinal(pd.to_datetime(df['Ngày']).to_numpy('datetime64[ns]').view('int64'))
+    dep = df['Vốn Nạp Ròng'].to_numpy('float64')
+    flow = np.diff(dep, prepend=0.0)
+    if hasattr(src, 'nav'):
+        s_days, s_cash = src.nav.snapshot_flows()
+        pos = np.searchsorted(days, s_days)
+        ok = (pos < len(days)) & (days[np.minimum(pos, len(days) - 1)] == s_days)
+        np.add.at(flow, pos[ok], s_cash[ok])
+    return days, df['Tổng Tài Sản (NAV)'].to_numpy('float64'), flow
+
+
+def stack_histories(histories, price_store=None, basis='val'):
+    """
+    Ghép lịch sử nhiều tài khoản lên chung 1 lịch ngày: {'names', 'days', 'nav', 'flow'} với nav/flow là ma trận (ngày x tài khoản).
+    Dòng 0 là ngày ảo trước ngày đầu tiên (NAV = 0) -> kỳ bắt đầu trước khi mở tài khoản tính từ lúc mở.
+    NAV forward-fill qua ngày thiếu (frame không liên tục), trước ngày đầu của tài khoản = 0.
+    """
+    names = list(histories)
+    hist = [account_history(histories[k], price_store, basis) for k in names]
+    have = [h[0] for h in hist if len(h[0])]
+    if not have: return {'names': names, 'days': np.empty(0, 'int64'), 'nav': np.zeros((0, len(names))), 'flow': np.zeros((0, len(names)))}
+    first = min(int(d[0]) for d in have) - 1
+    days = np.arange(first, max(int(d[-1]) for d in have) + 1)
+    rows = np.concatenate([h[0] - first for h in hist])
+    cols = np.concatenate([np.full(len(h[0]), j) for j, h in enumerate(hist)])
+    nav = ffill_daily(len(days), rows, cols, np.concatenate([h[1] for h in hist]), len(names))
+    flow = np.zeros((len(days), len(names)))
+    np.add.at(flow, (rows, cols), np.concatenate([h[2] for h in hist]))
+    return {'names': names, 'days': days, 'nav': nav, 'flow': flow}
+
+
+def daily_returns(nav, flow):
+    """Lợi nhuận từng ngày (ma trận ngày x tài khoản): nạp/rút tính đầu ngày. Vốn đầu ngày < MIN_BASE -> 0."""
+    prev = np.vstack([np.zeros((1, nav.shape[1])), nav[:-1]])
+    base = prev + flow
+    ok = base > MIN_BASE
+    return np.where(ok, nav / np.where(ok, base, 1.0) - 1.0, 0.0)
+
+
+def twr_index(nav, flow):
+    """Chỉ số tăng trưởng TWR (bắt đầu = 1): tích lũy (1 + r) theo ngày. TWR kỳ (s, e] = index[e] / index[s] - 1."""
+    return np.cumprod(1.0 + daily_returns(nav, flow), axis=0)
+
+
+def window_start(days, window):
+    """Ngày cuối TRƯỚC kỳ (số ngày từ 1970) của từng ngày chốt: 1M = lùi 1 tháng lịch, YTD = 31/12 năm trước, ALL = -inf."""
+    spec = WINDOWS[window]
+    if spec is None: return np.full(len(days), np.iinfo('int64').min // NS_PER_DAY)
+    d = pd.DatetimeIndex(np.asarray(days, 'int64') * NS_PER_DAY)
+    start = d - pd.to_timedelta(d.dayofyear, 'D') if spec == 'YTD' else d - pd.DateOffset(months=spec)
+    return day_ordinal(start.asi8)
+
+
+def xirr(pid, years, amounts, n, tol=1e-10, max_iter=100):
+    """
+    XIRR của n bài toán cùng lúc. Dòng tiền k thuộc bài toán pid[k], cách mốc đầu years[k] năm, số tiền amounts[k] (âm = bỏ vào).
+    Giải theo x = ln(1 + r): NPV(x) = Σ c.e^(-x.t). Newton, bước nhảy ra ngoài khoảng chặn [lo, hi] (đổi dấu NPV) -> chia đôi.
+    NaN: NPV không đổi dấu trong r ∈ (-99.995%, +2.2 triệu %) (không có nghiệm / kỳ 0 ngày / không có tiền).
+    """
+    def npv(x):
+        e = amounts * np.exp(-x[pid] * years)
+        return np.bincount(pid, e, n), np.bincount(pid, -years * e, n)
+
+    lo = np.full(n, -10.0); hi = np.full(n, 10.0)
+    f_lo = npv(lo)[0]
+    ok = np.sign(f_lo) * np.sign(npv(hi)[0]) < 0
+    x = np.zeros(n)
+    for _ in range(max_iter):
+        f, df = npv(x)
+        left = np.sign(f) == np.sign(f_lo)  # Nghiệm nằm bên phải x
+        lo = np.where(left, x, lo); f_lo = np.where(left, f, f_lo); hi = np.where(left, hi, x)
+        with np.errstate(divide='ignore', invalid='ignore'): step = x - f / df
+        bad = ~np.isfinite(step) | (step <= lo) | (step >= hi)
+        new = np.where(bad, 0.5 * (lo + hi), step)
+        done = np.abs(new - x) < tol
+        x = new
+        if done[ok].all(): break
+    return np.where(ok, np.expm1(x), np.nan)
+
+
+def eval_days(days, at='ME'):
+    """Ngày chốt: 'ME' = cuối mỗi tháng + ngày cuối cùng, 'last' = chỉ ngày cuối, hoặc list ngày bất kỳ."""
+    if not len(days): return np.empty(0, 'int64')
+    if isinstance(at, str):
+        if at == 'last': return days[-1:]
+        d = pd.DatetimeIndex(days * NS_PER_DAY)
+        keep = np.asarray(d.is_month_end); keep[-1] = True; keep[0] = False  # Dòng 0 là ngày ảo
+        return days[keep]
+    return np.unique(day_ordinal(pd.to_datetime(pd.Series(at)).to_numpy('datetime64[ns]').view('int64')))
+
+
+def period_returns(histories, at='ME', windows=DEFAULT_WINDOWS, price_store=None, basis='val'):
+    """
+    Bảng TWR / XIRR (%) cho mọi (tài khoản x ngày chốt x kỳ) - 1 lượt NumPy.
+    histories: {tên: PortfolioEngine | DataFrame NAV ngày}. at: xem eval_days. windows: khóa của WINDOWS.
+    price_store (PriceStore): NAV theo giá đóng cửa; None -> NAV theo giá vốn (chỉ phản ánh lãi đã chốt + cổ tức).
+    Kỳ bắt đầu trước ngày mở tài khoản -> tính từ lúc mở. Kỳ không có vốn -> NaN.
+    """
+    st = stack_histories(histories, price_store, basis)
+    days, nav, flow = st['days'], st['nav'], st['flow']
+    ev = eval_days(days, at)
+    ev = ev[(ev > days[0]) & (ev <= days[-1])] if len(days) else ev
+    n_acc = len(st['names'])
+    if not len(ev) or not n_acc: return pd.DataFrame(columns=COLUMNS)
+
+    # Bài toán p = (ngày chốt, kỳ, tài khoản): chỉ số dòng đầu kỳ si / cuối kỳ ei trên lịch chung
+    e_idx = ev - days[0]
+    s_idx = np.concatenate([np.maximum(np.searchsorted(days, window_start(ev, w), 'right') - 1, 0) for w in windows])
+    n_ev, n_win = len(ev), len(windows)
+    ei = np.repeat(np.tile(e_idx, n_win), n_acc)
+    si = np.repeat(s_idx, n_acc)
+    acc = np.tile(np.arange(n_acc), n_ev * n_win)
+    n = len(acc)
+
+    index = twr_index(nav, flow)
+    twr = index[ei, acc] / index[si, acc] - 1.0
+
+    # Nạp/rút trong kỳ (si, ei]: vị trí các ô flow khác 0 theo khóa (tài khoản, ngày) đã sắp -> cắt lát bằng searchsorted
+    fa, fd = np.nonzero(flow.T)
+    key = fa * len(days) + fd
+    lo = np.searchsorted(key, acc * len(days) + si, 'right')
+    cnt = np.searchsorted(key, acc * len(days) + ei, 'right') - lo
+    pid = np.repeat(np.arange(n), cnt)
+    j = np.arange(cnt.sum()) - np.repeat(np.cumsum(cnt) - cnt, cnt) + lo[pid]
+    fk = fd[j]
+    cash_in = flow[fk, fa[j]]
+    net_flow = np.bincount(pid, cash_in, n)
+
+    nav_s = nav[si, acc]; nav_e = nav[ei, acc]
+    # Dòng tiền của nhà đầu tư: NAV đầu kỳ bỏ vào (-), nạp (-) / rút (+), NAV cuối kỳ nhận về (+)
+    r = xirr(np.concatenate([np.arange(n), pid, np.arange(n)]),
+             np.concatenate([np.zeros(n), (fk - si[pid]) / DAYS_PER_YEAR, (ei - si) / DAYS_PER_YEAR]),
+             np.concatenate([-nav_s, -cash_in, nav_e]), n)
+
+    has_capital = (nav_s > MIN_BASE) | (cnt > 0)
+    to_date = lambda idx: pd.to_datetime(days[idx] * NS_PER_DAY)
+    return pd.DataFrame({'Tài khoản': np.asarray(st['names'], dtype=object)[acc], 'Ngày': to_date(ei),
+                         'Kỳ': np.repeat(np.repeat(np.asarray(windows, dtype=object), n_ev), n_acc), 'Từ ngày': to_date(si),
+                         'NAV đầu kỳ': nav_s, 'Nạp/Rút ròng': net_flow, 'NAV cuối kỳ': nav_e,
+                         'TWR (%)': np.where(has_capital, twr * 100, np.nan), 'XIRR (%)': r * 100})
+
+
+if __name__ == "__main__":
+    # Đo thời gian: so với vòng lặp từng tài khoản / từng kỳ (TWR nối chuỗi từng ngày, XIRR chia đôi từng bài toán)
+    # python -m analytics.returns [số tài khoản] [vck|vps file.xlsx]
+    # Kết quả được kiểm tra trong tests/test_returns.py
+    import sys, time
+    n_acc = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    r = np.random.default_rng(7)
+    cal = pd.date_range('2021-01-01', '2025-12-31')
+    books = {}
+    for a in range(n_acc):
+        start = r.integers(0, 900)
+        dep = np.zeros(len(cal)); dep[start] = 1e9
+        k = r.choice(np.arange(start + 1, len(cal)), 12, replace=False); dep[k] = r.normal(0, 2e8, 12)
+        nav = np.zeros(len(cal))
+        for i in range(start, len(cal)): nav[i] = max(nav[i - 1] + dep[i], 0) * (1 + r.normal(3e-4, 0.012))
+        books[f"TK{a:03d}"] = pd.DataFrame({'Ngày': cal[start:], 'Tổng Tài Sản (NAV)': nav[start:], 'Vốn Nạp Ròng': np.cumsum(dep)[start:]})
+
+    t0 = time.time(); got = period_returns(books); t_new = time.time() - t0
+
+    def ref_xirr(flows, t):
+        f = lambda x: sum(c * np.exp(-x * y) for c, y in zip(flows, t))
+        a, b = -10.0, 10.0
+        if np.sign(f(a)) * np.sign(f(b)) >= 0: return np.nan
+        for _ in range(200):
+            m = 0.5 * (a + b)
+            if np.sign(f(m)) == np.sign(f(a)): a = m
+            else: b = m
+        return np.expm1(0.5 * (a + b))
+
+    # Cách cũ: từng tài khoản x từng ngày chốt x từng kỳ (chỉ 5 tài khoản đầu, ước lượng cho toàn bộ)
+    sub = got[got['Tài khoản'].isin(list(books)[:5])]
+    t0 = time.time()
+    for _, row in sub.iterrows():
+        df = books[row['Tài khoản']].set_index('Ngày')
+        win = df.loc[(df.index > row['Từ ngày']) & (df.index <= row['Ngày'])]
+        nav0 = df['Tổng Tài Sản (NAV)'].get(row['Từ ngày'], 0.0)
+        dep0 = df['Vốn Nạp Ròng'].get(row['Từ ngày'], 0.0)
+        growth, prev, prev_dep, flows, t = 1.0, nav0, dep0, [-nav0], [0.0]
+        for d, x in win.iterrows():
+            f = x['Vốn Nạp Ròng'] - prev_dep
+            if prev + f > MIN_BASE: growth *= x['Tổng Tài Sản (NAV)'] / (prev + f)
+            if f: flows.append(-f); t.append((d - row['Từ ngày']).days / DAYS_PER_YEAR)
+            prev, prev_dep = x['Tổng Tài Sản (NAV)'], x['Vốn Nạp Ròng']
+        twr = (growth - 1) * 100 if nav0 > MIN_BASE or len(flows) > 1 else np.nan  # Kỳ chưa có vốn -> NaN
+        flows.append(prev); t.append((row['Ngày'] - row['Từ ngày']).days / DAYS_PER_YEAR)
+        ref_xirr(flows, t)
+    t_old = (time.time() - t0) * len(got) / len(sub)
+    print(f"{n_acc} tài khoản x {got['Ngày'].nunique()} cuối tháng x {len(DEFAULT_WINDOWS)} kỳ = {len(got)} bài toán: "
+          f"vòng lặp ~{t_old:.0f}s (ước lượng), period_returns {t_new:.2f}s")
+
+    if len(sys.argv) > 3:
+        import contextlib, io
+        from processors.adapter_vck import VCKAdapter
+        from processors.adapter_vps import VPSAdapter
+        from processors.engine import PortfolioEngine
+        with contextlib.redirect_stdout(io.StringIO()):
+            events = (VCKAdapter if sys.argv[2] == 'vck' else VPSAdapter)().parse(sys.argv[3])
+        eng = PortfolioEngine(sys.argv[2]); eng.run(events)
+        print(period_returns({sys.argv[2]: eng}, at='last', windows=tuple(WINDOWS)).to_string(index=False))
@@ -0,0 +1,189 @@
+# File: analytics/risk.py
+# Module: Chỉ số rủi ro cuốn chiếu (rolling) trên lịch sử NAV: biến động, Sharpe, Sortino, Beta / tương quan VN-Index, VaR / CVaR, Ulcer
+# - Lợi nhuận ngày lấy từ chỉ số TWR (analytics/returns.py) -> nạp/rút (cả tiền CASH_SNAPSHOT đặt lại) không bị tính là lãi/lỗ.
+# - Ngày giao dịch = thứ 2-6; VN-Index (data_market/vnindex_history.csv) forward-fill lên cùng lịch, ngoài vùng có dữ liệu = NaN.
+# - Mọi cửa sổ tính 1 lần trên ma trận cửa sổ trượt (sliding_window_view, không copy) thay vì rolling().apply từng cửa sổ.
+# - 1 tài khoản hoặc gộp nhiều tài khoản (cộng NAV + dòng tiền). Kết quả cache theo hash lịch sử + tham số.
+
+import hashlib
+import os
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from analytics.returns import stack_histories, twr_index
+from processors.event_time import NS_PER_DAY, day_ordinal
+
+VNINDEX_PATH = os.path.join('data_market', 'vnindex_history.csv')
+TRADING_DAYS = 252
+DEFAULT_WINDOW = 63        # ~3 tháng giao dịch
+CONFIDENCE = 0.95
+MAX_CACHE = 16
+
+# Bộ đếm hiển thị trong khung Debug của app
+STATS = {'hit': 0, 'miss': 0}
+_CACHE = {}
+_BENCH = {}  # đường dẫn -> (mtime, ngày, giá đóng cửa)
+
+COLUMNS = ['Ngày', 'Lợi nhuận ngày (%)', 'VN-Index ngày (%)', 'Biến động năm (%)', 'Sharpe', 'Sortino', 'Beta', 'Tương quan',
+           'VaR lịch sử (%)', 'CVaR lịch sử (%)', 'VaR tham số (%)', 'CVaR tham số (%)', 'Ulcer']
+
+
+def load_benchmark(benchmark=VNINDEX_PATH):
+    """(ngày [số ngày từ 1970], giá đóng cửa) đã sắp của chỉ số tham chiếu. benchmark: đường dẫn CSV (Date, Close) hoặc DataFrame."""
+    empty = (np.empty(0, 'int64'), np.empty(0))
+    if benchmark is None: return empty
+    if isinstance(benchmark, pd.DataFrame): df = benchmark
+    else:
+        try: mtime = os.path.getmtime(benchmark)
+        except OSError: return empty
+        hit = _BENCH.get(benchmark)
+        if hit is not None and hit[0] == mtime: return hit[1:]
+        try: df = pd.read_csv(benchmark)
+        except Exception: return empty
+    if 'Date' not in df.columns or 'Close' not in df.columns: return empty
+    ns = pd.to_datetime(df['Date'], errors='coerce').to_numpy('datetime64[ns]').view('int64')
+    close = pd.to_numeric(df['Close'], errors='coerce').to_numpy('float64')
+    ok = (ns != np.iinfo('int64').min) & (close > 0)
+    days = day_ordinal(ns[ok]); close = close[ok]
+    order = np.argsort(days, kind='stable')
+    out = (days[order], close[order])
+    if not isinstance(benchmark, pd.DataFrame): _BENCH[benchmark] = (mtime, *out)
+    return out
+
+
+def trading_series(days, index, bench_days, bench_close):
+    """Chỉ số TWR + VN-Index trên các ngày thứ 2-6 của lịch tài khoản (giá trị cuối cùng <= từng ngày; VN-Index NaN ngoài vùng dữ liệu)."""
+    wd = days[((days + 3) % 7) < 5]  # 1970-01-01 là thứ 5
+    port = index[wd - days[0]]
+    mkt = np.full(len(wd), np.nan)
+    if len(bench_days):
+        k = np.searchsorted(bench_days, wd, 'right') - 1
+        inside = (k >= 0) & (wd <= bench_days[-1])
+        mkt[inside] = bench_close[k[inside]]
+    return wd, port, mkt
+
+
+def rolling_metrics(port, mkt, window=DEFAULT_WINDOW, rf=0.0, confidence=CONFIDENCE):
+    """
+    Chỉ số rủi ro của mọi cửa sổ `window` ngày giao dịch liên tiếp - dòng i = cửa sổ kết thúc tại lợi nhuận thứ i.
+    port / mkt: chuỗi giá (chỉ số TWR, VN-Index) dài n + 1 -> n lợi nhuận. rf: lãi suất phi rủi ro năm.
+    Trả về dict cột -> mảng dài n (NaN khi chưa đủ cửa sổ). Biến động / VaR / Ulcer theo %.
+    """
+    rp = port[1:] / port[:-1] - 1.0
+    with np.errstate(divide='ignore', invalid='ignore'): rm = mkt[1:] / mkt[:-1] - 1.0
+    n = len(rp)
+    out = {k: np.full(n, np.nan) for k in COLUMNS[3:]}
+    out['Lợi nhuận ngày (%)'] = rp * 100; out['VN-Index ngày (%)'] = rm * 100
+    if n < max(window, 2): return out
+    tail = slice(window - 1, None)
+    ann = np.sqrt(TRADING_DAYS); rf_d = rf / TRADING_DAYS
+
+    w = sliding_window_view(rp, window)  # (n - window + 1) x window, view không copy
+    mu = w.mean(axis=1)
+    dev = w - mu[:, None]
+    sd = np.sqrt((dev ** 2).sum(axis=1) / (window - 1))
+    down = np.sqrt((np.minimum(w - rf_d, 0.0) ** 2).mean(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out['Biến động năm (%)'][tail] = sd * ann * 100
+        out['Sharpe'][tail] = np.where(sd > 0, (mu - rf_d) / sd * ann, np.nan)
+        out['Sortino'][tail] = np.where(down > 0, (mu - rf_d) / down * ann, np.nan)
+
+        # Beta / tương quan: cửa sổ có ngày thiếu VN-Index -> NaN
+        wm = sliding_window_view(rm, window)
+        dm = wm - wm.mean(axis=1)[:, None]
+        cov = (dev * dm).sum(axis=1) / (window - 1)
+        var_m = (dm ** 2).sum(axis=1) / (window - 1)
+        out['Beta'][tail] = np.where(var_m > 0, cov / var_m, np.nan)
+        out['Tương quan'][tail] = np.where((var_m > 0) & (sd > 0), cov / np.sqrt(var_m) / sd, np.nan)
+
+    # VaR / CVaR lịch sử: phân vị (1 - độ tin cậy) và trung bình các ngày lỗ nặng hơn - số dương = mức lỗ
+    q = np.quantile(w, 1 - confidence, axis=1)
+    tail_mask = w <= q[:, None]
+    out['VaR lịch sử (%)'][tail] = -q * 100
+    out['CVaR lịch sử (%)'][tail] = -(w * tail_mask).sum(axis=1) / tail_mask.sum(axis=1) * 100
+    # Tham số (phân phối chuẩn)
+    z = NormalDist().inv_cdf(1 - confidence)
+    out['VaR tham số (%)'][tail] = -(mu + z * sd) * 100
+    out['CVaR tham số (%)'][tail] = -(mu - sd * NormalDist().pdf(z) / (1 - confidence)) * 100
+
+    # Ulcer: căn trung bình bình phương % sụt giảm so với đỉnh trong cửa sổ
+    wp = sliding_window_view(port[1:], window)
+    dd = (wp / np.maximum.accumulate(wp, axis=1) - 1.0) * 100
+    out['Ulcer'][tail] = np.sqrt((dd ** 2).mean(axis=1))
+    return out
+
+
+def history_digest(days, nav, flow):
+    return hashlib.sha256(b''.join(np.ascontiguousarray(a).tobytes() for a in (days, nav, flow))).hexdigest()
+
+
+def risk_frame(histories, window=DEFAULT_WINDOW, benchmark=VNINDEX_PATH, rf=0.0, confidence=CONFIDENCE,
+               price_store=None, basis='val'):
+    """
+    Bảng chỉ số rủi ro cuốn chiếu theo ngày giao dịch (cột COLUMNS).
+    histories: PortfolioEngine / DataFrame NAV ngày của 1 tài khoản, hoặc {tên: ...} nhiều tài khoản -> gộp (cộng NAV + nạp/rút).
+    benchmark: đường dẫn CSV hoặc DataFrame (Date, Close). price_store: NAV theo giá đóng cửa (xem analytics/returns.py).
+    Cache theo hash (lịch sử, VN-Index, tham số) - frame dùng chung, CHỈ ĐỌC.
+    """
+    if not isinstance(histories, dict): histories = {'': histories}
+    st = stack_histories(histories, price_store, basis)
+    days = st['days']
+    if len(days) < 2: return pd.DataFrame(columns=COLUMNS)
+    nav = st['nav'].sum(axis=1, keepdims=True); flow = st['flow'].sum(axis=1, keepdims=True)
+    b_days, b_close = load_benchmark(benchmark)
+
+    key = (history_digest(days, nav, flow), history_digest(b_days, b_close, np.empty(0)), window, rf, confidence)
+    if key in _CACHE:
+        STATS['hit'] += 1
+        return _CACHE[key]
+    STATS['miss'] += 1
+
+    wd, port, mkt = trading_series(days, twr_index(nav, flow)[:, 0], b_days, b_close)
+    if len(wd) < 2: return pd.DataFrame(columns=COLUMNS)
+    cols = rolling_metrics(port, mkt, window, rf, confidence)
+    df = pd.DataFrame({'Ngày': pd.to_datetime(wd[1:] * NS_PER_DAY), **{c: cols[c] for c in COLUMNS[1:]}})
+    while len(_CACHE) >= MAX_CACHE: _CACHE.pop(next(iter(_CACHE)))
+    _CACHE[key] = df
+    return df
+
+
+if __name__ == "__main__":
+    # Đo thời gian: so với pandas rolling / rolling().apply (cách thông thường) trên chuỗi NAV ngẫu nhiên nhiều năm
+    # python -m analytics.risk [số năm] [cửa sổ]
+    # Kết quả được kiểm tra trong tests/test_risk.py
+    import sys, time
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    window = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WINDOW
+    r = np.random.default_rng(11)
+    cal = pd.date_range('2000-01-01', periods=365 * years)
+    m_ret = r.normal(2e-4, 0.011, len(cal))
+    vni = pd.DataFrame({'Date': cal, 'Close': 1000 * np.cumprod(1 + m_ret)})
+    dep = np.zeros(len(cal)); dep[0] = 1e9; dep[r.choice(np.arange(1, len(cal)), 40, replace=False)] = r.normal(0, 1e8, 40)
+    nav = np.zeros(len(cal))
+    p_ret = 1e-4 + 1.2 * m_ret + r.normal(0, 0.006, len(cal))
+    for i in range(len(cal)): nav[i] = ((nav[i - 1] if i else 0) + dep[i]) * (1 + p_ret[i])
+    book = pd.DataFrame({'Ngày': cal, 'Tổng Tài Sản (NAV)': nav, 'Vốn Nạp Ròng': np.cumsum(dep)})
+
+    t0 = time.time(); got = risk_frame(book, window, vni, rf=0.03); t_new = time.time() - t0
+    t0 = time.time(); again = risk_frame(book, window, vni, rf=0.03); t_hit = time.time() - t0
+
+    # Cách cũ: pandas rolling trên chuỗi lợi nhuận ngày giao dịch
+    t0 = time.time()
+    rp = got['Lợi nhuận ngày (%)'] / 100; rm = got['VN-Index ngày (%)'] / 100; rf_d = 0.03 / TRADING_DAYS
+    roll = rp.rolling(window)
+    ref = pd.DataFrame({
+        'Biến động năm (%)': roll.std() * np.sqrt(TRADING_DAYS) * 100,
+        'Sharpe': (roll.mean() - rf_d) / roll.std() * np.sqrt(TRADING_DAYS),
+        'Sortino': (roll.mean() - rf_d) / roll.apply(lambda x: np.sqrt((np.minimum(x - rf_d, 0) ** 2).mean()), raw=True) * np.sqrt(TRADING_DAYS),
+        'Beta': roll.cov(rm) / rm.rolling(window).var(),
+        'Tương quan': roll.corr(rm),
+        'VaR lịch sử (%)': -roll.quantile(1 - CONFIDENCE) * 100,
+        'CVaR lịch sử (%)': -roll.apply(lambda x: x[x <= np.quantile(x, 1 - CONFIDENCE)].mean(), raw=True) * 100,
+        'Ulcer': (1 + rp).cumprod().rolling(window).apply(lambda p: np.sqrt((((p / np.maximum.accumulate(p) - 1) * 100) ** 2).mean()), raw=True),
+    })
+    t_old = time.time() - t0
+    print(f"{len(got)} ngày giao dịch, cửa sổ {window}: pandas rolling/apply {t_old:.2f}s, "
+          f"risk_frame {t_new * 1000:.0f}ms (cache {t_hit * 1000:.1f}ms)")
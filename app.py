@@ -10,8 +10,11 @@ try:
     from processors.adapter_vck import VCKAdapter
     from processors.vck_patch import VCKPatch
     from processors.adapter_vps import VPSAdapter
+    from processors.parse_cache import cache_info
+    from processors.ingestion import account_spec, ingest_accounts
     from processors.engine import PortfolioEngine
     from processors.live_price import get_current_price_dict
+    from processors.price_store import PriceStore
     from utils.formatters import fmt_vnd, fmt_num, fmt_pct, fmt_float
     from analytics.performance import calculate_kpi
     from processors.ipo_merger import merge_ipo_events
@@ -103,41 +106,31 @@ if btn_run:
         # LUỒNG A: HỆ THỐNG CŨ (LEGACY) - GIỮ NGUYÊN KHÔNG PATCH
         # ==================================================================
         
+        # Parse -> Gộp IPO -> Engine -> Vá cổ tức: mỗi tài khoản 1 process (processors/ingestion.py)
+        accounts = []
+        if file_vck: accounts.append(account_spec("VCK", "VCK", file_vck))
+        if file_vps: accounts.append(account_spec("VPS", "VPS", file_vps))
+        results = {r['name']: r for r in ingest_accounts(accounts)}
+
         # Xử lý VCK
-        if file_vck:
-            try:
-                # 1. Parse dữ liệu (Adapter cũ)
-                raw_events = VCKAdapter().parse(file_vck)
-                raw_events_vck_for_compass = raw_events # Lưu lại bản gốc cho La Bàn dùng sau
-                
-                # --- [REVERT] BỎ ĐOẠN PATCH Ở ĐÂY ĐỂ TRÁNH ẢNH HƯỞNG BÁO CÁO CŨ ---
-                # (Không gọi VCKPatch ở đây nữa)
-                
-                # 2. Chạy qua bộ xử lý IPO (Dùng raw_events gốc)
-                events = merge_ipo_events(raw_events) 
-                
-                # 3. Chạy Engine Chính (Dùng hàm run để kích hoạt Snapshot Authority)
-                engine_vck.run(events)
-                
-                # 4. Patch cổ tức (Giữ nguyên)
-                patch_dividend_fix.apply_dividend_patch(engine_vck, file_vck)
-                
-                list_vck = events 
-                all_events.extend(events) 
-            except Exception as e: st.error(f"Lỗi đọc file VCK: {e}")
+        if "VCK" in results:
+            res = results["VCK"]
+            engine_vck = res['engine']
+            raw_events_vck_for_compass = res['raw_events'] # Lưu lại bản gốc cho La Bàn dùng sau
+            if res['error']: st.error(f"Lỗi đọc file VCK: {res['error']}")
+            else:
+                list_vck = res['events']
+                all_events.extend(res['events'])
             
         # Xử lý VPS
-        if file_vps:
-            try:
-                events = VPSAdapter().parse(file_vps)
-                raw_events_vps_for_compass = events # Lưu lại cho La Bàn
-                
-                engine_vps.run(events)
-                patch_dividend_fix.apply_dividend_patch(engine_vps, file_vps)
-                
-                list_vps = events 
-                all_events.extend(events) 
-            except Exception as e: st.error(f"Lỗi đọc file VPS: {e}")
+        if "VPS" in results:
+            res = results["VPS"]
+            engine_vps = res['engine']
+            raw_events_vps_for_compass = res['raw_events'] # Lưu lại cho La Bàn
+            if res['error']: st.error(f"Lỗi đọc file VPS: {res['error']}")
+            else:
+                list_vps = res['events']
+                all_events.extend(res['events'])
 
         # Lưu Session State cho Báo cáo cũ
         st.session_state.engine_vck = engine_vck
@@ -195,6 +188,8 @@ if st.session_state.data_processed:
             st.success(f"✅ Đã lấy được giá của {len(live_prices)} mã.")
             st.json(live_prices)
         else: st.warning("⚠️ Chưa lấy được giá hoặc thị trường đang đóng cửa.")
+        pc = cache_info()
+        st.caption(f"🗂️ Cache parse ({pc['format']}): {pc['hit']} hit / {pc['miss']} miss (nạp tăng dần: {pc['incremental']}, toàn bộ: {pc['full']}) | {pc['files']} file, {pc['mb']:.1f} MB")
 
     import re # Đảm bảo đã import re ở đầu file hoặc trong hàm
 
@@ -270,8 +265,10 @@ if st.session_state.data_processed:
     # ======================================================================
 
     # 5. History Machine (ĐỒNG BỘ HÓA DỮ LIỆU)
-    df_history_vck = engine_vck.get_nav_chart_data()
-    df_history_vps = engine_vps.get_nav_chart_data()
+    # NAV theo giá đóng cửa trong cache data_market/prices (offline). Chưa có cache -> theo giá vốn như cũ
+    price_store = PriceStore()
+    df_history_vck = engine_vck.get_nav_chart_data(price_store)
+    df_history_vps = engine_vps.get_nav_chart_data(price_store)
     
     df_vck_ready = pd.DataFrame()
     if df_history_vck is not None and not df_history_vck.empty:
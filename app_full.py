@@ -123,7 +123,7 @@ if btn_run:
             else: st.success("Danh mục an toàn.")
         with t5:
             if engine.trade_log:
-                df_log = pd.DataFrame(engine.trade_log)
+                df_log = engine.trade_log_frame().copy(deep=False)  # Frame dùng chung -> sửa cột Ngày trên bản sao nông
                 if 'Ngày' in df_log.columns: df_log['Ngày'] = pd.to_datetime(df_log['Ngày']).dt.strftime('%d/%m/%Y')
                 all_syms = sorted(df_log['Mã'].unique())
                 sel = st.selectbox(f"Lọc theo Mã ({title}):", ['Tất cả'] + all_syms, key=f"s_{title}")
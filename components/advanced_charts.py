@@ -4,6 +4,7 @@ import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 import streamlit as st
+from processors.trade_log import as_frame
 
 # --- HÀM TIỆN ÍCH TÌM CỘT THÔNG MINH ---
 def find_col(df, candidates):
@@ -41,7 +42,7 @@ def draw_pnl_heatmap(trade_log):
     """
     if not trade_log: return None
     try:
-        df = pd.DataFrame(trade_log)
+        df = as_frame(trade_log)  # Bản sao nông của frame dùng chung trong Engine
         
         # Tìm cột (Khớp với trade_log trong engine.py)
         date_col = find_col(df, ['Ngày', 'date', 'time'])
@@ -2,6 +2,7 @@
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
+from processors.trade_log import as_frame
 
 def _find_col(df, candidates):
     """Tìm tên cột bất kể hoa thường (Copy local để file độc lập)."""
@@ -21,7 +22,7 @@ def plot(trade_log):
     """
     if not trade_log: return None
     try:
-        df = pd.DataFrame(trade_log)
+        df = as_frame(trade_log)  # Bản sao nông của frame dùng chung trong Engine
         
         # 1. Tìm cột
         date_col = _find_col(df, ['Ngày', 'date', 'time'])
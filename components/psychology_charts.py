@@ -6,6 +6,7 @@ import plotly.graph_objects as go
 import pandas as pd
 import streamlit as st
 from datetime import datetime
+from processors.trade_log import as_frame
 
 # ==============================================================================
 # PHẦN 0: HÀM TIỆN ÍCH (UTILITIES)
@@ -31,7 +32,7 @@ def find_col(df, candidates):
 def draw_trading_timeline(trade_log):
     if not trade_log: return None
     try:
-        df = pd.DataFrame(trade_log)
+        df = as_frame(trade_log)  # Bản sao nông của frame dùng chung trong Engine
         
         # 1. Tìm cột Ngày
         date_col = find_col(df, ['Ngày', 'date', 'Date', 'time'])
@@ -240,7 +241,7 @@ def draw_efficiency_vs_intensity(trade_log, closed_cycles):
         monthly_pnl.rename(columns={pnl_key: 'Monthly_PnL'}, inplace=True)
 
         # 2. Trade Log DF
-        df_log = pd.DataFrame(trade_log)
+        df_log = as_frame(trade_log)
         date_key = find_col(df_log, ['date', 'Ngày'])
         if not date_key: return None
         
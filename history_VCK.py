@@ -6,6 +6,7 @@ import io
 from datetime import datetime
 import plotly.express as px
 import plotly.graph_objects as go
+from processors.workbook import load_workbook
 
 # --- CẤU HÌNH TRANG WEB ---
 st.set_page_config(
@@ -191,23 +192,23 @@ def process_uploaded_file(uploaded_file):
     total_deposit = 0.0 
 
     try:
-        xls = pd.ExcelFile(uploaded_file)
-        sheet_names = [s.lower() for s in xls.sheet_names]
+        wb = load_workbook(uploaded_file)  # Backend đọc XLSX nhanh nhất đang có (processors/workbook.py)
+        sheet_names = [s.lower() for s in wb.sheet_names]
         
-        sh_ck_real = next((xls.sheet_names[i] for i, s in enumerate(sheet_names) if ('ck' in s or 'khớp' in s or 'lệnh' in s) and 'tiền' not in s), None)
-        sh_tien_real = next((xls.sheet_names[i] for i, s in enumerate(sheet_names) if ('tiền' in s or 'cash' in s)), None)
+        sh_ck_real = next((wb.sheet_names[i] for i, s in enumerate(sheet_names) if ('ck' in s or 'khớp' in s or 'lệnh' in s) and 'tiền' not in s), None)
+        sh_tien_real = next((wb.sheet_names[i] for i, s in enumerate(sheet_names) if ('tiền' in s or 'cash' in s)), None)
 
         if not sh_ck_real or not sh_tien_real:
-            if len(xls.sheet_names) >= 2: sh_tien_real, sh_ck_real = xls.sheet_names[0], xls.sheet_names[1]
+            if len(wb.sheet_names) >= 2: sh_tien_real, sh_ck_real = wb.sheet_names[0], wb.sheet_names[1]
             else: return None, None, "Không tìm thấy sheet Lệnh/Tiền hợp lệ."
 
-        raw_ck = pd.read_excel(xls, sheet_name=sh_ck_real, header=None, nrows=20)
+        raw_ck = wb.read(sh_ck_real, header=None, nrows=20)
         idx_ck = find_header_index(raw_ck, ['mã ck', 'phát sinh', 'nội dung'])
-        df_ck = pd.read_excel(xls, sheet_name=sh_ck_real, header=idx_ck)
+        df_ck = wb.read(sh_ck_real, header=idx_ck)
         
-        raw_tien = pd.read_excel(xls, sheet_name=sh_tien_real, header=None, nrows=20)
+        raw_tien = wb.read(sh_tien_real, header=None, nrows=20)
         idx_tien = find_header_index(raw_tien, ['ngày', 'số dư', 'phát sinh'])
-        df_tien = pd.read_excel(xls, sheet_name=sh_tien_real, header=idx_tien)
+        df_tien = wb.read(sh_tien_real, header=idx_tien)
 
         df_ck.columns = [str(c).strip().lower() for c in df_ck.columns]
         df_tien.columns = [str(c).strip().lower() for c in df_tien.columns]
@@ -5,6 +5,7 @@ import streamlit as st
 import plotly.express as px
 import pandas as pd
 from modules.benchmarking.intelligence import MarketIntelligence
+from processors.price_store import PriceStore
 from modules.benchmarking.loader import create_compass_engine # Import Factory
 
 def render_benchmark_tab(vck_data_tuple, vps_events, live_prices):
@@ -93,6 +94,39 @@ def render_benchmark_tab(vck_data_tuple, vps_events, live_prices):
     else:
         st.success(f"🎉 **Kết luận:** {view_mode} đang **THẮNG** thị trường {alpha:.2f}%.")
 
+    # 4b. LỢI NHUẬN THEO KỲ (TWR / XIRR) - Không bị méo khi nạp/rút nhiều lần như ROI ở trên
+    price_store = PriceStore()
+    df_ret = brain.calculate_returns(engine, price_store)
+    if df_ret is not None and not df_ret.empty:
+        st.markdown("#### ⏱️ Lợi nhuận theo kỳ (TWR / XIRR)")
+        st.caption("TWR: hiệu quả đầu tư thuần, loại bỏ ảnh hưởng của nạp/rút. XIRR: lãi suất năm thực nhận trên dòng tiền nạp/rút. "
+                   "Mã đã có giá trong cache định giá theo giá đóng cửa, còn lại theo giá vốn.")
+        st.dataframe(
+            df_ret[['Kỳ', 'Từ ngày', 'NAV đầu kỳ', 'Nạp/Rút ròng', 'NAV cuối kỳ', 'TWR (%)', 'XIRR (%)']].style.format({
+                'Từ ngày': "{:%d/%m/%Y}", 'NAV đầu kỳ': "{:,.0f}", 'Nạp/Rút ròng': "{:,.0f}", 'NAV cuối kỳ': "{:,.0f}",
+                'TWR (%)': "{:.2f}%", 'XIRR (%)': "{:.2f}%"
+            }, na_rep="-"),
+            use_container_width=True,
+            hide_index=True
+        )
+
+    # 4c. RỦI RO CUỐN CHIẾU (cửa sổ ~3 tháng giao dịch, so với VN-Index)
+    df_risk = brain.calculate_risk(engine, price_store)
+    if df_risk is not None and df_risk['Biến động năm (%)'].notna().any():
+        last = df_risk.dropna(subset=['Biến động năm (%)']).iloc[-1]
+        fmt = lambda v, spec: "-" if pd.isna(v) else format(v, spec)
+        st.markdown(f"#### 🛡️ Rủi ro (cửa sổ 3 tháng giao dịch, tới {last['Ngày']:%d/%m/%Y})")
+        r1, r2, r3, r4, r5, r6 = st.columns(6)
+        r1.metric("Biến động năm", fmt(last['Biến động năm (%)'], '.2f') + "%")
+        r2.metric("Sharpe", fmt(last['Sharpe'], '.2f'))
+        r3.metric("Sortino", fmt(last['Sortino'], '.2f'))
+        r4.metric("Beta (VN-Index)", fmt(last['Beta'], '.2f'), help=f"Tương quan: {fmt(last['Tương quan'], '.2f')}")
+        r5.metric("VaR 95% / ngày", fmt(last['VaR lịch sử (%)'], '.2f') + "%",
+                  help=f"CVaR: {fmt(last['CVaR lịch sử (%)'], '.2f')}% | Tham số: VaR {fmt(last['VaR tham số (%)'], '.2f')}%, CVaR {fmt(last['CVaR tham số (%)'], '.2f')}%")
+        r6.metric("Ulcer", fmt(last['Ulcer'], '.2f'), help="Căn trung bình bình phương % sụt giảm so với đỉnh trong cửa sổ.")
+        fig_risk = px.line(df_risk, x='Ngày', y=['Biến động năm (%)', 'VaR lịch sử (%)', 'Ulcer'], title="Rủi ro cuốn chiếu theo thời gian")
+        st.plotly_chart(fig_risk, use_container_width=True)
+
     st.divider()
 
     # 5. HIỂN THỊ PHÂN BỔ NGÀNH (Sector Allocation)
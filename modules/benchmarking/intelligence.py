@@ -5,6 +5,8 @@ import pandas as pd
 import os
 import json
 from datetime import datetime
+from analytics.returns import period_returns
+from analytics.risk import DEFAULT_WINDOW, risk_frame
 
 class MarketIntelligence:
     def __init__(self):
@@ -141,6 +143,30 @@ class MarketIntelligence:
             'net_deposit': net_deposit
         }
 
+    def calculate_returns(self, engine_obj, price_store=None, windows=('1M', '3M', 'YTD', '1Y', 'ALL')):
+        """
+        TWR / XIRR (%) các kỳ tính tới ngày cuối của lịch sử NAV Engine (analytics/returns.py).
+        Khác ROI ở calculate_alpha: không bị méo khi nạp/rút nhiều lần. None nếu Engine không có lịch sử NAV.
+        """
+        if not hasattr(engine_obj, 'get_nav_chart_data'): return None
+        try:
+            return period_returns({getattr(engine_obj, 'source_name', ''): engine_obj}, at='last', windows=windows, price_store=price_store)
+        except Exception as e:
+            print(f"Lỗi tính TWR/XIRR: {e}")
+            return None
+
+    def calculate_risk(self, engine_obj, price_store=None, window=DEFAULT_WINDOW, rf=0.0):
+        """
+        Chỉ số rủi ro cuốn chiếu (biến động, Sharpe, Sortino, Beta/tương quan VN-Index, VaR/CVaR, Ulcer) theo ngày giao dịch
+        từ lịch sử NAV Engine (analytics/risk.py, cache theo hash lịch sử). None nếu Engine không có lịch sử NAV.
+        """
+        if not hasattr(engine_obj, 'get_nav_chart_data'): return None
+        try:
+            return risk_frame(engine_obj, window, self.vnindex_df if not self.vnindex_df.empty else None, rf, price_store=price_store)
+        except Exception as e:
+            print(f"Lỗi tính chỉ số rủi ro: {e}")
+            return None
+
     def calculate_sector_allocation(self, engine_obj, live_prices):
         data = self._extract_data_from_engine(engine_obj)
         sector_values = {}
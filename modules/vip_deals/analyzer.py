@@ -1,4 +1,5 @@
 import pandas as pd
+from processors.trade_log import as_frame
 
 def analyze_cost_advantage(engine):
     """
@@ -8,7 +9,7 @@ def analyze_cost_advantage(engine):
     if not engine or not hasattr(engine, 'trade_log') or not engine.trade_log:
         return pd.DataFrame()
 
-    df = pd.DataFrame(engine.trade_log)
+    df = as_frame(engine.trade_log)  # Bản sao nông của frame dùng chung trong Engine
     df.columns = [str(c).lower().strip() for c in df.columns]
 
     # Map cột
@@ -42,7 +43,7 @@ def analyze_cost_advantage(engine):
         return 'Trading'
 
     if 'source' in df_buy.columns:
-        df_buy['Category'] = df_buy['source'].apply(classify_source)
+        df_buy['Category'] = df_buy['source'].astype(str).apply(classify_source)  # 'source' dạng category
     else:
         df_buy['Category'] = 'Trading'
 
@@ -69,7 +70,7 @@ def analyze_cashflow_sankey(engine):
     cash_balance = getattr(engine, 'real_cash_balance', 0)
     
     if not engine.trade_log: return {}
-    df = pd.DataFrame(engine.trade_log)
+    df = as_frame(engine.trade_log)
     df.columns = [str(c).lower().strip() for c in df.columns]
     
     col_map = {'loại': 'type', 'nguồn': 'source', 'sl': 'qty', 'giá vốn': 'price_unit'}
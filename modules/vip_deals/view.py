@@ -25,15 +25,16 @@ def render_performance_attribution(engine, live_prices):
     total_trader_profit = 0
     total_trader_cost = 0
 
-    # Lấy dữ liệu từ Engine
+    # Lấy dữ liệu từ Engine (fifo_queues dựng lại toàn bộ kho mỗi lần gọi -> lấy 1 lần ngoài vòng lặp)
+    queues = engine.fifo_queues if hasattr(engine, 'fifo_queues') else {}
     for ticker, holding in engine.data.items():
         # Lấy giá thị trường (đã bỏ đuôi WFT)
         clean_ticker = ticker.replace('_WFT', '')
         current_price = live_prices.get(clean_ticker, 0)
         
         # Lấy danh sách các lô lẻ (FIFO queues)
-        if hasattr(engine, 'fifo_queues') and ticker in engine.fifo_queues:
-            batches = engine.fifo_queues[ticker]
+        if ticker in queues:
+            batches = queues[ticker]
             
             for batch in batches:
                 # [SỬA LỖI QUAN TRỌNG TẠI ĐÂY]
@@ -22,7 +22,9 @@ def calculate_rebalancing(engine, live_prices, targets):
     if hasattr(engine, 'data'):
         for ticker, info in engine.data.items():
             qty = 0
-            if 'inventory' in info:
+            if 'open' in info:
+                qty = info['open']['vol'] # Tổng tồn kho chạy của Engine
+            elif 'inventory' in info:
                 qty = sum(item['vol'] for item in info['inventory'])
             elif 'stats' in info:
                 qty = info['stats'].get('curr_vol', 0)
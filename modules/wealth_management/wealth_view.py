@@ -4,10 +4,10 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
-import copy
 import re
 from datetime import datetime
 from modules.wealth_management.rebalancing import calculate_rebalancing
+from processors.batch_engine import BatchEngine
 
 # ==============================================================================
 # 1. HELPER FUNCTIONS
@@ -45,7 +45,11 @@ def run_vps_logic(engine):
     if not engine or not hasattr(engine, 'trade_log'): return []
 
     all_logs = []
-    if hasattr(engine, 'trade_log'): all_logs.extend(engine.trade_log)
+    if hasattr(engine, 'trade_log_frame'):
+        # Dòng nhật ký chỉ có khoản tiền (find_money_vps) khi Lãi/Lỗ > 0 -> lọc trước trên frame dùng chung, chỉ dựng dict cho các dòng đó
+        df_log = engine.trade_log_frame()
+        all_logs.extend(engine.trade_log[i] for i in (df_log['Lãi/Lỗ'] > 0).to_numpy().nonzero()[0])
+    elif hasattr(engine, 'trade_log'): all_logs.extend(engine.trade_log)
     if hasattr(engine, 'dividends'): all_logs.extend(engine.dividends)
     if hasattr(engine, 'cash_logs'): all_logs.extend(engine.cash_logs)
 
@@ -136,28 +140,8 @@ def run_vck_logic(raw_list):
 # 3. LOGIC QUẢN LÝ TÀI SẢN (NAV & STRESS TEST)
 # ==============================================================================
 def create_merged_engine(engine_vck, engine_vps):
-    class CombinedEngine:
-        def __init__(self): self.data = {}; self.real_cash_balance = 0; self.total_deposit = 0
-    merged = CombinedEngine()
-    cash_vck = getattr(engine_vck, 'real_cash_balance', 0) if engine_vck else 0
-    cash_vps = getattr(engine_vps, 'real_cash_balance', 0) if engine_vps else 0
-    merged.real_cash_balance = cash_vck + cash_vps
-    
-    def merge_data(src):
-        if not src or not hasattr(src, 'data'): return
-        for k, v in src.data.items():
-            tik = str(k).strip().upper()
-            if tik not in merged.data: merged.data[tik] = copy.deepcopy(v)
-            else:
-                if 'inventory' in v:
-                    if 'inventory' not in merged.data[tik]: merged.data[tik]['inventory'] = []
-                    merged.data[tik]['inventory'].extend(copy.deepcopy(v['inventory']))
-                qty = 0; s = v.get('stats', {})
-                if s: qty = s.get('curr_vol', 0)
-                if 'stats' not in merged.data[tik]: merged.data[tik]['stats'] = {'curr_vol': 0}
-                merged.data[tik]['stats']['curr_vol'] = merged.data[tik]['stats'].get('curr_vol', 0) + qty
-    merge_data(engine_vck); merge_data(engine_vps)
-    return merged
+    # Cộng dồn tổng tồn kho chạy của 2 tài khoản (không deepcopy sổ lô)
+    return BatchEngine.from_engines({'VCK': engine_vck, 'VPS': engine_vps}).merged_engine()
 
 def get_portfolio_snapshot(engine, live_prices):
     """Tính toán NAV hiện tại"""
@@ -170,7 +154,8 @@ def get_portfolio_snapshot(engine, live_prices):
     if hasattr(engine, 'data'):
         for k, v in engine.data.items():
             qty = 0
-            if 'inventory' in v: qty = sum(i['vol'] for i in v['inventory'])
+            if 'open' in v: qty = v['open']['vol']
+            elif 'inventory' in v: qty = sum(i['vol'] for i in v['inventory'])
             elif 'stats' in v: qty = v['stats'].get('curr_vol', 0)
             
             if qty > 0:
@@ -7,6 +7,7 @@
 import pandas as pd
 import re
 from datetime import datetime
+from processors.workbook import load_workbook
 
 def extract_dividend_info(content):
     """
@@ -42,19 +43,16 @@ def apply_dividend_patch(portfolio_engine, file_object):
     
     try:
         # 1. ĐỌC DỮ LIỆU
-        file_object.seek(0)
-        xls = pd.ExcelFile(file_object)
-        sheet_map = {s.lower(): s for s in xls.sheet_names}
-        sh_tien = next((sheet_map[s] for s in sheet_map if 'tiền' in s or 'cash' in s), None)
+        # Dùng lại Workbook Adapter đã parse (không decode lại file XLSX)
+        wb = load_workbook(file_object)
+        sh_tien = wb.find_sheet('tiền', 'cash')
         
         if not sh_tien:
             print("⚠️ Không tìm thấy Sheet Tiền.")
             return
 
-        df_cash = pd.read_excel(xls, sheet_name=sh_tien)
-        
-        # Tìm cột
-        df_cash.columns = [str(c).lower().strip() for c in df_cash.columns]
+        # Tìm cột (sheet() đã chuẩn hóa tên cột: chữ thường + strip)
+        df_cash = wb.sheet(sh_tien)
         col_content = next((c for c in df_cash.columns if 'nội dung' in c or 'content' in c), None)
         col_symbol = next((c for c in df_cash.columns if 'mã' in c or 'symbol' in c), None)
 
@@ -130,18 +128,11 @@ def apply_dividend_patch(portfolio_engine, file_object):
                         # B. [MỚI] HẠ GIÁ VỐN TRONG KHO (INVENTORY) - QUAN TRỌNG CHO VỐN HỢP LÝ
                         # Chỉ áp dụng nếu đây là Cycle đang hoạt động (Active)
                         if cycle.get('_is_active'):
-                            inventory = data.get('inventory', [])
-                            for batch in inventory:
-                                # Logic: Lô hàng này phải được mua TRƯỚC ngày GDKHQ mới được trừ giá vốn
-                                if batch['date'].date() <= d_date:
-                                    # Trừ giá vốn điều chỉnh (adj_cost)
-                                    # Lưu ý: Mỗi lần chạy script là chạy mới từ đầu, nên trừ thẳng tay
-                                    # Tuy nhiên để tránh trừ nhiều lần nếu có nhiều event trùng, ta cần cẩn thận.
-                                    # Ở đây Engine reset mỗi lần chạy -> An toàn.
-                                    
-                                    # Debug
-                                    # print(f"   📉 Giảm giá vốn {symbol}: {div_event['rate_val']}đ cho lô {batch['date'].date()}")
-                                    batch['adj_cost'] -= div_event['rate_val']
+                            # Logic: Lô hàng phải được mua TRƯỚC ngày GDKHQ mới được trừ giá vốn
+                            # Lưu ý: Mỗi lần chạy script là chạy mới từ đầu, nên trừ thẳng tay
+                            # Ở đây Engine reset mỗi lần chạy -> An toàn.
+                            # Đi qua Engine: cộng dồn div_acc thay vì trừ từng lô, tổng Vốn Hợp Lý (state['open']) cập nhật theo
+                            portfolio_engine.adjust_inventory_cost(symbol, div_event['rate_val'], until=d_date)
 
                 if is_cycle_patched:
                     status = "ĐANG GIỮ" if cycle.get('_is_active') else "ĐÃ CHỐT"
@@ -2,15 +2,22 @@
 # Version: ROBUST VCK ADAPTER (FIX DISAPPEARING ISSUE)
 
 import pandas as pd
+import numpy as np
 import re
 import unicodedata
 from datetime import datetime
-from collections import defaultdict
+from collections import Counter, defaultdict
+from processors.workbook import load_workbook
 
 class VCKAdapter:
-    def __init__(self):
+    # Phiên bản logic parse: tăng khi đổi cách phân loại -> cache trên đĩa tự vô hiệu
+    VERSION = 'VCK-ROBUST-2'
+
+    def __init__(self, columnar=True):
         self.ipo_accumulator = defaultdict(float)
         self.unit_cost_cache = defaultdict(float)
+        # columnar=True: xử lý cả cột bằng pandas (nhanh), False: iterrows từng dòng (cũ)
+        self.columnar = columnar
 
     # --- HELPERS ---
     def normalize_str(self, s):
@@ -31,36 +38,48 @@ class VCKAdapter:
         except: return 0.0
 
     def parse(self, file_path):
+        self.ipo_accumulator = defaultdict(float)
+        self.unit_cost_cache = defaultdict(float)
+
+        # Load file (Workbook dùng chung theo hash -> mỗi sheet chỉ decode 1 lần)
+        try: wb = load_workbook(file_path)
+        except Exception as e:
+            print(f"❌ Lỗi Adapter VCK: {e}")
+            return []
+
+        sh_tien, sh_ck = self._find_sheets(wb)
+
+        if self.columnar:
+            try: return self._parse_columnar(wb, sh_tien, sh_ck)
+            except Exception as e:
+                # Chế độ cột lỗi (file lạ) -> quay về đọc từng dòng như cũ
+                print(f"⚠️ VCK columnar lỗi ({e}) -> chuyển sang đọc từng dòng")
+                self.ipo_accumulator = defaultdict(float)
+                self.unit_cost_cache = defaultdict(float)
+        return self._parse_rows(wb, sh_tien, sh_ck)
+
+    def _find_sheets(self, wb):
+        if wb.is_csv: return 'sheet1', None
+        # Tìm sheet CK linh hoạt hơn
+        sh_ck = wb.find_sheet('ck', 'khớp', 'lệnh', 'stock', exclude=('tiền',))
+        sh_tien = wb.find_sheet('tiền', 'cash')
+        return sh_tien, sh_ck
+
+    def _parse_rows(self, wb, sh_tien, sh_ck):
+        """Chế độ cũ: duyệt iterrows từng dòng (giữ làm chuẩn đối chiếu)."""
         trades = [] 
         deposits = []
         dividends = []
         fee_pool = [] 
         balance_history = [] 
-        
-        self.ipo_accumulator = defaultdict(float)
-        self.unit_cost_cache = defaultdict(float)
+        trade_keys = Counter() # Multiset (ngày, số tiền) của trades -> kiểm tra trùng O(1)
 
         try:
-            # Load file
-            if str(file_path).endswith('.csv'):
-                try: df_raw_all = pd.read_csv(file_path); xls = None
-                except: return []
-            else:
-                xls = pd.ExcelFile(file_path)
-
-            if xls:
-                sheet_map = {s.lower(): s for s in xls.sheet_names}
-                # Tìm sheet CK linh hoạt hơn
-                sh_ck = next((sheet_map[s] for s in sheet_map if ('ck' in s or 'khớp' in s or 'lệnh' in s or 'stock' in s) and 'tiền' not in s), None)
-                sh_tien = next((sheet_map[s] for s in sheet_map if ('tiền' in s or 'cash' in s)), None)
-            else:
-                sh_tien = 'sheet1'; sh_ck = None
-
             # =================================================================
             # VÒNG 1: LEARNING (Sheet Tiền)
             # =================================================================
             if sh_tien:
-                df_t = self._read_sheet(xls, file_path, sh_tien)
+                df_t = self._read_sheet(wb, sh_tien)
                 if df_t is not None:
                     c_nd, c_giam, _, _, _ = self._map_columns_tien(df_t)
                     if c_nd:
@@ -76,7 +95,7 @@ class VCKAdapter:
 
             # 1.2 Learning (Sheet CK) - Cache giá vốn
             if sh_ck:
-                df_ck = self._read_sheet(xls, file_path, sh_ck)
+                df_ck = self._read_sheet(wb, sh_ck)
                 if df_ck is not None:
                     c_ma, c_status, _, c_tang, _, _, _ = self._map_columns_ck(df_ck)
                     if c_ma:
@@ -97,7 +116,7 @@ class VCKAdapter:
             
             # 2.1 Sheet Tiền
             if sh_tien:
-                df_t = self._read_sheet(xls, file_path, sh_tien)
+                df_t = self._read_sheet(wb, sh_tien)
                 if df_t is not None:
                     c_nd, c_giam, c_tang, c_date, c_bal = self._map_columns_tien(df_t)
                     if c_nd:
@@ -119,8 +138,9 @@ class VCKAdapter:
                                     ticker = self._extract_ticker_regex(content_norm)
                                     if ticker:
                                         trades.append({'date': d_obj, 'type': 'IPO_DEPOSIT', 'ticker': ticker + "_PENDING", 'qty': 0, 'price': 0, 'value': val_giam, 'source': 'VCK_IPO_CASH'})
+                                        trade_keys[(d_obj, val_giam)] += 1
                                 
-                                if not any(t['value'] == val_giam and t['date'] == d_obj for t in trades):
+                                if not trade_keys[(d_obj, val_giam)]:
                                     if any(k in content_norm for k in ['phi', 'thue', 'tax', 'fee']):
                                         fee_pool.append({'date': d_obj, 'type': 'PHI_THUE', 'value': val_giam, 'source': 'VCK_FEE'})
                                     elif any(k in content_norm for k in ['rut', 'chuyen']) and not ('mua' in content_norm):
@@ -171,7 +191,7 @@ class VCKAdapter:
 
             # 2.2 Sheet CK (Quan trọng nhất)
             if sh_ck:
-                df_ck = self._read_sheet(xls, file_path, sh_ck)
+                df_ck = self._read_sheet(wb, sh_ck)
                 if df_ck is not None:
                     c_ma, c_status, c_nd, c_tang, c_giam, c_date, _ = self._map_columns_ck(df_ck)
                     if c_ma:
@@ -258,20 +278,300 @@ class VCKAdapter:
             cash_event = [{'date': datetime.now(), 'type': 'CASH_SNAPSHOT', 'val': balance_history[0]['val'], 'source': 'VCK_LEDGER'}]
 
         all_events = trades + deposits + dividends + cash_event + fee_pool
-        df_events = pd.DataFrame(all_events)
+        return self._sort_events(pd.DataFrame(all_events))
+
+    def _sort_events(self, df_events):
         if not df_events.empty:
             type_prio = {'NAP_TIEN': 1, 'DEPOSIT': 1, 'IPO_DEPOSIT': 1, 'BUY': 2, 'MUA': 2, 'SELL': 3, 'PHI_THUE': 4, 'CASH_SNAPSHOT': 99}
             df_events['prio'] = df_events['type'].map(type_prio).fillna(50)
             return df_events.sort_values(by=['date', 'prio']).to_dict('records')
         return []
 
+    # =================================================================
+    # CHẾ ĐỘ CỘT (COLUMNAR): Cùng logic với _parse_rows nhưng xử lý cả cột
+    # bằng pandas (str.* / str.extract / mask) thay vì iterrows.
+    # =================================================================
+    KW_IPO = ['thanh toan', 'ipo', 'dat coc', 'phat hanh', 'quyen mua', 'nop tien']
+    KW_FEE = ['phi', 'thue', 'tax', 'fee']
+    KW_HUNTER = ['thuong', 'co tuc', 'phat hanh', 'quyen mua', 'dividend', 'bonus', 'rights', 'ipo']
+    DIV_BLACKLIST = ['usd', 'nam', 'thue', 'phi', 'ban', 'mua', 'tuc', 'lai', 'gia', 'khi', 'cho', 'the',
+                     'gui', 'nhan', 'tien', 'dot', 'quy', 'luu', 'tra', 'cac', 'von', 'san', 'len']
+
+    EVENT_GROUPS = ('trades', 'deposits', 'dividends', 'balance', 'fee_pool')
+
+    def _parse_columnar(self, wb, sh_tien, sh_ck):
+        return self._run_columnar(wb, sh_tien, sh_ck)[0]
+
+    def _run_columnar(self, wb, sh_tien, sh_ck, starts=None, checkpoint=None):
+        """
+        Chạy 2 vòng Learning/Action trên các dòng từ vị trí starts[sheet] trở đi.
+        checkpoint = kết quả lần trước (két + khung sự kiện) -> chỉ xử lý phần dòng mới rồi ghép.
+        Trả về (events, checkpoint mới) hoặc None nếu dòng mới làm đổi kết quả của dòng cũ.
+        """
+        starts = starts or {}
+        df_t = self._read_sheet(wb, sh_tien) if sh_tien else None
+        df_ck = self._read_sheet(wb, sh_ck) if sh_ck else None
+        cash = self._prep_cash(df_t.iloc[starts.get('cash', 0):]) if df_t is not None else None
+        ck = self._prep_ck(df_ck.iloc[starts.get('ck', 0):]) if df_ck is not None else None
+
+        old = {k: [] for k in self.EVENT_GROUPS}
+        old_tickers = set()
+        if checkpoint:
+            self.set_state(checkpoint['state'])
+            old, old_tickers = checkpoint['frames'], checkpoint['ck_tickers']
+        cost_before = dict(self.unit_cost_cache)
+        ipo_before = dict(self.ipo_accumulator)
+
+        # VÒNG 1: LEARNING
+        if cash is not None: self._learn_cash(cash)
+        # Tiền IPO mới của mã đã có dòng CK cũ: parse toàn bộ cộng dồn tiền này TRƯỚC khi chia cho dòng "chờ giao dịch" cũ
+        # -> giá vốn dòng cũ đổi -> parse toàn bộ
+        if {t for t, v in self.ipo_accumulator.items() if v != ipo_before.get(t, 0)} & old_tickers: return None
+        if ck is not None: self._learn_ck(ck)
+
+        # Giá vốn IPO của mã đã có dòng CK cũ bị đổi -> dòng cũ phải tính lại (parse toàn bộ)
+        changed = {t for t in set(cost_before) | set(self.unit_cost_cache) if cost_before.get(t, 0) != self.unit_cost_cache.get(t, 0)}
+        if changed & old_tickers: return None
+
+        # VÒNG 2: ACTION
+        frames = {k: [] for k in self.EVENT_GROUPS}
+        if cash is not None: self._act_cash(cash, frames, self._ipo_keys(old['trades']))
+        if ck is not None: frames['trades'].append(self._act_ck(ck))
+
+        # Ghép theo từng nhóm: dòng cũ đứng trước dòng mới (đúng thứ tự của lần parse toàn bộ)
+        frames = {k: old[k] + frames[k] for k in self.EVENT_GROUPS}
+        new_tickers = set(ck['tik']) if ck is not None else set()
+        checkpoint = {'state': self.get_state(), 'frames': frames, 'ck_tickers': old_tickers | new_tickers}
+        return self._finalize_columnar(frames), checkpoint
+
+    def _ipo_keys(self, trade_frames):
+        """(ngày, số tiền) của các lệnh IPO_DEPOSIT đã ghi -> chống trùng cho dòng mới."""
+        ipo = [f[f['type'] == 'IPO_DEPOSIT'] for f in trade_frames if not f.empty]
+        if not ipo: return None
+        ipo = pd.concat(ipo)
+        return pd.MultiIndex.from_arrays([ipo['date'], ipo['value']])
+
+    def _finalize_columnar(self, frames):
+        # CASH_SNAPSHOT = số dư của dòng đầu tiên có ngày lớn nhất
+        cash_event = []
+        bal = [f for f in frames['balance'] if not f.empty]
+        if bal:
+            b = pd.concat(bal, ignore_index=True)
+            cash_event = [pd.DataFrame([{'date': datetime.now(), 'type': 'CASH_SNAPSHOT', 'val': b.at[b['date'].idxmax(), 'bal'], 'source': 'VCK_LEDGER'}])]
+
+        # Giữ đúng thứ tự ghép list như chế độ cũ: trades + deposits + dividends + cash_event + fee_pool
+        parts = [f for k in ('trades', 'deposits', 'dividends') for f in frames[k] if not f.empty]
+        parts += cash_event + [f for f in frames['fee_pool'] if not f.empty]
+        if not parts: return []
+        return self._sort_events(pd.concat(parts, ignore_index=True, sort=False))
+
+    # --- NẠP TĂNG DẦN (processors/incremental.py) ---
+    def get_state(self):
+        return {'ipo_accumulator': dict(self.ipo_accumulator), 'unit_cost_cache': dict(self.unit_cost_cache)}
+
+    def set_state(self, state):
+        self.ipo_accumulator = defaultdict(float, state['ipo_accumulator'])
+        self.unit_cost_cache = defaultdict(float, state['unit_cost_cache'])
+
+    def ledger_sheets(self, file_path):
+        """Các sheet có trạng thái, theo thứ tự xử lý dòng: { 'cash': df, 'ck': df }."""
+        wb = load_workbook(file_path)
+        sheets = dict(zip(('cash', 'ck'), self._find_sheets(wb)))
+        return {k: wb.raw(sh) for k, sh in sheets.items() if sh}
+
+    def parse_incremental(self, file_path, starts=None, checkpoint=None):
+        """Chỉ parse các dòng từ starts[sheet]. Không có checkpoint -> parse toàn bộ. Xem _run_columnar."""
+        self.ipo_accumulator = defaultdict(float)
+        self.unit_cost_cache = defaultdict(float)
+        wb = load_workbook(file_path)
+        return self._run_columnar(wb, *self._find_sheets(wb), starts=starts, checkpoint=checkpoint)
+
+    # --- HELPERS CỘT ---
+    def _col(self, df, c, default):
+        if c is None: return pd.Series(default, index=df.index, dtype=object)
+        return df[c]
+
+    def _col_str(self, s):
+        """str(x) cho cả cột (NaN -> 'nan' giống str())."""
+        return s.astype(object).map(str)
+
+    def _col_normalize(self, s):
+        """normalize_str cho cả cột."""
+        s = s.astype(object)
+        s = s.where(s.notna(), '').map(str)
+        s = s.str.replace(r'[đĐ]', 'd', regex=True).str.normalize('NFD')
+        return s.str.encode('ascii', 'ignore').str.decode('utf-8').str.lower().str.strip()
+
+    def _col_clean_num(self, s):
+        """clean_num cho cả cột: ô số giữ nguyên, ô chữ bỏ '.', ',' và khoảng trắng."""
+        if pd.api.types.is_numeric_dtype(s): return s.astype(float).fillna(0.0)
+        s = s.astype(object)
+        is_txt = s.map(lambda v: isinstance(v, str)).astype(bool)
+        out = pd.to_numeric(s.where(~is_txt), errors='coerce')
+        if is_txt.any():
+            txt = s[is_txt].astype(str)
+            cleaned = txt.str.replace('.', '', regex=False).str.replace(',', '', regex=False).str.replace(' ', '', regex=False)
+            num_txt = pd.to_numeric(cleaned.str.strip(), errors='coerce')
+            out[is_txt] = num_txt.where(~txt.str.strip().isin(['', '-']))
+        return out.astype(float).fillna(0.0)
+
+    def _col_date(self, s, text=None):
+        """extract_date(str(x)) cho cả cột, thiếu thì tìm dd/mm/yyyy trong text."""
+        tok = self._col_str(s).str.strip().str.split(' ').str[0]
+        d = pd.to_datetime(tok, format='%d/%m/%Y', errors='coerce')
+        d = d.fillna(pd.to_datetime(tok, format='%Y-%m-%d', errors='coerce'))
+        if text is not None:
+            d_txt = text.str.extract(r"(\d{2}/\d{2}/\d{4})", expand=False)
+            d = d.fillna(pd.to_datetime(d_txt, format='%d/%m/%Y', errors='coerce'))
+        return d
+
+    def _col_has(self, s, keywords):
+        return s.str.contains('|'.join(re.escape(k) for k in keywords), regex=True)
+
+    def _col_ticker(self, norm):
+        """_extract_ticker_regex cho cả cột (ưu tiên vps_ > mua/toan/ipo > quyen mua)."""
+        m_vps = norm.str.extract(r"vps_([a-zA-Z0-9]{3})_", flags=re.IGNORECASE, expand=False)
+        m_qty = norm.str.extract(r"(?:mua|toan|ipo)\s+([0-9]+)\s*([a-zA-Z0-9]{3})", flags=re.IGNORECASE)[1]
+        m_rights = norm.str.extract(r"quyen mua[:\s]*([a-zA-Z0-9]{3})\b", flags=re.IGNORECASE, expand=False)
+        return m_vps.fillna(m_qty).fillna(m_rights).str.upper()
+
+    # --- CHUẨN BỊ CỘT ---
+    def _prep_cash(self, df_t):
+        if df_t is None: return None
+        c_nd, c_giam, c_tang, c_date, c_bal = self._map_columns_tien(df_t)
+        if not c_nd: return None
+        raw = self._col_str(df_t[c_nd])
+        norm = self._col_normalize(df_t[c_nd])
+        giam = self._col_clean_num(self._col(df_t, c_giam, 0))
+        cash = pd.DataFrame({
+            'raw': raw, 'norm': norm, 'giam': giam,
+            'tang': self._col_clean_num(self._col(df_t, c_tang, 0)),
+            'date': self._col_date(self._col(df_t, c_date, ''), raw),
+            'bal': self._col_clean_num(df_t[c_bal]) if c_bal else float('nan'),
+        })
+        cash['ipo'] = (giam > 0) & self._col_has(norm, self.KW_IPO)
+        cash['ticker'] = self._col_ticker(norm.where(cash['ipo'], ''))
+        cash['ipo'] &= cash['ticker'].notna()
+        cash.attrs['has_bal'] = bool(c_bal)
+        return cash
+
+    def _prep_ck(self, df_ck):
+        if df_ck is None: return None
+        c_ma, c_status, c_nd, c_tang, c_giam, c_date, _ = self._map_columns_ck(df_ck)
+        if not c_ma: return None
+        raw = self._col_str(df_ck[c_nd]) if c_nd else pd.Series('', index=df_ck.index, dtype=object)
+        price = raw.str.extract(r"gia[:\s]+([0-9,]+)", flags=re.IGNORECASE, expand=False)
+        return pd.DataFrame({
+            'tik': self._col_str(df_ck[c_ma]).str.strip().str.upper(),
+            'raw': raw,
+            'norm': self._col_normalize(raw),
+            'status': self._col_normalize(self._col(df_ck, c_status, '')),
+            'date': self._col_date(self._col(df_ck, c_date, ''), raw),
+            'vin': self._col_clean_num(self._col(df_ck, c_tang, 0)),
+            'vout': self._col_clean_num(self._col(df_ck, c_giam, 0)),
+            'price': pd.to_numeric(price.str.replace(',', '', regex=False), errors='coerce').fillna(0.0),
+        })
+
+    # --- VÒNG 1: LEARNING ---
+    def _learn_cash(self, cash):
+        ipo = cash[cash['ipo']]
+        for tik, val in zip(ipo['ticker'], ipo['giam']):
+            self.ipo_accumulator[tik] += val
+
+    def _learn_ck(self, ck):
+        q = ck[ck['status'].str.contains('cho giao dich', regex=False) & (ck['vin'] > 0)]
+        for tik, vol_in in zip(q['tik'], q['vin']):
+            total_money = self.ipo_accumulator.get(tik, 0)
+            if total_money > 0:
+                self.unit_cost_cache[tik] = total_money / vol_in
+                self.ipo_accumulator[tik] = 0
+
+    # --- VÒNG 2: ACTION ---
+    def _act_cash(self, cash, frames, prior_ipo=None):
+        c = cash[cash['date'].notna()]
+        if c.empty: return
+        pos = np.arange(len(c))
+        norm, giam, tang = c['norm'], c['giam'], c['tang']
+
+        if c.attrs.get('has_bal', cash.attrs.get('has_bal')):
+            last = c['date'].idxmax() # Dòng đầu tiên có ngày lớn nhất
+            frames['balance'].append(c.loc[[last], ['date', 'bal']])
+
+        # IPO (ghi vào trades)
+        ipo = c['ipo']
+        frames['trades'].append(pd.DataFrame({
+            'date': c['date'][ipo], 'type': 'IPO_DEPOSIT', 'ticker': c['ticker'][ipo] + "_PENDING",
+            'qty': 0, 'price': 0, 'value': giam[ipo], 'source': 'VCK_IPO_CASH'}))
+
+        # Chống trùng: đã có lệnh IPO cùng (ngày, số tiền) từ các dòng trước (hoặc chính dòng này)
+        dup = ipo.astype(int).groupby([c['date'], giam]).cumsum() > 0
+        if prior_ipo is not None: dup |= pd.MultiIndex.from_arrays([c['date'], giam]).isin(prior_ipo)
+        out = (giam > 0) & ~dup
+        is_fee = out & self._col_has(norm, self.KW_FEE)
+        is_rut = out & ~is_fee & self._col_has(norm, ['rut', 'chuyen']) & ~norm.str.contains('mua', regex=False)
+        frames['fee_pool'].append(pd.DataFrame({
+            'date': c['date'][is_fee], 'type': 'PHI_THUE', 'value': giam[is_fee], 'source': 'VCK_FEE'}))
+
+        has_in = tang > 0
+        is_nap = has_in & self._col_has(norm, ['nop tien', 'cashin'])
+        is_div = has_in & ~is_nap & self._col_has(norm, ['co tuc', 'lai'])
+        is_ban = has_in & ~is_nap & ~is_div & self._col_has(norm, ['ban ', 'ung truoc'])
+
+        # Deposits: trong cùng 1 dòng, RUT_TIEN (tiền ra) đứng trước NAP/BAN (tiền vào)
+        dep = pd.concat([
+            pd.DataFrame({'date': c['date'][is_rut], 'type': 'RUT_TIEN', 'val': giam[is_rut], 'source': 'VCK_WITHDRAW', '_pos': pos[is_rut.values], '_sub': 0}),
+            pd.DataFrame({'date': c['date'][is_nap], 'type': 'NAP_TIEN', 'val': tang[is_nap], 'source': 'VCK_DEP', '_pos': pos[is_nap.values], '_sub': 1}),
+            pd.DataFrame({'date': c['date'][is_ban], 'type': 'BAN_TIEN_VE', 'val': tang[is_ban], 'source': 'VCK_SELL', '_pos': pos[is_ban.values], '_sub': 1}),
+        ])
+        frames['deposits'].append(dep.sort_values(['_pos', '_sub'], kind='stable').drop(columns=['_pos', '_sub']))
+
+        # Cổ tức / Lãi tiền gửi
+        d = c[is_div]
+        if not d.empty:
+            d_norm = d['norm']
+            sym = d_norm.str.extract(r"(?:ma|ck|symbol)[:\s]+([a-z0-9]{3})\b", expand=False)
+            not_black = '|'.join(self.DIV_BLACKLIST)
+            sym = sym.fillna(d_norm.str.extract(rf"\b(?!(?:{not_black})\b)([a-z0-9]{{3}})\b", expand=False))
+            sym = sym.str.upper().fillna('UNKNOWN')
+            is_lai = d_norm.str.contains('lai', regex=False) & self._col_has(d_norm, ['gui', 'tk', 'khong ky han'])
+            is_lai |= (sym == 'UNKNOWN') & (d['tang'] < 50000)
+            frames['dividends'].append(pd.DataFrame({
+                'date': d['date'], 'sym': sym.where(~is_lai, 'TIEN_GUI'),
+                'type': np.where(is_lai, 'LAI_TIEN_GUI', 'CO_TUC_TIEN'),
+                'val': d['tang'], 'source': 'VCK_DIV', 'desc': d['raw']}))
+
+    def _act_ck(self, ck):
+        k = ck[(ck['tik'] != '') & (ck['tik'] != 'NAN') & ck['date'].notna()]
+        tik, norm, price, vin, vout = k['tik'], k['norm'], k['price'], k['vin'], k['vout']
+        cached = tik.map(dict(self.unit_cost_cache)).fillna(0.0)
+
+        is_wft = k['status'].str.contains('cho giao dich', regex=False)
+        is_normal = ~is_wft & ~k['status'].str.contains('cho luu ky', regex=False)
+        is_buy = vin > 0
+        is_sell = ~is_buy & (vout > 0)
+
+        # Phân loại Hunter cho lệnh mua thường
+        is_special = self._col_has(norm, self.KW_HUNTER) | ((price > 0) & (price <= 11000) & ~norm.str.contains('mua khop', regex=False))
+        src_buy = np.where(is_special, 'VCK_DEAL_BUY', 'VCK_MATCH_BUY')
+        src_buy = np.where((cached > 0) & (price == 0), 'VCK_CONVERT_IN', src_buy)
+        real_price = price.where(price > 0, cached)
+
+        conds = [is_wft & is_buy, is_wft & is_sell, is_normal & is_buy, is_normal & is_sell]
+        emit = np.logical_or.reduce(conds)
+        pick = lambda *vals: np.select(conds, vals, default=None)[emit]
+        return pd.DataFrame({
+            'date': k['date'][emit],
+            'type': pick('BUY', 'SELL', 'BUY', 'SELL'),
+            'ticker': pick(tik + "_WFT", tik + "_WFT", tik, tik),
+            'qty': pick(vin, vout, vin, vout).astype(float),
+            'price': pick(0.0, cached, real_price, price).astype(float),
+            'value': pick(cached * vin, cached * vout, vin * real_price, vout * price).astype(float),
+            'source': pick('VCK_IPO_MATCH', 'VCK_CONVERT_OUT', src_buy, 'VCK_MATCH_SELL'),
+        })
+
     # --- HELPERS NÂNG CAO ---
-    def _read_sheet(self, xls, file_path, sheet_name):
-        try:
-            if xls: df = pd.read_excel(xls, sheet_name=sheet_name, header=0)
-            else: df = pd.read_csv(file_path, header=0)
-            df.columns = [self.normalize_str(c) for c in df.columns]
-            return df
+    def _read_sheet(self, wb, sheet_name):
+        try: return wb.sheet(sheet_name, normalize=self.normalize_str)
         except: return None
 
     def _map_columns_tien(self, df):
@@ -316,4 +616,49 @@ class VCKAdapter:
         if not text: return None
         m = re.search(r"(\d{2}/\d{2}/\d{4})", text)
         if m: return datetime.strptime(m.group(1), '%d/%m/%Y')
-        return None
\ No newline at end of file
+        return None
+
+def _synthetic_ledger(n_rows, seed=0):
+    """Sao kê tiền giả lập n_rows dòng (CSV bytes) cho đo hiệu năng."""
+    rnd = np.random.default_rng(seed)
+    day = pd.Timestamp('2015-01-01') + pd.to_timedelta(np.arange(n_rows) // 20, unit='D')
+    kind = rnd.integers(0, 4, n_rows)
+    amount = rnd.integers(1, 500, n_rows) * 10000
+    desc = np.select([kind == 0, kind == 1, kind == 2], ['Nop tien vao tai khoan', 'Thanh toan mua IPO 100 HPG', 'Phi giao dich'], 'Rut tien ve ngan hang')
+    df = pd.DataFrame({'Ngày GD': day.strftime('%d/%m/%Y'), 'Nội dung': desc,
+                       'Phát sinh tăng': np.where(kind == 0, amount, 0), 'Phát sinh giảm': np.where(kind != 0, amount, 0)})
+    df['Số dư'] = (df['Phát sinh tăng'] - df['Phát sinh giảm']).cumsum()
+    return df.to_csv(index=False).encode('utf-8')
+
+
+if __name__ == "__main__":
+    import sys, time
+    if sys.argv[1] == '--bench':
+        # Đo độ tăng thời gian theo số dòng sổ tiền (phải gần tuyến tính: x2 dòng ~ x2 thời gian)
+        # python -m processors.adapter_vck --bench [100000]  (chỉ để đo; kiểm tra tự động: tests/test_adapter_vck.py)
+        n_max = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+        for mode in (False, True):
+            prev = None
+            for n in (n_max // 4, n_max // 2, n_max):
+                data = _synthetic_ledger(n)
+                load_workbook(data).raw()  # Không tính thời gian decode file
+                t0 = time.time()
+                n_ev = len(VCKAdapter(columnar=mode).parse(data))
+                dt = time.time() - t0
+                ratio = f", x{dt / prev:.2f} so với lần trước" if prev else ""
+                print(f"{'columnar' if mode else 'iterrows'} {n:>7} dòng: {n_ev} events, {dt:.2f}s ({dt / n * 1e6:.1f} µs/dòng{ratio})")
+                prev = dt
+        sys.exit()
+
+    # Test nhanh: đối chiếu chế độ cột với chế độ từng dòng trên 1 file sao kê
+    # python -m processors.adapter_vck <file.xlsx>
+    path = sys.argv[1]
+    load_workbook(path)
+    res = {}
+    for mode in (False, True):
+        t0 = time.time()
+        res[mode] = pd.DataFrame(VCKAdapter(columnar=mode).parse(path))
+        print(f"{'columnar' if mode else 'iterrows'}: {len(res[mode])} events, {time.time() - t0:.2f}s")
+    for df in res.values(): df.loc[df['type'] == 'CASH_SNAPSHOT', 'date'] = pd.NaT  # datetime.now()
+    pd.testing.assert_frame_equal(res[False], res[True], check_dtype=False)
+    print("✅ Hai chế độ cho kết quả giống nhau")
@@ -2,11 +2,25 @@
 # Version: V15 OFFICIAL - THREE PATHS LOGIC (UPDATED FROM V8.1)
 import pandas as pd
 import re
-from datetime import datetime, timedelta
+from bisect import bisect_left
+from datetime import datetime
 from collections import defaultdict
+from processors.workbook import load_workbook
+
+# Bảng bỏ dấu tính sẵn 1 lần (thay cho s1.index(c) từng ký tự).
+# Giữ nguyên cặp ký tự của bảng cũ; riêng Ỹ/ỹ (bảng cũ thiếu -> lỗi cả dòng) map về Y/y.
+_ACCENT_SRC = u'ÀÁÂÃÈÉÊÌÍÒÓÔÕÙÚÝàáâãèéêìíòóôõùúýĂăĐđĨĩŨũƠơƯưẠạẢảẤấẦầẨẩẪẫẬậẮắẰằẲẳẴẵẶặẸẹẺẻẼẽẾếỀềỂểỄễỆệỈỉỊịỌọỎỏỐốỒồỔổỖỗỘộỚớỜờỞởỠỡỢợỤụỦủỨứỪừỬửỮữỰựỲỳỴỵỶỷỸỹ'
+_ACCENT_DST = u'AAAAEEEIIOOOUUYaaaaeeeiiooouuyAaDdIiUuOoUuAaAaAaAaAaAaAaAaAaAaAaAaEeEeEeEeEeEeEeEeIiIiOoOoOoOoOoOoOoOoOoOoOoOoUuUuUuUuUuUuUuYyYyYyYy' + u'Yy'
+_ACCENT_TABLE = str.maketrans(_ACCENT_SRC, _ACCENT_DST)
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
 
 class VPSAdapter:
-    def __init__(self):
+    # Phiên bản logic parse: tăng khi đổi cách phân loại -> cache trên đĩa tự vô hiệu
+    VERSION = 'VPS-V15-2'
+
+    def __init__(self, columnar=True):
+        # columnar=True: xử lý cả cột bằng pandas (nhanh), False: iterrows từng dòng (cũ)
+        self.columnar = columnar
         # [NEW] Két sắt LUỒNG 2: Mua Quyền (Lưu chi tiết để khớp số lượng)
         self.rights_vault = defaultdict(list) 
         # [NEW] Két sắt LUỒNG 3: IPO (Chỉ cộng dồn tiền)
@@ -39,34 +53,40 @@ class VPSAdapter:
 
     def remove_accents(self, input_str):
         if not input_str: return ""
-        s1 = u'ÀÁÂÃÈÉÊÌÍÒÓÔÕÙÚÝàáâãèéêìíòóôõùúýĂăĐđĨĩŨũƠơƯưẠạẢảẤấẦầẨẩẪẫẬậẮắẰằẲẳẴẵẶặẸẹẺẻẼẽẾếỀềỂểỄễỆệỈỉỊịỌọỎỏỐốỒồỔổỖỗỘộỚớỜờỞởỠỡỢợỤụỦủỨứỪừỬửỮữỰựỲỳỴỵỶỷỸỹ'
-        s0 = u'AAAAEEEIIOOOUUYaaaaeeeiiooouuyAaDdIiUuOoUuAaAaAaAaAaAaAaAaAaAaAaAaEeEeEeEeEeEeEeEeIiIiOoOoOoOoOoOoOoOoOoOoOoOoUuUuUuUuUuUuUuYyYyYyYy'
-        s = ''
-        input_str = str(input_str)
-        for c in input_str:
-            if c in s1: s += s0[s1.index(c)]
-            else: s += c
-        return s.lower()
+        return str(input_str).translate(_ACCENT_TABLE).lower()
 
-    def parse(self, file_path):
-        events = []
+    def _reset_state(self):
         # Reset các két tiền
         self.rights_vault.clear()
         self.ipo_accumulator.clear()
         self.buy_aggregator.clear()
         self.wft_price_cache.clear()
 
+    def parse(self, file_path):
+        self._reset_state()
+        try: wb = load_workbook(file_path)
+        except Exception: return []
+
+        if self.columnar:
+            try: return self._parse_columnar(wb)
+            except Exception as e:
+                # Chế độ cột lỗi (file lạ) -> quay về đọc từng dòng như cũ
+                print(f"⚠️ VPS columnar lỗi ({e}) -> chuyển sang đọc từng dòng")
+                self._reset_state()
+        return self._parse_rows(wb)
+
+    def _parse_rows(self, wb):
+        """Chế độ cũ: duyệt iterrows từng dòng (giữ làm chuẩn đối chiếu)."""
+        events = []
         try:
-            xls = pd.ExcelFile(file_path)
-            sheet_map = {s.lower(): s for s in xls.sheet_names}
+            sheet_map = wb.sheet_map
 
             # =================================================================
             # BƯỚC 1: QUÉT SHEET TIỀN (PHÂN LOẠI VÀO 2 KÉT)
             # =================================================================
             sh_tien = next((sheet_map[s] for s in sheet_map if 'tiền' in s or 'cash' in s), None)
             if sh_tien:
-                df_t = pd.read_excel(xls, sheet_name=sh_tien).iloc[::-1]
-                df_t.columns = [str(c).strip().lower() for c in df_t.columns]
+                df_t = wb.sheet(sh_tien).iloc[::-1]
                 
                 c_desc = next((c for c in df_t.columns if 'mô tả' in c or 'nội dung' in c), None)
                 c_out = next((c for c in df_t.columns if 'giảm' in c or 'debit' in c), None)
@@ -156,17 +176,14 @@ class VPSAdapter:
                             
                         except Exception: continue
 
-            price_map_normal = {} 
-            for (sym, d_str), data in self.buy_aggregator.items():
-                if data['qty'] > 0: price_map_normal[(sym, d_str)] = data['cost'] / data['qty']
+            price_index = self._build_price_index()
 
             # =================================================================
             # BƯỚC 2: KHỚP HÀNG (3 LUỒNG ƯU TIÊN)
             # =================================================================
             sh_cp = next((sheet_map[s] for s in sheet_map if 'cp' in s or 'ck' in s or 'kho' in s), None)
             if sh_cp:
-                df_cp = pd.read_excel(xls, sheet_name=sh_cp).iloc[::-1]
-                df_cp.columns = [str(c).strip().lower() for c in df_cp.columns]
+                df_cp = wb.sheet(sh_cp).iloc[::-1]
                 c_date = next((c for c in df_cp.columns if 'ngày' in c), None)
                 c_sym = next((c for c in df_cp.columns if 'mã' in c), None)
                 c_desc = next((c for c in df_cp.columns if 'mô tả' in c or 'nội dung' in c), None)
@@ -243,14 +260,9 @@ class VPSAdapter:
                                     continue
 
                                 # LUỒNG 4: MUA THƯỜNG (FALLBACK - GIỮ NGUYÊN V8.1)
-                                price = 0
                                 src_type = 'VPS_MATCH_BUY'
                                 sym_lookup = sym.replace('_WFT', '')
-                                search_order = sorted(range(-10, 11), key=abs) 
-                                for delta in search_order:
-                                    chk_d = d_obj + timedelta(days=delta)
-                                    k = (sym_lookup, chk_d.strftime('%Y-%m-%d'))
-                                    if k in price_map_normal: price = price_map_normal[k]; break
+                                price = self._lookup_price(price_index, sym_lookup, d_obj)
                                 
                                 events.append({'date': d_obj, 'ticker': sym, 'type': 'BUY', 'qty': val_in, 'price': price, 'value': val_in * price, 'source': src_type, 'desc': desc})
 
@@ -262,8 +274,7 @@ class VPSAdapter:
             # PHẦN 3: LÃI LỖ (GIỮ NGUYÊN V8.1)
             sh_ll = next((sheet_map[s] for s in sheet_map if 'lãi' in s and 'lỗ' in s), None)
             if sh_ll:
-                df_ll = pd.read_excel(xls, sheet_name=sh_ll)
-                df_ll.columns = [str(c).strip().lower() for c in df_ll.columns]
+                df_ll = wb.sheet(sh_ll)
                 c_date = next((c for c in df_ll.columns if 'ngày' in c), None)
                 c_sym = next((c for c in df_ll.columns if 'mã' in c), None)
                 c_pl = next((c for c in df_ll.columns if 'lãi' in c and 'lỗ' in c and '%' not in c), None)
@@ -272,13 +283,409 @@ class VPSAdapter:
                         val_pl = self.clean_num(row.get(c_pl, 0))
                         sym = str(row.get(c_sym, '')).strip().upper()
                         if val_pl == 0: continue
-                        d_obj = self.extract_date(row.get(c_date)) or datetime.now()
+                        d_obj = self.extract_date(row.get(c_date)) or pd.NaT
                         events.append({'date': d_obj, 'ticker': sym, 'type': 'PNL_UPDATE', 'value': val_pl})
 
         except Exception as e: return []
             
         if not events: return []
-        df_ev = pd.DataFrame(events)
+        return self._sort_events(pd.DataFrame(events))
+
+    def _sort_events(self, df_ev):
         type_prio = {'DEPOSIT': 1, 'IPO_PAYMENT': 2, 'WITHDRAW': 3, 'BUY': 4, 'SELL': 5, 'PNL_UPDATE': 6, 'DIVIDEND': 7, 'CASH_SNAPSHOT': 99}
         df_ev['prio'] = df_ev['type'].map(type_prio).fillna(50)
-        return df_ev.sort_values(by=['date', 'prio']).to_dict('records')
\ No newline at end of file
+        return df_ev.sort_values(by=['date', 'prio']).to_dict('records')
+    # --- GIÁ MUA THƯỜNG (LUỒNG 4) ---
+    def _build_price_index(self):
+        """{ mã: ([ordinal ngày tăng dần], [đơn giá]) } từ buy_aggregator (chỉ các ngày có khối lượng)."""
+        index = defaultdict(list)
+        for (sym, d_str), data in self.buy_aggregator.items():
+            if data['qty'] > 0: index[sym].append((datetime.strptime(d_str, '%Y-%m-%d').toordinal(), data['cost'] / data['qty']))
+        return {sym: ([o for o, _ in sorted(rows)], [p for _, p in sorted(rows)]) for sym, rows in index.items()}
+
+    def _lookup_price(self, price_index, sym, d_obj):
+        """Giá của ngày gần nhất trong ±10 ngày (lệch bằng nhau -> lấy ngày trước), không có -> 0."""
+        if sym not in price_index: return 0
+        ords, prices = price_index[sym]
+        o = d_obj.toordinal()
+        i = bisect_left(ords, o)
+        best, dist = 0, 11
+        if i > 0 and o - ords[i - 1] < dist: best, dist = prices[i - 1], o - ords[i - 1]
+        if i < len(ords) and ords[i] - o < dist: best = prices[i]
+        return best
+
+    # =================================================================
+    # CHẾ ĐỘ CỘT (COLUMNAR): Cùng logic 3 luồng với _parse_rows nhưng xử lý cả cột.
+    # Két Quyền/IPO được khớp theo nhóm mã gốc (base ticker) thay vì quét từng dòng.
+    # =================================================================
+    KW_REFUND_OUT = ['hoan tra uttb', 'thu no', 'tra no', 'uttb', 'hoan ung']
+    KW_FEE = ['phi ', 'thue ', 'transaction fee', 'tax ', 'tra phi', 'phi luu ky']
+    KW_WITHDRAW = ['rut tien', 'chuyen tien ra', 'chuyen khoan ra']
+    KW_BUY_BLACKLIST = ['phí', 'thuế', 'fee', 'tax', 'phi ', 'thue ']
+    KW_DEPOSIT = ['nop tien vao', 'chuyen tien vao', 'cashin', 'nop tien mat']
+    KW_DEPOSIT_EXCLUDE = ['nhan tien ban', 'tien ban ck', 'hoan tra', 'hoan tien', 'hoan ung', 'nop tien mua']
+    KW_DIVIDEND = ['co tuc', 'div', 'lai', 'quyen']
+    KW_DIVIDEND_EXCLUDE = ['tien gui', 'khong ky han', 'so du', 'ky han']
+    KW_BONUS = ['co tuc', 'thuong', 'dividend', 'share', 'bonus', 'tra lai']
+    KW_RIGHTS = ['phat hanh them', 'quyen mua', 'phan bo', 'issued more']
+    KW_CONVERT = ['chuyen chung khoan', 'chuyen doi']
+
+    RE_ISSUED = r"issued more.*?([0-9]+)\s+([a-zA-Z0-9]{3})\b"
+    RE_IPO = r"(?:nop tien|mua).*?([0-9]+)\s*(?:cp|co phieu)?\s*([a-zA-Z0-9]{3})\b"
+    RE_BUY = r"mua\s.*?([\d.,]+)\s*([A-Za-z0-9_]+)"
+
+    def _find_sheets(self, wb):
+        sheet_map = wb.sheet_map
+        sh_tien = next((sheet_map[s] for s in sheet_map if 'tiền' in s or 'cash' in s), None)
+        sh_cp = next((sheet_map[s] for s in sheet_map if 'cp' in s or 'ck' in s or 'kho' in s), None)
+        sh_ll = next((sheet_map[s] for s in sheet_map if 'lãi' in s and 'lỗ' in s), None)
+        return sh_tien, sh_cp, sh_ll
+
+    def _parse_columnar(self, wb):
+        return self._run_columnar(wb)[0]
+
+    def _run_columnar(self, wb, starts=None, checkpoint=None):
+        """
+        Xử lý sheet Tiền/CK từ dòng starts[sheet] (theo thứ tự cũ -> mới), sheet Lãi lỗ luôn chạy lại cả sheet.
+        checkpoint = kết quả lần trước (két + khung sự kiện) -> chỉ xử lý phần dòng mới rồi ghép.
+        Trả về (events, checkpoint mới) hoặc None nếu dòng mới làm đổi kết quả của dòng cũ.
+        """
+        starts = starts or {}
+        sh_tien, sh_cp, sh_ll = self._find_sheets(wb)
+        old_parts, old_eligible, old_normal = [], set(), []
+        if checkpoint:
+            self.set_state(checkpoint['state'])
+            old_parts, old_eligible, old_normal = checkpoint['parts'], checkpoint['eligible'], checkpoint['normal']
+        vault_before = {b: len(p) for b, p in self.rights_vault.items()}
+        acc_before = dict(self.ipo_accumulator)
+        agg_before = {k: dict(v) for k, v in self.buy_aggregator.items()}
+        parts = []
+
+        # BƯỚC 1: SHEET TIỀN (Đổ vào 2 két + gom giá mua thường)
+        if sh_tien:
+            parts += self._cash_columnar(self._oldest_first(wb, sh_tien).iloc[starts.get('cash', 0):])
+
+        # Dòng tiền mới nạp thêm Quyền/IPO cho mã mà dòng CK cũ từng chờ khớp -> dòng cũ phải khớp lại
+        grown = {b for b, p in self.rights_vault.items() if len(p) > vault_before.get(b, 0)}
+        grown |= {b for b, v in self.ipo_accumulator.items() if v > acc_before.get(b, 0)}
+        if grown & old_eligible: return None
+        # Giá mua thường mới nằm trong ±10 ngày của lệnh mua thường cũ -> giá dòng cũ có thể đổi
+        changed = [k for k, v in self.buy_aggregator.items() if agg_before.get(k) != v]
+        if changed and old_normal and self._near_normal(changed, pd.concat(old_normal)): return None
+
+        # BƯỚC 2: KHỚP HÀNG (3 LUỒNG)
+        meta = {'eligible': set(), 'normal': []}
+        if sh_cp:
+            parts += self._stock_columnar(self._oldest_first(wb, sh_cp).iloc[starts.get('stock', 0):], self._build_price_index(), meta)
+
+        # PHẦN 3: LÃI LỖ (mỗi dòng độc lập, không có két -> không cần checkpoint)
+        pnl = self._pnl_columnar(wb.sheet(sh_ll)) if sh_ll else []
+
+        parts = old_parts + parts
+        checkpoint = {'state': self.get_state(), 'parts': parts,
+                      'eligible': old_eligible | meta['eligible'], 'normal': old_normal + meta['normal']}
+        return self._assemble(parts + pnl), checkpoint
+
+    def _oldest_first(self, wb, sheet_name):
+        """Sao kê VPS xếp mới -> cũ: đảo lại, vị trí dòng 0..n-1 theo thời gian."""
+        return wb.sheet(sheet_name).iloc[::-1].reset_index(drop=True)
+
+    def _near_normal(self, keys, normal):
+        """Có lệnh mua thường nào (cùng mã gốc) cách 1 trong các ngày keys không quá 10 ngày?"""
+        k = pd.DataFrame(keys, columns=['base', 'd_str'])
+        k['day_new'] = pd.to_datetime(k['d_str'], format='%Y-%m-%d')
+        m = normal.merge(k[['base', 'day_new']], on='base')
+        return bool(((m['day'] - m['day_new']).abs() <= pd.Timedelta(days=10)).any())
+
+    # --- NẠP TĂNG DẦN (processors/incremental.py) ---
+    def get_state(self):
+        return {'rights_vault': {b: [dict(p) for p in packs] for b, packs in self.rights_vault.items()},
+                'ipo_accumulator': dict(self.ipo_accumulator),
+                'buy_aggregator': {k: dict(v) for k, v in self.buy_aggregator.items()},
+                'wft_price_cache': dict(self.wft_price_cache)}
+
+    def set_state(self, state):
+        self._reset_state()
+        for b, packs in state['rights_vault'].items(): self.rights_vault[b] = [dict(p) for p in packs]
+        self.ipo_accumulator.update(state['ipo_accumulator'])
+        for k, v in state['buy_aggregator'].items(): self.buy_aggregator[k] = dict(v)
+        self.wft_price_cache.update(state['wft_price_cache'])
+
+    def ledger_sheets(self, file_path):
+        """Các sheet có trạng thái, theo thứ tự xử lý dòng (cũ -> mới): { 'cash': df, 'stock': df }."""
+        wb = load_workbook(file_path)
+        sh_tien, sh_cp, _ = self._find_sheets(wb)
+        return {k: wb.raw(sh).iloc[::-1] for k, sh in (('cash', sh_tien), ('stock', sh_cp)) if sh}
+
+    def parse_incremental(self, file_path, starts=None, checkpoint=None):
+        """Chỉ parse các dòng từ starts[sheet]. Không có checkpoint -> parse toàn bộ. Xem _run_columnar."""
+        self._reset_state()
+        return self._run_columnar(load_workbook(file_path), starts=starts, checkpoint=checkpoint)
+
+    def _assemble(self, parts):
+        """Ghép các khung sự kiện theo đúng thứ tự (sheet, dòng, thứ tự trong dòng) như list cũ."""
+        parts = [p for p in parts if not p.empty]
+        if not parts: return []
+        order = ['_sheet', '_pos', '_sub']
+        # Thứ tự cột = thứ tự key xuất hiện đầu tiên (giống pd.DataFrame(list_of_dicts))
+        cols = []
+        for p in sorted(parts, key=lambda p: min(zip(p['_sheet'], p['_pos'], p['_sub']))):
+            cols += [c for c in p.columns if c not in cols and c not in order]
+        df_ev = pd.concat(parts, ignore_index=True, sort=False).sort_values(order, kind='stable')
+        return self._sort_events(df_ev[cols].reset_index(drop=True))
+
+    def _frame(self, sheet, sub, cols):
+        df = pd.DataFrame(cols)
+        df['_sheet'] = sheet
+        df['_pos'] = df.index
+        df['_sub'] = sub
+        return df
+
+    # --- HELPERS CỘT ---
+    def _col_str(self, df, c, default=''):
+        """str(row.get(c, default)) cho cả cột."""
+        if c is None: return pd.Series(str(default), index=df.index, dtype=object)
+        return df[c].astype(object).map(str)
+
+    def _col_has(self, s, keywords):
+        return s.str.contains('|'.join(re.escape(k) for k in keywords), regex=True)
+
+    def _col_clean_num(self, df, c):
+        """clean_num cho cả cột."""
+        if c is None: return pd.Series(0.0, index=df.index)
+        s = df[c]
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            return s.astype(float).fillna(0.0)
+        s = s.astype(object)
+        is_num = s.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)).astype(bool)
+        out = pd.to_numeric(s.where(is_num), errors='coerce').astype(float)
+        rest = ~is_num & s.notna()
+        if rest.any():
+            txt = s[rest].map(str).str.strip().str.replace(r'[^\d.,-]', '', regex=True)
+            v1 = pd.to_numeric(txt.str.replace(',', '', regex=False), errors='coerce')
+            v2 = pd.to_numeric(txt.str.replace('.', '', regex=False).str.replace(',', '.', regex=False), errors='coerce')
+            out[rest] = v1.fillna(v2)
+        return out.fillna(0.0)
+
+    def _col_date(self, df, c):
+        """extract_date cho cả cột: ô ngày giờ giữ nguyên, ô chữ thử lần lượt các định dạng."""
+        if c is None: return pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+        s = df[c]
+        if pd.api.types.is_datetime64_any_dtype(s): return s
+        s = s.astype(object)
+        is_dt = s.map(lambda v: isinstance(v, datetime)).astype(bool)
+        out = pd.to_datetime(s.where(is_dt), errors='coerce')
+        is_txt = s.map(lambda v: isinstance(v, str)).astype(bool)
+        if is_txt.any():
+            tok = s[is_txt].astype(str).str.strip().str.split(' ').str[0]
+            d = pd.to_datetime(tok, format='%d/%m/%Y', errors='coerce')
+            for fmt in ['%Y-%m-%d', '%d-%m-%Y', '%d-%b-%y']:
+                d = d.fillna(pd.to_datetime(tok, format=fmt, errors='coerce'))
+            out[is_txt] = d
+        return out
+
+    def _col_accents(self, s):
+        """remove_accents cho cả cột (dùng chung bảng dịch)."""
+        return s.str.translate(_ACCENT_TABLE).str.lower()
+
+    # --- SHEET TIỀN ---
+    def _cash_columnar(self, df_t):
+        c_desc = next((c for c in df_t.columns if 'mô tả' in c or 'nội dung' in c), None)
+        c_out = next((c for c in df_t.columns if 'giảm' in c or 'debit' in c), None)
+        c_in = next((c for c in df_t.columns if 'tăng' in c or 'credit' in c), None)
+        c_date = next((c for c in df_t.columns if 'ngày' in c), None)
+        c_bal = next((c for c in df_t.columns if 'số dư' in c or 'balance' in c), None)
+        if not c_desc: return []
+
+        date = self._col_date(df_t, c_date)
+        df_t = df_t[date.notna()]
+        date = date[df_t.index]
+        parts = []
+
+        # Số dư được ghi trước mọi phân loại (kể cả dòng bị bỏ qua bên dưới)
+        if c_bal:
+            parts.append(self._frame(0, 0, {'date': date, 'type': 'CASH_SNAPSHOT', 'value': self._col_clean_num(df_t, c_bal)}))
+
+        desc = self._col_str(df_t, c_desc).str.strip()
+        low = self._col_accents(desc)
+        out = self._col_clean_num(df_t, c_out)
+        inn = self._col_clean_num(df_t, c_in)
+
+        # A. Mua Quyền ("issued more" + số lượng) -> Két 2
+        is_out = out > 0
+        m_issued = desc[is_out].str.extract(self.RE_ISSUED, flags=re.IGNORECASE).reindex(desc.index)
+        issued = is_out & m_issued[1].notna()
+        # B. Nộp tiền IPO ("nop tien") -> Két 3
+        m_ipo = low[is_out & ~issued].str.extract(self.RE_IPO, flags=re.IGNORECASE).reindex(desc.index)
+        ipo = is_out & ~issued & m_ipo[1].notna() & low.str.contains('nop tien', regex=False)
+        # C. Phí / Rút tiền / Mua thường
+        rest = is_out & ~issued & ~ipo
+        refund = rest & self._col_has(low, self.KW_REFUND_OUT)
+        fee = rest & ~refund & self._col_has(low, self.KW_FEE)
+        withdraw = rest & ~refund & ~fee & self._col_has(low, self.KW_WITHDRAW)
+        buy = (rest & ~refund & ~fee & ~withdraw & low.str.contains('mua', regex=False)
+               & ~self._col_has(desc.str.lower(), self.KW_BUY_BLACKLIST) & ~self._col_has(low, self.KW_BUY_BLACKLIST))
+
+        tik_pay = m_issued[1].where(issued, m_ipo[1]).str.upper().str.replace('_WFT', '', regex=False)
+        for d_obj, amount, qty, ticker in zip(date[issued], out[issued], m_issued[0][issued].astype(float), tik_pay[issued]):
+            self.rights_vault[ticker].append({'date': d_obj, 'amount': amount, 'expected_qty': qty})
+        for amount, ticker in zip(out[ipo], tik_pay[ipo]):
+            self.ipo_accumulator[ticker] += amount
+
+        pay = issued | ipo
+        parts.append(self._frame(0, 1, {'date': date[pay], 'type': 'IPO_PAYMENT', 'value': out[pay], 'ticker': tik_pay[pay], 'desc': desc[pay]}))
+        parts.append(self._frame(0, 1, {'date': date[fee], 'type': 'FEE', 'value': out[fee], 'desc': desc[fee]}))
+        parts.append(self._frame(0, 1, {'date': date[withdraw], 'type': 'WITHDRAW', 'value': out[withdraw]}))
+
+        # Gom giá mua thường theo (mã, ngày)
+        m_buy = desc[buy].str.extract(self.RE_BUY, flags=re.IGNORECASE)
+        if not m_buy.empty:
+            qty = pd.to_numeric(m_buy[0].str.replace('.', '', regex=False).str.replace(',', '', regex=False), errors='coerce')
+            agg = pd.DataFrame({'sym': m_buy[1].str.upper(), 'd_str': date[buy].dt.strftime('%Y-%m-%d'), 'qty': qty, 'cost': out[buy]})
+            agg = agg[agg['qty'] > 0].groupby(['sym', 'd_str'], sort=False)[['qty', 'cost']].sum()
+            for key, q, cost in zip(agg.index, agg['qty'], agg['cost']):
+                self.buy_aggregator[key]['qty'] += q
+                self.buy_aggregator[key]['cost'] += cost
+
+        # Tiền vào (bỏ qua các dòng đã 'continue' ở phần tiền ra)
+        has_in = (inn > 0) & ~(pay | refund | fee)
+        dep_kw = self._col_has(low, self.KW_DEPOSIT)
+        dep = has_in & dep_kw & ~self._col_has(low, self.KW_DEPOSIT_EXCLUDE)
+        div = has_in & ~dep_kw & self._col_has(low, self.KW_DIVIDEND) & ~self._col_has(low, self.KW_DIVIDEND_EXCLUDE)
+        div_sym = desc[div].str.upper().str.extract(r"\b([A-Z0-9]{3})\b", expand=False).fillna("UNKNOWN")
+        parts.append(self._frame(0, 2, {'date': date[dep], 'type': 'DEPOSIT', 'value': inn[dep]}))
+        parts.append(self._frame(0, 2, {'date': date[div], 'ticker': div_sym, 'type': 'DIVIDEND', 'value': inn[div]}))
+        return parts
+
+    # --- SHEET CHỨNG KHOÁN ---
+    def _stock_columnar(self, df_cp, price_index, meta=None):
+        c_date = next((c for c in df_cp.columns if 'ngày' in c), None)
+        c_sym = next((c for c in df_cp.columns if 'mã' in c), None)
+        c_desc = next((c for c in df_cp.columns if 'mô tả' in c or 'nội dung' in c), None)
+        c_in = next((c for c in df_cp.columns if 'tăng' in c), None)
+        c_out = next((c for c in df_cp.columns if 'giảm' in c), None)
+        if not c_sym: return []
+
+        date = self._col_date(df_cp, c_date)
+        df_cp = df_cp[date.notna()]
+        date = date[df_cp.index]
+
+        sym = self._col_str(df_cp, c_sym).str.strip().str.upper()
+        base = sym.str.replace('_WFT', '', regex=False)
+        vin = self._col_clean_num(df_cp, c_in)
+        vout = self._col_clean_num(df_cp, c_out)
+        desc = self._col_str(df_cp, c_desc).str.strip()
+        norm = self._col_accents(desc)
+
+        is_in = vin > 0
+        # LUỒNG 1: CỔ TỨC/THƯỞNG
+        bonus = is_in & self._col_has(norm, self.KW_BONUS)
+        flow = is_in & ~bonus
+        is_cand = self._col_has(norm, self.KW_RIGHTS) | sym.str.contains('_WFT', regex=False)
+        eligible = flow & (is_cand | norm.str.contains('luu ky', regex=False) | norm.str.contains('nhap kho', regex=False))
+
+        cache_before = dict(self.wft_price_cache)
+        # LUỒNG 2 + 3: Chỉ những mã gốc còn tiền trong két mới cần khớp tuần tự
+        active = set(self.rights_vault) | {k for k, v in self.ipo_accumulator.items() if v > 0}
+        matched = {}  # vị trí dòng -> (giá, giá trị)
+        cand_rows = pd.DataFrame({'base': base, 'vin': vin, 'cand': is_cand})[eligible & base.isin(active)]
+        for base_sym, g in cand_rows.groupby('base', sort=False):
+            packs = self.rights_vault.get(base_sym)
+            for pos, val_in, cand in zip(g.index, g['vin'], g['cand']):
+                hit = None
+                if cand and packs is not None:
+                    hit = next((i for i, pack in enumerate(packs) if abs(val_in - pack['expected_qty']) < 1.0), None)
+                if hit is not None:
+                    pack = packs.pop(hit)
+                    matched[pos] = (pack['amount'] / val_in, pack['amount'])
+                elif self.ipo_accumulator.get(base_sym, 0) > 0:
+                    total_money = self.ipo_accumulator[base_sym]
+                    matched[pos] = (total_money / val_in, total_money)
+                    self.ipo_accumulator[base_sym] = 0
+                else:
+                    if not packs: break # Két của mã này đã rỗng
+                    continue
+                self.wft_price_cache[base_sym] = matched[pos][0]
+                if not packs and self.ipo_accumulator.get(base_sym, 0) <= 0: break
+
+        is_matched = pd.Series(df_cp.index.isin(list(matched)), index=df_cp.index)
+        m_price = pd.Series({k: v[0] for k, v in matched.items()}, dtype=float).reindex(df_cp.index)
+        m_value = pd.Series({k: v[1] for k, v in matched.items()}, dtype=float).reindex(df_cp.index)
+
+        # CHUYỂN ĐỔI: lấy giá WFT gần nhất đã khớp TRƯỚC dòng này (cùng mã gốc)
+        conv_price = pd.Series(float('nan'), index=df_cp.index)
+        conv = flow & ~is_matched & self._col_has(norm, self.KW_CONVERT)
+        if matched and conv.any():
+            timeline = pd.DataFrame({'_pos': list(matched), 'base': base[list(matched)].values, 'price': [v[0] for v in matched.values()]}).sort_values('_pos')
+            query = pd.DataFrame({'_pos': conv.index[conv], 'base': base[conv].values})
+            hit = pd.merge_asof(query, timeline, on='_pos', by='base', direction='backward')
+            conv_price[query['_pos'].values] = hit['price'].values
+        if cache_before and conv.any():
+            # Nạp tăng dần: chưa khớp trong phần dòng mới -> dùng giá WFT từ checkpoint
+            conv_price[conv] = conv_price[conv].fillna(base[conv].map(cache_before))
+        conv &= conv_price.notna()
+
+        # LUỒNG 4: MUA THƯỜNG (dò giá ±10 ngày, gần nhất trước)
+        normal = flow & ~is_matched & ~conv
+        n_price = self._probe_price(base[normal], date[normal], price_index)
+        if meta is not None:
+            meta['eligible'] |= set(base[eligible])
+            meta['normal'].append(pd.DataFrame({'base': base[normal], 'day': date[normal].dt.normalize()}))
+
+        price = pd.Series(0.0, index=df_cp.index)
+        price[is_matched] = m_price[is_matched]
+        price[conv] = conv_price[conv]
+        price[normal] = n_price
+        value = vin * price
+        value[is_matched] = m_value[is_matched]
+        source = pd.Series('VPS_RIGHTS_MATCHED', index=df_cp.index, dtype=object)
+        source[bonus] = 'VPS_BONUS'
+        source[normal] = 'VPS_MATCH_BUY'
+
+        buy = is_in
+        sell = (vout > 0) & (~is_in | normal)
+        return [
+            self._frame(1, 0, {'date': date[buy], 'ticker': sym[buy], 'type': 'BUY', 'qty': vin[buy], 'price': price[buy],
+                               'value': value[buy].where(~bonus[buy], 0.0), 'source': source[buy], 'desc': desc[buy]}),
+            self._frame(1, 1, {'date': date[sell], 'ticker': sym[sell], 'type': 'SELL', 'qty': vout[sell], 'price': 0, 'value': 0, 'use_external_pnl': True}),
+        ]
+
+    def _probe_price(self, base, date, price_index):
+        """_lookup_price cho cả cột: 1 lần merge_asof 'nearest' (hòa -> ngày trước) trong ±10 ngày."""
+        price = pd.Series(0.0, index=base.index)
+        if not price_index or base.empty: return price
+        right = pd.DataFrame([(sym, o, p) for sym, (ords, prices) in price_index.items() for o, p in zip(ords, prices)],
+                             columns=['base', 'ord', 'price']).sort_values('ord', kind='stable')
+        day = date.dt.normalize()
+        left = pd.DataFrame({'_row': range(len(base)), 'base': base.values,
+                             'ord': (day - pd.Timestamp('1970-01-01')).dt.days.values + _EPOCH_ORDINAL}).sort_values('ord', kind='stable')
+        hit = pd.merge_asof(left, right, on='ord', by='base', direction='nearest', tolerance=10)
+        price.iloc[hit['_row'].values] = hit['price'].fillna(0.0).values
+        return price
+
+    # --- SHEET LÃI LỖ ---
+    def _pnl_columnar(self, df_ll):
+        c_date = next((c for c in df_ll.columns if 'ngày' in c), None)
+        c_sym = next((c for c in df_ll.columns if 'mã' in c), None)
+        c_pl = next((c for c in df_ll.columns if 'lãi' in c and 'lỗ' in c and '%' not in c), None)
+        if not (c_sym and c_pl): return []
+        val_pl = self._col_clean_num(df_ll, c_pl)
+        keep = val_pl != 0
+        date = self._col_date(df_ll, c_date)  # Không có ngày -> NaT (như _parse_rows)
+        sym = self._col_str(df_ll, c_sym).str.strip().str.upper()
+        return [self._frame(2, 0, {'date': date[keep], 'ticker': sym[keep], 'type': 'PNL_UPDATE', 'value': val_pl[keep]})]
+
+
+if __name__ == "__main__":
+    # Test nhanh: đối chiếu chế độ cột với chế độ từng dòng trên 1 file sao kê
+    # python -m processors.adapter_vps <file.xlsx>
+    import sys, time
+    path = sys.argv[1]
+    load_workbook(path)
+    res = {}
+    for mode in (False, True):
+        t0 = time.time()
+        res[mode] = pd.DataFrame(VPSAdapter(columnar=mode).parse(path))
+        print(f"{'columnar' if mode else 'iterrows'}: {len(res[mode])} events, {time.time() - t0:.2f}s")
+    pd.testing.assert_frame_equal(res[False], res[True], check_dtype=False)
+    print("✅ Hai chế độ cho kết quả giống nhau")
@@ -1,131 +1,19 @@
 # File: processors/analytics.py
 # Module: NAV Analytics (Chuẩn hóa định dạng TimeMachine cũ)
-import pandas as pd
+# Lịch sử NAV nay ghi ngay trong PortfolioEngine.run (processors/nav_history.py) - lớp này chỉ còn là lối vào
+# cho code cũ có list sự kiện mà chưa có Engine: chạy Engine 1 lần rồi đọc lịch sử đã ghi.
+from processors.engine import PortfolioEngine
+from processors.event_time import sort_events
 
 class NAVAnalytics:
-    def process_chart_data(self, events):
+    def process_chart_data(self, events, price_store=None, freq='D', basis='val'):
         """
         Input: Danh sách sự kiện (List of dicts)
         Output: DataFrame chuẩn format cũ (Tiếng Việt) để vẽ biểu đồ 2 đường.
+        Cùng 1 cách tính với PortfolioEngine.get_nav_chart_data (đã có Engine thì gọi thẳng hàm đó, không replay lại).
+        price_store: PriceStore -> giá trị kho theo giá đóng cửa trong cache.
         """
-        # 1. Sắp xếp sự kiện theo thời gian
-        # Thêm prio để đảm bảo thứ tự: Nạp tiền -> Mua -> Bán -> Chốt lãi
-        sorted_events = sorted(events, key=lambda x: (x['date'], x.get('prio', 50)))
-        
-        # 2. Các biến trạng thái (State)
-        current_cash = 0.0
-        current_deposit = 0.0 # [QUAN TRỌNG] Theo dõi vốn nạp ròng để vẽ đường Vốn
-        current_stock_value = 0.0
-        
-        # Theo dõi giá vốn từng mã để trừ kho chính xác
-        portfolio_state = {} # {Ticker: {vol, cost}}
-        
-        history = []
-        
-        for ev in sorted_events:
-            etype = ev.get('type', '')
-            
-            # Logic lấy giá trị: PNL_UPDATE lấy cả số âm, còn lại lấy số dương
-            if etype == 'PNL_UPDATE':
-                val = ev.get('value', 0)
-            else:
-                val = ev.get('value', 0) if ev.get('value', 0) > 0 else ev.get('val', 0)
-            
-            # --- A. XỬ LÝ DÒNG TIỀN (CASH & DEPOSIT) ---
-            if etype in ['NAP_TIEN', 'DEPOSIT']:
-                current_cash += val
-                current_deposit += val # Tăng vốn nạp
-            
-            elif etype in ['RUT_TIEN', 'WITHDRAW']:
-                current_cash -= val
-                current_deposit -= val # Giảm vốn nạp
-            
-            elif etype in ['PHI_THUE']:
-                current_cash -= val
-                # Phí thuế làm giảm tiền nhưng KHÔNG giảm Vốn Nạp (nó là chi phí)
-            
-            elif etype in ['CO_TUC_TIEN', 'DIVIDEND', 'BAN_TIEN_VE', 'UNG_TRUOC']:
-                current_cash += val
-            
-            elif etype == 'HOAN_UNG':
-                current_cash -= val
-            
-            elif etype == 'CASH_SNAPSHOT':
-                if val > 0: current_cash = val
-
-            # --- B. XỬ LÝ MUA/BÁN & KHO ---
-            elif etype in ['MUA', 'BUY']:
-                vol = ev.get('qty', 0)
-                price = ev.get('price', 0)
-                cost = val if val > 0 else (vol * price)
-                
-                # Mua: Trừ tiền, Cộng giá trị cổ phiếu
-                current_cash -= cost
-                current_stock_value += cost
-                
-                # Lưu state
-                sym = ev.get('ticker')
-                if sym:
-                    if sym not in portfolio_state: portfolio_state[sym] = {'vol': 0, 'cost': 0}
-                    portfolio_state[sym]['vol'] += vol
-                    portfolio_state[sym]['cost'] += cost
-
-            elif etype in ['BAN', 'SELL']:
-                vol = ev.get('qty', 0)
-                use_ext = ev.get('use_external_pnl', False)
-                sym = ev.get('ticker')
-                
-                # Tính giá vốn hàng bán để trừ kho
-                cost_of_goods = 0
-                if sym and sym in portfolio_state:
-                    p = portfolio_state[sym]
-                    if p['vol'] > 0:
-                        avg_price = p['cost'] / p['vol']
-                        cost_of_goods = vol * avg_price
-                        
-                        # Trừ kho
-                        p['vol'] -= vol
-                        p['cost'] -= cost_of_goods
-                        current_stock_value -= cost_of_goods
-                
-                # Xử lý Tiền về
-                if use_ext:
-                    # [VPS FIX]: Bán xong -> Hoàn GIÁ VỐN vào tiền mặt ngay
-                    # Để NAV không bị tụt. Lãi/Lỗ tính sau.
-                    current_cash += cost_of_goods
-                else:
-                    # [VCK]: Bán xong -> Cộng Doanh thu (Vốn + Lãi)
-                    price = ev.get('price', 0)
-                    fee = ev.get('fee', 0)
-                    revenue = (price * vol) - fee
-                    current_cash += revenue
-
-            elif etype == 'PNL_UPDATE':
-                # [VPS]: Cộng phần Lãi (hoặc trừ Lỗ) thực tế vào tiền mặt
-                current_cash += val
-
-            # --- C. SNAPSHOT CUỐI NGÀY ---
-            d_date = ev['date'].date()
-            nav = current_cash + current_stock_value
-            
-            # Logic ghi nhận dữ liệu cuối ngày
-            # Dùng tên cột Tiếng Việt y hệt TimeMachine cũ để Chart cũ hiểu
-            snapshot = {
-                'Ngày': pd.Timestamp(d_date),
-                'Tổng Tài Sản (NAV)': nav,
-                'Vốn Nạp Ròng': current_deposit, # Cột quan trọng để vẽ đường thứ 2
-                'Tiền Mặt': current_cash,
-                'Giá Trị Cổ Phiếu': current_stock_value
-            }
-            
-            if not history or history[-1]['Ngày'].date() != d_date:
-                history.append(snapshot)
-            else:
-                history[-1].update(snapshot)
-
-        # Chuyển thành DataFrame
-        df = pd.DataFrame(history)
-        if not df.empty:
-            df = df.set_index('Ngày').sort_index().reset_index()
-            
-        return df
\ No newline at end of file
+        # Thứ tự: Nạp tiền -> Mua -> Bán -> Chốt lãi (prio) như trước
+        engine = PortfolioEngine('NAV')
+        engine.run(sort_events(events))
+        return engine.get_nav_chart_data(price_store, freq, basis)
@@ -0,0 +1,272 @@
+# File: processors/batch_engine.py
+# Module: Chạy nhiều tài khoản trong 1 lượt replay (Tư vấn cập nhật hàng trăm danh mục khách hàng mỗi tối)
+# - Bảng sự kiện chung dạng cột: mã tài khoản (int32), ngày int64 ns, EventSpec - chuẩn hóa 1 lần cho cả lô tài khoản.
+# - Ngày Snapshot của từng tài khoản tính vector hóa (np.maximum.at) thay vì mỗi Engine tự quét list của mình.
+# - Mỗi tài khoản chỉ là 1 khối trạng thái (tiền, vốn, sổ lô, nhật ký) dùng chung hàm xử lý của PortfolioEngine.
+# - Báo cáo gộp đọc thẳng tổng tồn kho chạy / mảng sổ lô (không deepcopy kho như CombinedEngine cũ).
+
+import numpy as np
+import pandas as pd
+
+from processors.engine import PortfolioEngine
+from processors.event_time import NAT_NS, NS_PER_DAY, event_ns
+
+ACCOUNT_COL = 'Tài Khoản'
+
+
+class EventTable:
+    """
+    Bảng sự kiện của nhiều tài khoản (không copy dict sự kiện).
+    events[i] thuộc tài khoản ids[acct[i]], ngày ns[i], loại specs[i].
+    """
+
+    def __init__(self, events, acct, ids, registry):
+        self.events = events
+        self.acct = np.asarray(acct, 'int32')
+        self.ids = ids
+        self.ns = event_ns(events)
+        self.specs = registry.resolve_all(events)
+
+    @classmethod
+    def from_accounts(cls, accounts, registry):
+        """accounts: {mã tài khoản: list sự kiện}."""
+        ids = list(accounts)
+        events = [e for evs in accounts.values() for e in evs]
+        acct = np.repeat(np.arange(len(ids), dtype='int32'), [len(evs) for evs in accounts.values()])
+        return cls(events, acct, ids, registry)
+
+    @classmethod
+    def from_tagged(cls, events, registry, account_key='account'):
+        """List sự kiện có khóa account_key (mã tài khoản)."""
+        codes = {}
+        acct = [codes.setdefault(e.get(account_key), len(codes)) for e in events]
+        return cls(events, acct, list(codes), registry)
+
+    def symbols(self, engine):
+        """Mã CK đã chuẩn hóa (engine.clean_symbol) của từng sự kiện - mỗi giá trị thô chỉ chuẩn hóa 1 lần."""
+        if engine is None: return []
+        cache = {}; out = []
+        for e in self.events:
+            raw = e.get('ticker') or e.get('sym')
+            try: sym = cache[raw]
+            except (KeyError, TypeError):
+                sym = engine.clean_symbol(raw)
+                try: cache[raw] = sym
+                except TypeError: pass
+            out.append(sym)
+        return out
+
+    def snapshot_ns(self):
+        """Ngày CASH_SNAPSHOT muộn nhất của từng tài khoản (NAT_NS nếu không có)."""
+        out = np.full(len(self.ids), NAT_NS, 'int64')
+        mask = np.fromiter((s.name == 'CASH_SNAPSHOT' for s in self.specs), bool, len(self.specs))
+        np.maximum.at(out, self.acct[mask], self.ns[mask])
+        return out
+
+    def __len__(self): return len(self.events)
+
+
+class ConsolidatedEngine:
+    """
+    Engine "ảo" cộng dồn nhiều tài khoản cho View chỉ đọc tổng tồn kho chạy (get_portfolio_snapshot, calculate_rebalancing).
+    data[mã]['open'] = tổng 'open' các tài khoản - không chép sổ lô.
+    """
+
+    def __init__(self, engines):
+        self.real_cash_balance = sum(getattr(e, 'real_cash_balance', 0) for e in engines)
+        self.total_deposit = sum(getattr(e, 'total_deposit', 0) for e in engines)
+        self.total_profit = sum(getattr(e, 'total_profit', 0) for e in engines)
+        self.data = {}
+        for eng in engines:
+            for k, v in getattr(eng, 'data', {}).items():
+                if 'open' not in v: continue
+                tik = str(k).strip().upper()
+                pos = self.data.setdefault(tik, {'open': {'vol': 0.0, 'val': 0.0, 'adj_val': 0.0}})['open']
+                for key in ('vol', 'val', 'adj_val'): pos[key] += v['open'].get(key, 0)
+
+
+class BatchEngine:
+    """
+    Nhiều tài khoản, 1 lượt replay. Kết quả từng tài khoản giống PortfolioEngine(...).run(list sự kiện của tài khoản đó).
+    accounts: {mã tài khoản: PortfolioEngine giữ trạng thái tài khoản}.
+    """
+
+    def __init__(self, cost_method='fifo', engine_cls=PortfolioEngine):
+        self.cost_method = cost_method
+        self.engine_cls = engine_cls
+        self.accounts = {}
+        self.table = None
+
+    @classmethod
+    def from_engines(cls, engines):
+        """Gom các Engine đã chạy sẵn ({mã tài khoản: engine}, bỏ qua None) để xuất báo cáo gộp."""
+        batch = cls()
+        batch.accounts = {k: e for k, e in engines.items() if e is not None}
+        return batch
+
+    def account(self, acc_id):
+        eng = self.accounts.get(acc_id)
+        if eng is None: eng = self.accounts[acc_id] = self.engine_cls(str(acc_id), cost_method=self.cost_method)
+        return eng
+
+    def run(self, events, account_key='account'):
+        """
+        events: {mã tài khoản: list sự kiện} hoặc list sự kiện gắn khóa account_key.
+        Thứ tự sự kiện trong từng tài khoản giữ nguyên như list đầu vào.
+        """
+        reg = self.engine_cls.EVENTS
+        table = EventTable.from_accounts(events, reg) if isinstance(events, dict) else EventTable.from_tagged(events, reg, account_key)
+        self.table = table
+        engines = [self.account(a) for a in table.ids]
+        # B1: Ngày Snapshot quyền lực nhất của từng tài khoản
+        for eng, snap in zip(engines, table.snapshot_ns().tolist()):
+            if snap > eng.last_snapshot_date.value: eng.last_snapshot_date = pd.Timestamp(snap)
+            eng._history = None
+        # B2: 1 vòng qua bảng chung. Phần chung của process_event tính trước cho cả bảng:
+        # quyền cộng/trừ tiền (vector hóa theo ngày Snapshot từng tài khoản), mã CK đã chuẩn hóa, số tiền
+        snap = np.array([eng.last_snapshot_date.value for eng in engines], 'int64')
+        allow = ((table.ns != NAT_NS) & (table.ns <= snap[table.acct])).tolist()
+        acct = table.acct.tolist(); ns = table.ns.tolist(); specs = table.specs; syms = table.symbols(engines[0] if engines else None)
+        for i, e in enumerate(table.events):
+            eng = engines[acct[i]]; spec = specs[i]; ts = ns[i]
+            if ts == NAT_NS:
+                eng.process_event(e, None, spec)  # Ngày không đọc được -> đường cũ (tự đọc event['date'])
+                continue
+            eng.all_raw_events.append(e)
+            val = spec.value_of(e)
+            if not spec.needs_symbol:
+                spec.handler(eng, e, ts, val, allow[i], None, None)
+                eng._record_nav(e, ts)
+                continue
+            sym = syms[i]
+            if not sym:
+                eng._record_nav(e, ts)
+                continue
+            state = eng.data.get(sym) or eng.get_ticker_state(sym)
+            if spec.handler: spec.handler(eng, e, ts, val, allow[i], sym, state)
+            eng._record_nav(e, ts, sym, state)
+        return self
+
+    # --- BÁO CÁO ---
+    def generate_reports(self, account=None):
+        """
+        account: 1 mã tài khoản -> generate_reports() của tài khoản đó.
+        None -> (rep_sum, rep_cyc, rep_inv, rep_warn) của mọi tài khoản nối lại, cột đầu 'Tài Khoản'.
+        """
+        if account is not None: return self.accounts[account].generate_reports()
+        parts = [[], [], [], []]
+        for acc_id, eng in self.accounts.items():
+            for bucket, df in zip(parts, eng.generate_reports()):
+                if not df.empty: bucket.append(df.assign(**{ACCOUNT_COL: acc_id})[[ACCOUNT_COL, *df.columns]])
+        return tuple(pd.concat(p, ignore_index=True) if p else pd.DataFrame() for p in parts)
+
+    def cash_report(self):
+        """Tiền mặt / vốn nạp ròng / lãi đã chốt / giá trị kho theo giá vốn từng tài khoản + dòng TỔNG."""
+        rows = []
+        for acc_id, eng in self.accounts.items():
+            opens = [s['open'] for sym, s in eng.data.items() if eng.clean_symbol(sym)]
+            rows.append({ACCOUNT_COL: acc_id, 'Tiền Mặt': eng.real_cash_balance, 'Vốn Nạp Ròng': eng.total_deposit,
+                         'Lãi Đã Chốt': eng.total_profit, 'Số Mã Đang Giữ': sum(1 for p in opens if p['vol'] > 0),
+                         'Vốn Gốc Đang Giữ': sum(p['val'] for p in opens), 'Vốn Hợp Lý (Sau Cổ Tức)': sum(p['adj_val'] for p in opens)})
+        df = pd.DataFrame(rows)
+        if df.empty: return df
+        total = df.drop(columns=[ACCOUNT_COL]).sum()
+        total[ACCOUNT_COL] = 'TỔNG'
+        return pd.concat([df, total.to_frame().T[df.columns]], ignore_index=True)
+
+    def holdings(self, consolidated=False):
+        """
+        Vị thế đang mở từ tổng tồn kho chạy ('open'), không duyệt lô.
+        consolidated=True: cộng theo mã trên mọi tài khoản (Giá Vốn TB = Vốn Gốc / SL).
+        """
+        rows = []
+        for acc_id, eng in self.accounts.items():
+            for sym, s in eng.data.items():
+                p = s['open']
+                if eng.clean_symbol(sym) and p['vol'] > 0: rows.append((acc_id, sym, p['vol'], p['val'], p['adj_val']))
+        df = pd.DataFrame(rows, columns=[ACCOUNT_COL, 'Mã CK', 'SL Đang Giữ', 'Vốn Gốc (Mua)', 'Vốn Hợp Lý (Sau Cổ Tức)'])
+        if consolidated:
+            df = df.groupby('Mã CK', sort=True)[['SL Đang Giữ', 'Vốn Gốc (Mua)', 'Vốn Hợp Lý (Sau Cổ Tức)']].sum().reset_index()
+            df.insert(1, 'Số Tài Khoản', df['Mã CK'].map(pd.Series([r[1] for r in rows]).value_counts()))
+        df['Giá Vốn TB'] = df['Vốn Gốc (Mua)'] / df['SL Đang Giữ']
+        return df
+
+    def lots(self):
+        """Mọi lô đang mở của mọi tài khoản (nối mảng cột của sổ lô, không dựng dict từng lô)."""
+        acc, sym, cols = [], [], []
+        for acc_id, eng in self.accounts.items():
+            for s, state in eng.data.items():
+                inv = state['inventory']
+                if not eng.clean_symbol(s) or not len(inv): continue
+                c = inv.columns(); n = len(c['vol'])
+                acc.append(np.full(n, acc_id, dtype=object)); sym.append(np.full(n, s, dtype=object))
+                cols.append((c['date'], c['vol'], c['cost'], c['cost'] - (state['open']['div_acc'] - c['mark'])))
+        if not cols: return pd.DataFrame(columns=[ACCOUNT_COL, 'Mã CK', 'Ngày Mua', 'SL Tồn', 'Giá Vốn Gốc', 'Giá Vốn ĐC'])
+        date, vol, cost, adj = (np.concatenate(x) for x in zip(*cols))
+        return pd.DataFrame({ACCOUNT_COL: np.concatenate(acc), 'Mã CK': np.concatenate(sym), 'Ngày Mua': pd.to_datetime(date),
+                             'SL Tồn': vol, 'Giá Vốn Gốc': cost, 'Giá Vốn ĐC': adj})
+
+    def cycles(self, closed_only=False):
+        """Vòng đời đầu tư (cycle) mọi tài khoản, cột đầu 'Tài Khoản'."""
+        # Đọc thẳng cycle của từng mã (không dựng cả 4 bảng generate_reports cho mỗi tài khoản). Cột như rep_cyc.
+        acc, sym, start, end, buy, trade, div = [], [], [], [], [], [], []
+        today = []
+        for acc_id, eng in self.accounts.items():
+            for s, state in eng.data.items():
+                if not eng.clean_symbol(s) or str(s).endswith('_WFT'): continue
+                cur = [] if closed_only or not state['current_cycle'] else [state['current_cycle']]
+                for c in state['closed_cycles'] + cur:
+                    acc.append(acc_id); sym.append(s); start.append(c['start_date']); end.append(c.get('end_date'))
+                    buy.append(c['total_buy_val']); trade.append(c['trading_pl']); div.append(c['dividend_pl']); today.append(eng.today)
+        if not acc: return pd.DataFrame()
+        start = pd.DatetimeIndex(start); end_ix = pd.DatetimeIndex(end)
+        closed = ~end_ix.isna()
+        buy = np.asarray(buy, 'float64'); pl = np.add(trade, div)
+        return pd.DataFrame({ACCOUNT_COL: acc, 'Mã CK': sym, 'Ngày Bắt Đầu': start.strftime('%d/%m/%Y'),
+                             'Ngày Kết Thúc': np.where(closed, end_ix.strftime('%d/%m/%Y'), ''),
+                             'Tuổi Vòng Đời': (end_ix.where(closed, pd.DatetimeIndex(today)) - start).days,
+                             'Tổng Vốn Mua': buy, 'Lãi Giao Dịch': trade, 'Cổ Tức': div, 'Tổng Lãi Cycle': pl,
+                             '% ROI Cycle': np.divide(pl * 100, buy, out=np.zeros_like(pl), where=buy > 0),
+                             'Trạng Thái': np.where(closed, 'Đã tất toán', 'Đang nắm giữ')})
+
+    def merged_engine(self):
+        """ConsolidatedEngine cộng dồn mọi tài khoản (cho View Quản lý tài sản)."""
+        return ConsolidatedEngine(list(self.accounts.values()))
+
+    def __len__(self): return len(self.accounts)
+
+    def __repr__(self): return f"BatchEngine({len(self.accounts)} tài khoản)"
+
+
+if __name__ == "__main__":
+    # Đo thời gian: N tài khoản giả lập (lấy mẫu sự kiện từ file thật, lệch ngày), 1 lượt BatchEngine so với từng Engine riêng
+    # Kết quả được kiểm tra trong tests/test_batch_engine.py
+    # python -m processors.batch_engine vck|vps <file.xlsx> [số tài khoản]
+    import contextlib, io, random, sys, time
+    from processors.adapter_vck import VCKAdapter
+    from processors.adapter_vps import VPSAdapter
+    kind, path_xlsx = sys.argv[1:3]
+    n_acc = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+    with contextlib.redirect_stdout(io.StringIO()):
+        base = (VCKAdapter if kind == 'vck' else VPSAdapter)().parse(path_xlsx)
+    r = random.Random(11)
+    accounts = {}
+    for a in range(n_acc):
+        k = r.randint(len(base) // 4, len(base) // 2); start = r.randint(0, len(base) - k)
+        shift = pd.Timedelta(days=r.randint(0, 30))
+        accounts[f"KH{a:04d}"] = [{**e, 'date': e['date'] + shift} for e in base[start:start + k]]
+    n_ev = sum(len(v) for v in accounts.values())
+
+    t0 = time.time()
+    single = {}
+    for a, evs in accounts.items():
+        single[a] = PortfolioEngine(a); single[a].run(evs)
+    t_single = time.time() - t0
+    t0 = time.time(); batch = BatchEngine().run(accounts); t_batch = time.time() - t0
+    print(f"{n_acc} tài khoản, {n_ev} sự kiện: từng Engine {t_single:.2f}s, BatchEngine {t_batch:.2f}s")
+
+
+    t0 = time.time()
+    cash = batch.cash_report(); hold = batch.holdings(consolidated=True); lots = batch.lots(); cyc = batch.cycles()
+    t_rep = time.time() - t0
+    print(f"Báo cáo gộp (tiền, vị thế, {len(lots)} lô, {len(cyc)} cycle): {t_rep:.2f}s")
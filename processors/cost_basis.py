@@ -0,0 +1,160 @@
+# File: processors/cost_basis.py
+# Module: Phương pháp tính giá vốn hàng bán cho sổ lô (processors/lot_ledger.py)
+# - fifo   : Nhập trước xuất trước - con trỏ đầu sổ (như deque.popleft cũ).
+# - lifo   : Nhập sau xuất trước - lấy từ cuối sổ (ngăn xếp).
+# - average: Bình quân gia quyền di động - lô vẫn ra theo FIFO (tuổi kho), giá vốn = tổng vốn / tổng SL đang giữ.
+# - hifo   : Giá cao xuất trước - heap theo giá vốn, lô bán hết để lại "lỗ hổng" trong mảng, dọn khi cấp phát lại.
+# Mỗi lần bán: O(số lô chạm tới) cho fifo/lifo/average, O(số lô chạm tới * log n) cho hifo.
+
+import heapq
+
+import numpy as np
+
+DUST_VOL = 0.0001  # Lô còn <= mức này sau khi bán -> bỏ khỏi kho (giống inv.popleft() cũ)
+
+_EMPTY_TAKE = np.empty(0, 'float64')
+
+
+def _empty(h):
+    return _EMPTY_TAKE, slice(h, h), 0.0
+
+
+class CostBasis:
+    """
+    Giao diện phương pháp giá vốn. consume(led, qty) trả về (take, idx, dust):
+    take[i] = SL lấy từ lô idx[i] (slice hoặc mảng chỉ số vào led.cost/mark/date), theo thứ tự lấy,
+    dust = tổng phần lẻ còn sót của các lô bị bỏ khỏi kho (mỗi lô <= DUST_VOL).
+    """
+    name = ''
+    label = ''
+    pooled = False  # True: giá vốn hàng bán = bình quân cả kho thay vì giá từng lô
+
+    def reset(self, led): pass              # Sau khi sổ cấp phát lại / nạp từ pickle
+    def on_append(self, led, i): pass       # Sau khi thêm lô ở vị trí i
+    def consume(self, led, qty): raise NotImplementedError
+
+
+class FIFO(CostBasis):
+    name = 'fifo'
+    label = 'FIFO (Nhập trước xuất trước)'
+
+    def consume(self, led, qty):
+        h, n = led.head, led.size
+        if qty <= 0 or h >= n: return _empty(h)
+        v = float(led.vol[h])
+        if v >= qty:
+            # Trường hợp phổ biến: lô đầu sổ đủ hàng -> không cần cumsum
+            rest = v - qty; led.vol[h] = rest
+            if rest <= DUST_VOL:
+                led.head = h + 1
+                return np.array([qty], 'float64'), slice(h, h + 1), rest
+            return np.array([qty], 'float64'), slice(h, h + 1), 0.0
+        # Cửa sổ tăng dần từ đầu sổ: lệnh bán thường chỉ chạm vài lô đầu, không cumsum cả kho
+        w = 8
+        while True:
+            end = min(h + w, n)
+            cs = np.cumsum(led.vol[h:end])
+            if cs[-1] >= qty or end == n: break
+            w *= 4
+
+        dust = 0.0
+        if cs[-1] < qty:
+            # Bán quá tồn kho -> lấy hết
+            take = led.vol[h:end].copy()
+            led.vol[h:end] = 0.0
+            led.head = end
+        else:
+            k = int(np.searchsorted(cs, qty, side='left'))  # Lô đầu tiên mà lũy kế chạm qty
+            take = led.vol[h:h + k + 1].copy()
+            take[k] = qty - (cs[k - 1] if k else 0.0)
+            led.vol[h:h + k] = 0.0
+            rest = led.vol[h + k] - take[k]
+            led.vol[h + k] = rest
+            if rest <= DUST_VOL:
+                dust = float(rest); led.head = h + k + 1
+            else:
+                led.head = h + k
+        return take, slice(h, h + len(take)), dust
+
+
+class LIFO(CostBasis):
+    name = 'lifo'
+    label = 'LIFO (Nhập sau xuất trước)'
+
+    def consume(self, led, qty):
+        h, n = led.head, led.size
+        if qty <= 0 or h >= n: return _empty(h)
+        # Cửa sổ tăng dần từ cuối sổ, lũy kế theo thứ tự lấy (lô mới nhất trước)
+        w = 8
+        while True:
+            start = max(h, n - w)
+            cs = np.cumsum(led.vol[start:n][::-1])
+            if cs[-1] >= qty or start == h: break
+            w *= 4
+
+        dust = 0.0
+        if cs[-1] < qty:
+            take = led.vol[start:n][::-1].copy()
+            led.vol[start:n] = 0.0
+            led.size = start
+            k = len(take) - 1
+        else:
+            k = int(np.searchsorted(cs, qty, side='left'))
+            take = led.vol[n - k - 1:n][::-1].copy()
+            take[k] = qty - (cs[k - 1] if k else 0.0)
+            led.vol[n - k:n] = 0.0
+            rest = led.vol[n - k - 1] - take[k]
+            led.vol[n - k - 1] = rest
+            if rest <= DUST_VOL:
+                dust = float(rest); led.size = n - k - 1
+            else:
+                led.size = n - k
+        return take, np.arange(n - 1, n - k - 2, -1), dust
+
+
+class MovingAverage(FIFO):
+    name = 'average'
+    label = 'Bình quân gia quyền di động'
+    pooled = True
+
+
+class HighestCostFirst(CostBasis):
+    name = 'hifo'
+    label = 'Giá cao xuất trước'
+
+    def reset(self, led):
+        live = np.flatnonzero(led.vol[led.head:led.size] > 0) + led.head
+        led.heap = list(zip((-led.cost[live]).tolist(), live.tolist()))
+        heapq.heapify(led.heap)
+
+    def on_append(self, led, i):
+        heapq.heappush(led.heap, (-float(led.cost[i]), i))
+
+    def consume(self, led, qty):
+        heap = led.heap
+        if qty <= 0 or not heap: return _empty(led.head)
+        take, idx, dust = [], [], 0.0
+        while qty > 0 and heap:
+            i = heap[0][1]
+            v = float(led.vol[i]); t = min(qty, v)
+            rest = v - t; qty -= t
+            take.append(t); idx.append(i)
+            if rest <= DUST_VOL:
+                heapq.heappop(heap)
+                dust += rest; led.vol[i] = 0.0; led.dead += 1
+            else:
+                led.vol[i] = rest
+        # Dọn lô đã hết ở 2 đầu sổ (amortized O(1))
+        while led.head < led.size and led.vol[led.head] == 0: led.head += 1; led.dead -= 1
+        while led.size > led.head and led.vol[led.size - 1] == 0: led.size -= 1; led.dead -= 1
+        return np.array(take, 'float64'), np.array(idx, 'int64'), dust
+
+
+COST_METHODS = {m.name: m for m in (FIFO(), LIFO(), MovingAverage(), HighestCostFirst())}
+
+
+def get_method(method):
+    """Tên ('fifo', 'lifo', 'average', 'hifo') hoặc 1 đối tượng CostBasis tự viết."""
+    if isinstance(method, CostBasis): return method
+    try: return COST_METHODS[str(method).lower()]
+    except KeyError: raise ValueError(f"Phương pháp giá vốn không hỗ trợ: {method} (có: {', '.join(COST_METHODS)})")
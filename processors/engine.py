@@ -1,33 +1,109 @@
 # File: processors/engine.py
-# Version: FIXED HUNTER LOGIC (STORE SOURCE IN INVENTORY)
+# Version: FIXED HUNTER LOGIC (STORE SOURCE IN INVENTORY) + LOT LEDGER (Kho lô dạng mảng - processors/lot_ledger.py)
 
-from collections import deque
+import pickle
+import zlib
+import numpy as np
 import pandas as pd
 from datetime import datetime
-from processors.analytics import NAVAnalytics # Module vẽ biểu đồ
+from processors.cost_basis import COST_METHODS, get_method
+from processors.event_registry import EventRegistry
+from processors.event_time import NAT_NS, NS_PER_DAY, event_ns
+from processors.lot_ledger import LotLedger
+from processors.nav_history import NAVRecorder
+from processors.engine_checkpoint import prefix_digest, segment_digest
+from processors.trade_log import TradeLog
 
 class PortfolioEngine:
+    # Đổi logic xử lý sự kiện -> tăng số này để checkpoint cũ bị bỏ qua
+    CHECKPOINT_VERSION = 5
+    _CHECKPOINT_FIELDS = ('last_snapshot_date', 'total_deposit', 'real_cash_balance', 'total_profit', 'data', 'trade_log', 'nav')
+    # state_as_of: chụp trạng thái nội bộ sau mỗi SNAPSHOT_EVERY sự kiện -> mỗi truy vấn chỉ replay tối đa chừng đó sự kiện
+    SNAPSHOT_EVERY = 500
+    # Loại sự kiện -> hàm xử lý (đăng ký cuối file / register_event)
+    EVENTS = EventRegistry()
+
     # --- [MỚI] HÀM CHẠY TỔNG HỢP (Gọi hàm này thay vì loop bên ngoài) ---
-    def run(self, events):
+    def run(self, events, checkpoint=None, checkpoint_at=None, checkpoint_min=1):
         """
         Xử lý danh sách sự kiện với logic Snapshot Authority.
         1. Quét tìm ngày Snapshot mới nhất.
         2. Chạy xử lý từng sự kiện.
+        checkpoint: bytes từ lần chạy trước (self.last_checkpoint). Còn khớp phần đầu list -> nạp lại, chỉ chạy phần sau.
+        checkpoint_at: chạy xong bao nhiêu sự kiện thì chốt self.last_checkpoint (None = không chốt).
+        checkpoint_min: chỉ chốt khi đã chạy thêm ít nhất chừng đó sự kiện sau checkpoint nạp vào (đóng gói cũng tốn thời gian).
         """
-        # B1: Tìm ngày Snapshot quyền lực nhất
-        for e in events:
-            if e.get('type') == 'CASH_SNAPSHOT':
-                try:
-                    d = pd.Timestamp(e['date'])
-                    if d > self.last_snapshot_date: self.last_snapshot_date = d
-                except: pass
+        # B1: Tìm ngày Snapshot quyền lực nhất (ngày mọi sự kiện đổi sang int64 ns 1 lần - processors/event_time.py)
+        ns = event_ns(events)
+        snap = [i for i, e in enumerate(events) if e.get('type') == 'CASH_SNAPSHOT']
+        if snap:
+            d = int(ns[snap].max())  # NaT = số nhỏ nhất -> không bao giờ được chọn
+            if d > self.last_snapshot_date.value: self.last_snapshot_date = pd.Timestamp(d)
         
-        # B2: Xử lý sự kiện
-        for e in events:
-            self.process_event(e)
-
-    def __init__(self, source_name="Unknown"):
+        # B2: Xử lý sự kiện (bỏ qua phần đã có trong checkpoint)
+        self._history = None
+        self._chain = None
+        # Sổ so sánh phương pháp giá vốn không nằm trong checkpoint -> chạy từ đầu
+        start = self.resumed_from = self._resume(checkpoint, events, ns) if (checkpoint and not self._basis_books) else 0
+        ns_arr, ns = ns, ns.tolist()
+        specs = self.EVENTS.resolve_all(events)  # Tên đồng nghĩa (MUA/BUY...) phân giải 1 lần
+        for i in range(start, len(events)):
+            if i == checkpoint_at and i - start >= max(checkpoint_min, 1): self.last_checkpoint = self.checkpoint(ns_arr)
+            self.process_event(events[i], ns[i], specs[i])
+        if checkpoint_at == len(events) and checkpoint_at - start >= max(checkpoint_min, 1): self.last_checkpoint = self.checkpoint(ns_arr)
+
+    def checkpoint(self, ns=None):
+        """
+        Trạng thái sau các sự kiện đã chạy, đóng gói pickle + zlib (bytes) kèm số sự kiện và hash phần đầu.
+        ns: event_ns() của list đang chạy (tránh đổi ngày lại), None = tự tính từ all_raw_events.
+        """
+        n = len(self.all_raw_events)
+        ns = ns if ns is not None else event_ns(self.all_raw_events)
+        # Hash nối tiếp từ checkpoint đã nạp (chỉ hash đoạn mới), không có thì hash cả phần đầu
+        bounds, digest = self._chain or ([], b'')
+        if not bounds or bounds[-1] != n:
+            digest = segment_digest(self.all_raw_events, ns, bounds[-1] if bounds else 0, n, digest)
+            bounds = bounds + [n]
+        state = {f: getattr(self, f) for f in self._CHECKPOINT_FIELDS}
+        state.update({
+            'version': self.CHECKPOINT_VERSION, 'cost_method': self.cost_method.name, 'n_events': n, 'trade_log_offset': len(self.trade_log),
+            'event_types': self.EVENTS.signature(),
+            'max_date': pd.Timestamp(int(ns[:n].max())) if n else pd.NaT, 'bounds': bounds, 'digest': digest,
+        })
+        return zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+    def _resume(self, checkpoint, events, ns):
+        """Nạp checkpoint nếu còn khớp list sự kiện mới. Trả về số sự kiện đã chạy sẵn (0 = chạy lại từ đầu)."""
+        try:
+            cp = pickle.loads(zlib.decompress(checkpoint))
+            n = cp['n_events']
+            if cp.get('version') != self.CHECKPOINT_VERSION or not 0 < n <= len(events): return 0
+            if cp.get('cost_method') != self.cost_method.name: return 0
+            if cp.get('event_types') != self.EVENTS.signature(): return 0  # Bảng loại sự kiện đã đổi (register_event)
+            # Ngày Snapshot đổi -> quyền cộng/trừ tiền của sự kiện cũ có thể đổi theo.
+            # Vẫn dùng được nếu cả 2 ngày Snapshot đều không sớm hơn sự kiện muộn nhất trong checkpoint.
+            old_snap, new_snap = cp['last_snapshot_date'], self.last_snapshot_date
+            if old_snap != new_snap and not (pd.notna(cp['max_date']) and min(old_snap, new_snap) >= cp['max_date']): return 0
+            if cp['bounds'][-1] != n or cp['digest'] != prefix_digest(events, ns, cp['bounds']): return 0  # Chỉ hash n sự kiện đầu
+        except Exception: return 0
+        for f in self._CHECKPOINT_FIELDS:
+            if f != 'last_snapshot_date': setattr(self, f, cp[f])
+        del self.trade_log[cp['trade_log_offset']:]
+        self._chain = (cp['bounds'], cp['digest'])
+        self.all_raw_events = list(events[:n])
+        return n
+
+    def __init__(self, source_name="Unknown", cost_method='fifo', compare_methods=None):
+        """
+        cost_method: phương pháp giá vốn hàng bán ('fifo', 'lifo', 'average', 'hifo' - processors/cost_basis.py).
+        compare_methods: True (mọi phương pháp) hoặc list tên -> cùng lượt replay, tính thêm Lãi/Lỗ giao dịch
+                         theo từng phương pháp trên sổ lô riêng (xem cost_basis_report()).
+        """
         self.source_name = source_name
+        self.cost_method = get_method(cost_method)
+        methods = list(COST_METHODS) if compare_methods is True else list(compare_methods or [])
+        # {tên phương pháp: {mã: {'inventory', 'open', 'trading_pl', 'sell_cost'}}}
+        self._basis_books = {get_method(m).name: {} for m in methods} or None
         self.today = pd.Timestamp.now().normalize()
         # [MỚI] Biến lưu ngày Snapshot cuối cùng tìm thấy
         self.last_snapshot_date = pd.Timestamp.min
@@ -37,8 +113,15 @@ class PortfolioEngine:
         self.total_profit = 0.0
         
         self.data = {}
-        self.trade_log = []
+        self.trade_log = TradeLog()  # Dạng cột (processors/trade_log.py), đọc chung qua trade_log_frame()
         self.all_raw_events = [] 
+        self.nav = NAVRecorder()  # Lịch sử NAV sau từng sự kiện, ghi trong lượt replay (processors/nav_history.py)
+        # Checkpoint (processors/engine_checkpoint.py): số sự kiện nạp sẵn từ checkpoint + checkpoint mới nhất (bytes)
+        self.resumed_from = 0
+        self.last_checkpoint = None
+        self._chain = None  # (ranh giới các đoạn, hash) của checkpoint đã nạp - checkpoint mới hash nối tiếp
+        # state_as_of: (ngày lũy tiến từng sự kiện, [(số sự kiện, trạng thái pickle)]) - dựng khi hỏi lần đầu
+        self._history = None
 
     def clean_symbol(self, sym):
         if pd.isna(sym) or sym is None: return None
@@ -51,7 +134,10 @@ class PortfolioEngine:
         if not clean_sym: return None
         if clean_sym not in self.data:
             self.data[clean_sym] = {
-                'inventory': deque(), 'closed_cycles': [], 'current_cycle': None,      
+                'inventory': LotLedger(method=self.cost_method), 'closed_cycles': [], 'current_cycle': None,      
+                # Tổng tồn kho chạy (cập nhật O(1) khi thêm/bán/hạ giá vốn lô): SL, vốn gốc, vốn điều chỉnh
+                # div_acc: tổng giá vốn đã hạ trên mỗi cổ phiếu (cổ tức) kể từ khi kho trống lần cuối
+                'open': {'vol': 0.0, 'val': 0.0, 'adj_val': 0.0, 'div_acc': 0.0},
                 'stats': {
                     'total_sold_vol': 0, 'total_trading_pl': 0, 'total_dividend': 0, 
                     'total_invested_capital': 0, 'total_sell_cost': 0, 'weighted_sold_days': 0,
@@ -69,196 +155,295 @@ class PortfolioEngine:
         """
         res = {}
         for sym, state in self.data.items():
-            # Chuyển deque thành list để View dễ xử lý
-            res[sym] = list(state['inventory'])
+            # Chuyển sổ lô thành list dict để View dễ xử lý (kèm adj_cost đã tính sẵn)
+            res[sym] = [{**b, 'adj_cost': self.lot_adj_cost(state, b)} for b in state['inventory']]
         return res
 
-    def process_event(self, event):
+    @staticmethod
+    def lot_adj_cost(state, batch):
+        """Giá vốn điều chỉnh của 1 lô = giá gốc - phần cổ tức tích lũy từ lúc lô nhập kho."""
+        return batch['cost'] - (state['open']['div_acc'] - batch['div_mark'])
+
+    def adjust_inventory_cost(self, symbol, per_share, until=None):
+        """
+        Hạ giá vốn điều chỉnh của các lô tồn kho mua trước/trong ngày `until` (None = mọi lô).
+        Tăng div_acc 1 lần (O(1)); chỉ các lô mua SAU `until` (nằm cuối kho FIFO) được dời mốc để giữ nguyên giá.
+        Lịch sử NAV (basis='adj') hạ vốn theo từ ngày `until` (None: từ ngày sự kiện cuối) - các lô này giữ liên tục tới nay.
+        """
+        symbol = self.clean_symbol(symbol)
+        state = self.data.get(symbol)
+        if not state: return
+        inv = state['inventory']; pos = state['open']
+        if not inv: return
+        vol_adj = pos['vol']
+        if until is not None: vol_adj -= inv.rebase_after(until, per_share)
+        pos['div_acc'] += per_share
+        pos['adj_val'] -= per_share * vol_adj
+        if until is not None: start = pd.Timestamp(until).normalize().value
+        elif len(self.nav): start = self.nav.rows[-1][0] // NS_PER_DAY * NS_PER_DAY
+        else: return
+        self.nav.adjust_cost(start, symbol, -per_share * vol_adj)
+
+    def process_event(self, event, ts=None, spec=None):
+        """
+        ts: ngày sự kiện dạng int64 ns đã chuẩn hóa sẵn (event_ns) - None thì tự đọc event['date'].
+        spec: EventSpec đã phân giải sẵn (EVENTS.resolve_all) - None thì tra theo event['type'].
+        """
         # 1. Lưu sự kiện raw
         self.all_raw_events.append(event)
         
-        try: date_obj = pd.Timestamp(event['date'])
-        except: return
+        if ts is None or ts == NAT_NS:
+            try: ts = pd.Timestamp(event['date']).value
+            except: return
 
-        etype = event.get('type', '')
-        
-        # Logic lấy giá trị
-        if etype == 'PNL_UPDATE': val = event.get('value', 0)
-        else: val = event.get('value', 0) if event.get('value', 0) > 0 else event.get('val', 0)
+        # 2. Tra bảng loại sự kiện (processors/event_registry.py) thay chuỗi if/elif
+        _, handler, needs_symbol, value_of = spec or self.EVENTS.resolve(event.get('type', ''))
+        val = value_of(event)
 
         # [QUAN TRỌNG] Kiểm tra quyền cập nhật tiền mặt
         # Chỉ cho phép cộng/trừ tiền nếu ngày giao dịch <= ngày Snapshot cuối cùng
         # Riêng CASH_SNAPSHOT thì luôn được phép chạy để reset số dư
-        allow_cash_update = (date_obj <= self.last_snapshot_date)
+        allow_cash_update = ts != NAT_NS and ts <= self.last_snapshot_date.value
 
         # --- XỬ LÝ DÒNG TIỀN (Non-Trading) ---
-        if etype == 'CASH_SNAPSHOT':
-            self.real_cash_balance = val # Luôn reset theo số thực tế
-            return
-
-        if etype == 'PHI_THUE':
-            if allow_cash_update:
-                self.real_cash_balance -= val
-                self.total_profit -= val 
-            self.trade_log.append({'Ngày': date_obj, 'Mã': 'PHÍ', 'Loại': 'PHÍ/THUẾ', 'SL': 0, 'Giá Bán': 0, 'Giá Vốn': 0, 'Lãi/Lỗ': -val, 'Nguồn': event.get('desc', 'Chi phí')})
-            return
-
-        if etype in ['NAP_TIEN', 'DEPOSIT']:
-            if allow_cash_update:
-                self.total_deposit += val
-                self.real_cash_balance += val
-            return
-
-        if etype in ['RUT_TIEN', 'WITHDRAW']:
-            if allow_cash_update:
-                self.total_deposit -= val
-                self.real_cash_balance -= val
-            return
-
-        if etype in ['BAN_TIEN_VE', 'UNG_TRUOC']:
-            if allow_cash_update and val > 0: 
-                self.real_cash_balance += val
-            return
-        
-        if etype == 'HOAN_UNG':
-            if allow_cash_update:
-                self.real_cash_balance -= val
+        if not needs_symbol:
+            handler(self, event, ts, val, allow_cash_update, None, None)
+            self._record_nav(event, ts)
             return
 
         # --- KHỚP LỆNH (Trading) ---
         raw_sym = event.get('ticker') or event.get('sym')
         symbol = self.clean_symbol(raw_sym)
-        if not symbol: return 
+        if not symbol:
+            self._record_nav(event, ts)
+            return 
 
         state = self.get_ticker_state(symbol)
-        inv = state['inventory']
-        stats = state['stats']
+        if handler: handler(self, event, ts, val, allow_cash_update, symbol, state)
+        self._record_nav(event, ts, symbol, state)
 
-        if etype == 'PNL_UPDATE':
-            stats['total_trading_pl'] += val
-            stats['has_external_pnl'] = True
-            
-            if allow_cash_update:
-                self.total_profit += val 
-                self.real_cash_balance += val 
-            
-            self.trade_log.append({'Ngày': date_obj, 'Mã': symbol, 'Loại': 'CHỐT LÃI (FILE)', 'SL': 0, 'Giá Bán': 0, 'Giá Vốn': 0, 'Lãi/Lỗ': val, 'Nguồn': 'Excel PnL'})
-            if state['current_cycle']: state['current_cycle']['trading_pl'] += val
+    def _record_nav(self, event, ts, symbol=None, state=None):
+        """Ghi trạng thái sau sự kiện vào lịch sử NAV (tiền, vốn nạp, lãi chốt + tồn kho của mã vừa đổi)."""
+        if ts == NAT_NS: return
+        self.nav.record(ts, event.get('type', ''), self.real_cash_balance, self.total_deposit, self.total_profit,
+                        symbol, state['open'] if state else None)
 
-        elif etype in ['MUA', 'BUY']:
-            vol = event.get('qty', 0) or event.get('vol', 0)
-            price = event.get('price', 0)
-            cost = val if val > 0 else (vol * price)
-            
-            # [LOGIC MỚI] Chỉ trừ tiền nếu nằm trong phạm vi Snapshot cho phép
-            # Hoặc nếu là nguồn đặc biệt (Quyền/IPO) thì tùy logic Adapter đã xử lý tiền chưa, 
-            # nhưng ở đây ta bám theo allow_cash_update là an toàn nhất.
-            if allow_cash_update:
-                self.real_cash_balance -= cost
-            
-            # Inventory thì LUÔN LUÔN cập nhật (để tính NAV cổ phiếu)
-            raw_source = str(event.get('source', 'UNKNOWN'))
-            raw_desc = str(event.get('desc', ''))
-
-            if vol > 0:
-                unit_cost = cost / vol
-                inv.append({
-                    'date': date_obj, 'vol': vol, 'cost': unit_cost, 'adj_cost': unit_cost,
-                    'source': raw_source, 'desc': raw_desc
-                })
-                
-                stats['total_invested_capital'] += cost
-                if state['current_cycle'] is None: state['current_cycle'] = {'start_date': date_obj, 'total_buy_val': 0, 'total_buy_vol': 0, 'total_sell_val': 0, 'total_sell_vol': 0, 'trading_pl': 0, 'dividend_pl': 0, 'status': 'Open'}
-                cyc = state['current_cycle']
-                cyc['total_buy_val'] += cost; cyc['total_buy_vol'] += vol
-                
-                # Display Source Logic
-                if 'IPO' in raw_source.upper() or 'DEAL' in raw_source.upper(): disp_source = 'Mua IPO/Deal'
-                elif any(k in raw_source.upper() for k in ['CONVERT', 'WFT', 'RIGHTS', 'BONUS']): disp_source = 'Chuyển Đổi/Quyền'
-                else: disp_source = 'Giao Dịch Mua'
-
-                self.trade_log.append({'Ngày': date_obj, 'Mã': symbol, 'Loại': 'MUA', 'SL': vol, 'Giá Vốn': unit_cost, 'Lãi/Lỗ': 0, 'Nguồn': disp_source})
-
-        elif etype in ['BAN', 'SELL']:
-            vol = event.get('qty', 0) or event.get('vol', 0)
-            price = event.get('price', 0)
-            use_ext_pnl = event.get('use_external_pnl', False)
-            net_rev = (price * vol) - event.get('fee', 0)
-            
-            qty_needed = vol; cost_goods = 0 
-            while qty_needed > 0 and inv:
-                batch = inv[0]
-                take = min(qty_needed, batch['vol'])
-                cost_goods += take * batch['cost']
-                stats['weighted_sold_days'] += (date_obj - batch['date']).days * take
-                batch['vol'] -= take; qty_needed -= take
-                if batch['vol'] <= 0.0001: inv.popleft()
-
-            pl_deal = 0 if use_ext_pnl else (net_rev - cost_goods)
-            if not use_ext_pnl: 
-                stats['total_trading_pl'] += pl_deal
-                if allow_cash_update: self.total_profit += pl_deal 
-                
-            stats['total_sold_vol'] += vol
-            stats['total_sell_cost'] += cost_goods 
-            
-            # Chỉ cộng tiền bán về nếu cho phép
-            if use_ext_pnl:
-                if allow_cash_update: self.real_cash_balance += cost_goods 
-            
-            self.trade_log.append({'Ngày': date_obj, 'Mã': symbol, 'Loại': 'BÁN', 'SL': vol, 'Giá Bán': price, 'Giá Vốn': cost_goods/vol if vol>0 else 0, 'Lãi/Lỗ': pl_deal, 'Nguồn': 'Giao Dịch Bán'})
-            if state['current_cycle']:
-                cyc = state['current_cycle']
-                cyc['total_sell_val'] += net_rev; cyc['total_sell_vol'] += vol
-                if not use_ext_pnl: cyc['trading_pl'] += pl_deal
-                if sum(b['vol'] for b in inv) <= 0.001:
-                    cyc['end_date'] = date_obj; cyc['status'] = 'Closed'
-                    state['closed_cycles'].append(cyc); state['current_cycle'] = None
-
-        elif etype in ['CO_TUC_TIEN', 'DIVIDEND']:
-            val = event.get('val', 0) or event.get('value', 0)
+    @classmethod
+    def register_event(cls, etype, handler, aliases=(), needs_symbol=True, value='default'):
+        """
+        Đăng ký loại sự kiện mới / thay hàm xử lý loại có sẵn (vd: 'SPLIT' chia tách, 'MARGIN_INTEREST' lãi vay).
+        handler(engine, event, ts, val, allow_cash_update, symbol, state):
+          ts = ngày int64 ns, val = số tiền theo quy tắc `value` (VALUE_RULES hoặc hàm), allow_cash_update = được cộng/trừ tiền,
+          symbol / state = mã CK và engine.data[symbol] (None nếu needs_symbol=False).
+        Đăng ký trên lớp con chỉ ảnh hưởng lớp con đó.
+        """
+        if 'EVENTS' not in cls.__dict__: cls.EVENTS = cls.EVENTS.copy()
+        return cls.EVENTS.register(etype, handler, aliases, needs_symbol, value)
+
+    # --- HÀM XỬ LÝ TỪNG LOẠI SỰ KIỆN (đăng ký vào EVENTS cuối file) ---
+    def _on_cash_snapshot(self, event, ts, val, allow_cash_update, symbol, state):
+        self.real_cash_balance = val # Luôn reset theo số thực tế
+
+    def _on_tax_fee(self, event, ts, val, allow_cash_update, symbol, state):
+        if allow_cash_update:
+            self.real_cash_balance -= val
+            self.total_profit -= val 
+        self.trade_log.add(ts, 'PHÍ', 'PHÍ/THUẾ', 0, 0, 0, -val, event.get('desc', 'Chi phí'))
+
+    def _on_deposit(self, event, ts, val, allow_cash_update, symbol, state):
+        if allow_cash_update:
+            self.total_deposit += val
+            self.real_cash_balance += val
+
+    def _on_withdraw(self, event, ts, val, allow_cash_update, symbol, state):
+        if allow_cash_update:
+            self.total_deposit -= val
+            self.real_cash_balance -= val
+
+    def _on_cash_in(self, event, ts, val, allow_cash_update, symbol, state):
+        if allow_cash_update and val > 0: 
+            self.real_cash_balance += val
+
+    def _on_advance_repay(self, event, ts, val, allow_cash_update, symbol, state):
+        if allow_cash_update:
+            self.real_cash_balance -= val
+
+    def _on_pnl_update(self, event, ts, val, allow_cash_update, symbol, state):
+        stats = state['stats']
+        stats['total_trading_pl'] += val
+        stats['has_external_pnl'] = True
+        
+        if allow_cash_update:
+            self.total_profit += val 
+            self.real_cash_balance += val 
+        
+        self.trade_log.add(ts, symbol, 'CHỐT LÃI (FILE)', 0, 0, 0, val, 'Excel PnL')
+        if state['current_cycle']: state['current_cycle']['trading_pl'] += val
+
+    def _on_buy(self, event, ts, val, allow_cash_update, symbol, state):
+        inv = state['inventory']; stats = state['stats']; pos = state['open']
+        vol = event.get('qty', 0) or event.get('vol', 0)
+        price = event.get('price', 0)
+        cost = val if val > 0 else (vol * price)
+        
+        # [LOGIC MỚI] Chỉ trừ tiền nếu nằm trong phạm vi Snapshot cho phép
+        # Hoặc nếu là nguồn đặc biệt (Quyền/IPO) thì tùy logic Adapter đã xử lý tiền chưa, 
+        # nhưng ở đây ta bám theo allow_cash_update là an toàn nhất.
+        if allow_cash_update:
+            self.real_cash_balance -= cost
+        
+        # Inventory thì LUÔN LUÔN cập nhật (để tính NAV cổ phiếu)
+        raw_source = str(event.get('source', 'UNKNOWN'))
+        raw_desc = str(event.get('desc', ''))
+
+        if vol > 0:
+            unit_cost = cost / vol
+            inv.append(ts, vol, unit_cost, pos['div_acc'], raw_source, raw_desc)
+            pos['vol'] += vol; pos['val'] += vol * unit_cost; pos['adj_val'] += vol * unit_cost
+            if self._basis_books:
+                for book in self._basis_book_states(symbol):
+                    book['inventory'].append(ts, vol, unit_cost, 0.0, raw_source, raw_desc)
+                    bpos = book['open']; bpos['vol'] += vol; bpos['val'] += vol * unit_cost; bpos['adj_val'] += vol * unit_cost
             
-            if allow_cash_update:
-                self.real_cash_balance += val
-                self.total_profit += val 
+            stats['total_invested_capital'] += cost
+            if state['current_cycle'] is None: state['current_cycle'] = {'start_date': pd.Timestamp(ts), 'total_buy_val': 0, 'total_buy_vol': 0, 'total_sell_val': 0, 'total_sell_vol': 0, 'trading_pl': 0, 'dividend_pl': 0, 'status': 'Open'}
+            cyc = state['current_cycle']
+            cyc['total_buy_val'] += cost; cyc['total_buy_vol'] += vol
             
-            stats['total_dividend'] += val
-            if state['current_cycle']: state['current_cycle']['dividend_pl'] += val
-            self.trade_log.append({'Ngày': date_obj, 'Mã': symbol, 'Loại': 'CỔ TỨC', 'SL': 0, 'Giá Bán': 0, 'Giá Vốn': 0, 'Lãi/Lỗ': val, 'Nguồn': 'Nhận Cổ Tức'})
+            # Display Source Logic
+            if 'IPO' in raw_source.upper() or 'DEAL' in raw_source.upper(): disp_source = 'Mua IPO/Deal'
+            elif any(k in raw_source.upper() for k in ['CONVERT', 'WFT', 'RIGHTS', 'BONUS']): disp_source = 'Chuyển Đổi/Quyền'
+            else: disp_source = 'Giao Dịch Mua'
+
+            self.trade_log.add(ts, symbol, 'MUA', vol, np.nan, unit_cost, 0, disp_source)  # Lệnh mua không có 'Giá Bán'
+
+    def _on_sell(self, event, ts, val, allow_cash_update, symbol, state):
+        inv = state['inventory']; stats = state['stats']; pos = state['open']
+        vol = event.get('qty', 0) or event.get('vol', 0)
+        price = event.get('price', 0)
+        use_ext_pnl = event.get('use_external_pnl', False)
+        net_rev = (price * vol) - event.get('fee', 0)
+        
+        cost_goods, held_days = self._take_lots(inv, pos, vol, ts)
+        stats['weighted_sold_days'] += held_days
+        if self._basis_books:
+            for book in self._basis_book_states(symbol):
+                b_cost, _ = self._take_lots(book['inventory'], book['open'], vol, ts)
+                book['sell_cost'] += b_cost
+                if not use_ext_pnl: book['trading_pl'] += net_rev - b_cost
+
+        pl_deal = 0 if use_ext_pnl else (net_rev - cost_goods)
+        if not use_ext_pnl: 
+            stats['total_trading_pl'] += pl_deal
+            if allow_cash_update: self.total_profit += pl_deal 
             
-            # Logic giảm giá vốn (vẫn chạy để tính hiệu suất, dù tiền có được cộng hay không)
-            curr_vol = sum(b['vol'] for b in inv)
-            if curr_vol > 0:
-                red = val / curr_vol
-                for b in inv: b['adj_cost'] -= red
-
-        elif etype == 'FEE':
-            val = event.get('val', 0)
-            stats['total_trading_pl'] -= val
+        stats['total_sold_vol'] += vol
+        stats['total_sell_cost'] += cost_goods 
+        
+        # Chỉ cộng tiền bán về nếu cho phép
+        if use_ext_pnl:
+            if allow_cash_update: self.real_cash_balance += cost_goods 
+        
+        self.trade_log.add(ts, symbol, 'BÁN', vol, price, cost_goods/vol if vol>0 else 0, pl_deal, 'Giao Dịch Bán')
+        if state['current_cycle']:
+            cyc = state['current_cycle']
+            cyc['total_sell_val'] += net_rev; cyc['total_sell_vol'] += vol
+            if not use_ext_pnl: cyc['trading_pl'] += pl_deal
+            if pos['vol'] <= 0.001:
+                cyc['end_date'] = pd.Timestamp(ts); cyc['status'] = 'Closed'
+                state['closed_cycles'].append(cyc); state['current_cycle'] = None
+
+    def _on_dividend(self, event, ts, val, allow_cash_update, symbol, state):
+        if allow_cash_update:
+            self.real_cash_balance += val
+            self.total_profit += val 
+        
+        state['stats']['total_dividend'] += val
+        if state['current_cycle']: state['current_cycle']['dividend_pl'] += val
+        self.trade_log.add(ts, symbol, 'CỔ TỨC', 0, 0, 0, val, 'Nhận Cổ Tức')
+        
+        # Logic giảm giá vốn (vẫn chạy để tính hiệu suất, dù tiền có được cộng hay không)
+        # Cộng dồn vào div_acc (O(1)), giá vốn ĐC từng lô tính lại khi đọc
+        pos = state['open']
+        curr_vol = pos['vol']
+        if curr_vol > 0:
+            red = val / curr_vol
+            pos['div_acc'] += red
+            pos['adj_val'] -= red * curr_vol
+
+    def _on_fee(self, event, ts, val, allow_cash_update, symbol, state):
+        state['stats']['total_trading_pl'] -= val
+        
+        if allow_cash_update:
+            self.total_profit -= val 
             
-            if allow_cash_update:
-                self.total_profit -= val 
-                
-            if state['current_cycle']: state['current_cycle']['trading_pl'] -= val
-            self.trade_log.append({'Ngày': date_obj, 'Mã': symbol, 'Loại': 'PHÍ/THUẾ', 'SL': 0, 'Giá Bán': 0, 'Giá Vốn': 0, 'Lãi/Lỗ': -val, 'Nguồn': 'Trừ Phí'})
+        if state['current_cycle']: state['current_cycle']['trading_pl'] -= val
+        self.trade_log.add(ts, symbol, 'PHÍ/THUẾ', 0, 0, 0, -val, 'Trừ Phí')
+
+    @staticmethod
+    def _take_lots(inv, pos, qty, date_ns):
+        """
+        Lấy `qty` cổ phiếu khỏi sổ lô theo phương pháp giá vốn của sổ, cập nhật tổng tồn kho `pos`.
+        Trả về (giá vốn hàng bán, tổng SL x ngày giữ của phần đã bán).
+        """
+        cost_goods = 0; held_days = 0
+        take, idx, dust = inv.consume(qty)
+        if len(take):
+            if inv.method.pooled:
+                # Bình quân di động: mọi lô cùng giá = tổng vốn / tổng SL trước khi bán
+                lot_cost = np.full(len(take), pos['val'] / pos['vol']); lot_adj = np.full(len(take), pos['adj_val'] / pos['vol'])
+            else:
+                lot_cost = inv.cost[idx]; lot_adj = lot_cost - (pos['div_acc'] - inv.mark[idx])
+            # Cộng tuần tự theo lô như vòng while cũ (np.dot đổi thứ tự cộng -> lệch vài ULP, Lãi/Lỗ 0 thành -1e-8)
+            cost_goods = sum((take * lot_cost).tolist())
+            held_days = sum((((date_ns - inv.date[idx]) // NS_PER_DAY) * take).tolist())
+            pos['vol'] -= float(take.sum()); pos['val'] -= cost_goods; pos['adj_val'] -= float(take @ lot_adj)
+            # Phần lẻ còn sót của lô bị bỏ -> bỏ luôn khỏi tổng
+            if dust: pos['vol'] -= dust; pos['val'] -= dust * lot_cost[-1]; pos['adj_val'] -= dust * lot_adj[-1]
+        if not inv: pos['vol'] = pos['val'] = pos['adj_val'] = pos['div_acc'] = 0.0  # Hết kho -> về 0 tuyệt đối (không tích sai số float)
+        return cost_goods, held_days
+
+    def _basis_book_states(self, symbol):
+        for name, books in self._basis_books.items():
+            if symbol not in books:
+                books[symbol] = {'inventory': LotLedger(method=name), 'open': {'vol': 0.0, 'val': 0.0, 'adj_val': 0.0, 'div_acc': 0.0},
+                                 'trading_pl': 0.0, 'sell_cost': 0.0}
+            yield books[symbol]
+
+    def cost_basis_report(self):
+        """Lãi/Lỗ giao dịch + vốn tồn kho theo từng phương pháp giá vốn (cần compare_methods khi tạo Engine)."""
+        rows = []
+        for name, books in (self._basis_books or {}).items():
+            label = COST_METHODS[name].label if name in COST_METHODS else name
+            for sym, book in books.items():
+                if str(sym).endswith('_WFT'): continue
+                rows.append({'Mã CK': sym, 'Phương Pháp': label, 'Lãi/Lỗ Giao Dịch': book['trading_pl'], 'Giá Vốn Hàng Bán': book['sell_cost'],
+                             'SL Đang Giữ': book['open']['vol'], 'Vốn Gốc (Mua)': book['open']['val']})
+        return pd.DataFrame(rows)
 
     # --- CÁC HÀM GETTER ---
     
     def generate_reports(self):
         rep_sum, rep_cyc, rep_inv, rep_warn = [], [], [], []
+        today_ns = self.today.value
         
         total_val = 0
         for sym, s in self.data.items():
-            if self.clean_symbol(sym): total_val += sum(b['vol']*b['cost'] for b in s['inventory'])
+            if self.clean_symbol(sym): total_val += s['open']['val']
 
         for sym, state in self.data.items():
             if not self.clean_symbol(sym): continue 
-            inv = state['inventory']; stats = state['stats']
-            curr_vol = sum(b['vol'] for b in inv)
-            curr_val_org = sum(b['vol'] * b['cost'] for b in inv)
-            curr_val_adj = sum(b['vol'] * b['adj_cost'] for b in inv)
+            inv = state['inventory']; stats = state['stats']; pos = state['open']
+            curr_vol, curr_val_org, curr_val_adj = pos['vol'], pos['val'], pos['adj_val']
             
-            for b in inv: rep_inv.append({'Mã CK': sym, 'Ngày Mua': b['date'].strftime('%d/%m/%Y'), 'SL Tồn': b['vol'], 'Giá Vốn Gốc': b['cost'], 'Giá Vốn ĐC': b['adj_cost'], 'Ngày Giữ': (self.today - b['date']).days, 'Vốn Gốc (Mua)': b['vol'] * b['cost']})
+            # Bảng tồn kho: cắt lát thẳng từ mảng của sổ lô (không dựng dict từng lô)
+            lots = inv.columns(); n_lots = len(inv)
+            held_days = (today_ns - lots['date']) // NS_PER_DAY
+            if inv.method.pooled and curr_vol > 0:
+                lot_cost = np.full(n_lots, curr_val_org / curr_vol); lot_adj = np.full(n_lots, curr_val_adj / curr_vol)
+            else:
+                lot_cost = lots['cost']; lot_adj = lots['cost'] - (pos['div_acc'] - lots['mark'])
+            if n_lots: rep_inv.append({'Mã CK': [sym] * n_lots, 'Ngày Mua': pd.to_datetime(lots['date']).strftime('%d/%m/%Y').tolist(), 'SL Tồn': lots['vol'], 'Giá Vốn Gốc': lot_cost, 'Giá Vốn ĐC': lot_adj, 'Ngày Giữ': held_days, 'Vốn Gốc (Mua)': lots['vol'] * lot_cost})
             if str(sym).endswith('_WFT'): continue
 
             raw_trading_pl = stats['total_trading_pl']; total_div = stats['total_dividend']
@@ -267,7 +452,7 @@ class PortfolioEngine:
             else:
                 display_trading_pl = raw_trading_pl; display_total_pl = raw_trading_pl + total_div
 
-            avg_hold_held = sum(((self.today - b['date']).days) * b['vol'] for b in inv) / curr_vol if curr_vol > 0 else 0
+            avg_hold_held = float(held_days @ lots['vol']) / curr_vol if curr_vol > 0 else 0
             avg_hold_sold = stats['weighted_sold_days'] / stats['total_sold_vol'] if stats['total_sold_vol'] > 0 else 0
             
             rep_sum.append({'Mã CK': sym, 'Tổng SL Đã Bán': stats['total_sold_vol'], 'Lãi/Lỗ Giao Dịch': display_trading_pl, 'Cổ Tức Đã Nhận': total_div, 'Tổng Lãi Thực': display_total_pl, '% Hiệu Suất (Trade)': (display_trading_pl / stats['total_sell_cost'] * 100) if stats['total_sell_cost'] > 0 else 0, 'SL Đang Giữ': curr_vol, 'Vốn Gốc (Mua)': curr_val_org, 'Vốn Hợp Lý (Sau Cổ Tức)': curr_val_adj, 'Tổng Vốn Đã Rót': stats['total_invested_capital'], '% Tỷ Trọng Vốn': (curr_val_org / total_val * 100) if total_val > 0 else 0, 'Ngày Giữ TB (Đã Bán)': avg_hold_sold, 'Tuổi Kho TB': avg_hold_held})
@@ -282,7 +467,8 @@ class PortfolioEngine:
 
             if curr_vol > 0 and avg_hold_held > 90: rep_warn.append({'Mã CK': sym, 'Vốn Kẹp': curr_val_org, 'Tuổi Kho TB': avg_hold_held, 'Cảnh Báo': '> 90 ngày'})
 
-        return (pd.DataFrame(rep_sum), pd.DataFrame(rep_cyc), pd.DataFrame(rep_inv), pd.DataFrame(rep_warn))
+        df_inv = pd.DataFrame({k: np.concatenate([p[k] for p in rep_inv]) for k in rep_inv[0]}) if rep_inv else pd.DataFrame()
+        return (pd.DataFrame(rep_sum), pd.DataFrame(rep_cyc), df_inv, pd.DataFrame(rep_warn))
 
     def get_all_closed_cycles(self):
         res = []
@@ -300,10 +486,106 @@ class PortfolioEngine:
                 res.append(cc)
         return res
 
+    # --- TRẠNG THÁI TẠI 1 NGÀY TRONG QUÁ KHỨ ---
+    def _snapshot(self):
+        # trade_log / nav chỉ nối thêm -> lưu độ dài, khi khôi phục cắt từ bản cuối cùng
+        state = {f: getattr(self, f) for f in self._CHECKPOINT_FIELDS if f not in ('trade_log', 'nav')}
+        state['trade_log_offset'] = len(self.trade_log); state['nav_offset'] = len(self.nav)
+        return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _build_history(self):
+        """Replay all_raw_events 1 lần trên Engine phụ, chụp trạng thái sau mỗi SNAPSHOT_EVERY sự kiện."""
+        events = self.all_raw_events
+        shadow = PortfolioEngine(self.source_name, cost_method=self.cost_method)
+        shadow.last_snapshot_date = self.last_snapshot_date  # Cùng quyền cộng/trừ tiền như lần chạy chính
+        ns = event_ns(events)
+        ts = ns.tolist()
+        snaps = [(0, shadow._snapshot())]
+        for i, e in enumerate(events, 1):
+            shadow.process_event(e, ts[i - 1])
+            if i % self.SNAPSHOT_EVERY == 0: snaps.append((i, shadow._snapshot()))
+        # Ngày lũy tiến (max đến sự kiện i) -> searchsorted được kể cả khi list lệch thứ tự vài dòng
+        self._history = (np.maximum.accumulate(ns), snaps, ts)
+        return self._history
+
+    def engine_as_of(self, date):
+        """
+        Engine mới ở trạng thái cuối ngày `date` (đã chạy mọi sự kiện tới hết ngày đó).
+        Nạp snapshot gần nhất rồi chỉ replay phần đuôi. Không gồm phần vá cổ tức chạy sau run().
+        """
+        dates, snaps, ts = self._history or self._build_history()
+        day = pd.Timestamp(date).normalize()
+        stop = int(np.searchsorted(dates, (day + pd.Timedelta(days=1)).value, side='left'))
+        n, blob = snaps[min(stop // self.SNAPSHOT_EVERY, len(snaps) - 1)]
+
+        eng = PortfolioEngine(self.source_name, cost_method=self.cost_method)
+        state = pickle.loads(blob)
+        for f in self._CHECKPOINT_FIELDS:
+            if f not in ('trade_log', 'nav'): setattr(eng, f, state[f])
+        eng.trade_log = self.trade_log[:state['trade_log_offset']]
+        eng.nav = self.nav.head(state['nav_offset'])
+        eng.all_raw_events = self.all_raw_events[:n]
+        for i in range(n, stop): eng.process_event(self.all_raw_events[i], ts[i])
+        eng.today = day  # Ngày Giữ / Tuổi Kho tính tới ngày được hỏi
+        return eng
+
+    def state_as_of(self, date):
+        """Báo cáo (rep_sum, rep_cyc, rep_inv, rep_warn) như generate_reports(), tại cuối ngày `date`."""
+        return self.engine_as_of(date).generate_reports()
+
+    def trade_log_frame(self):
+        """Nhật ký giao dịch dạng DataFrame - dựng 1 lần, dùng chung cho mọi View (CHỈ ĐỌC, cần sửa thì .copy(deep=False))."""
+        return self.trade_log.frame()
+
     @property
     def total_profit_calc(self):
         return self.total_profit
 
-    def get_nav_chart_data(self):
-        analytics = NAVAnalytics()
-        return analytics.process_chart_data(self.all_raw_events)
\ No newline at end of file
+    def get_nav_chart_data(self, price_store=None, freq='D', basis='val'):
+        """
+        Lịch sử NAV ghi sẵn trong lượt replay (không replay lại sự kiện) - processors/nav_history.py.
+        freq: 'D' cuối mỗi ngày tới hôm nay | 'event' từng sự kiện. basis: 'val' vốn gốc | 'adj' vốn sau cổ tức.
+        price_store (PriceStore): định giá kho theo giá đóng cửa trong cache (mark-to-market).
+        """
+        return self.nav.frame(freq, basis, price_store, end=self.today)
+
+
+# Loại sự kiện có sẵn: (tên chuẩn, hàm xử lý, tên đồng nghĩa, cần mã CK, quy tắc lấy số tiền)
+for _etype, _handler, _aliases, _needs_symbol, _value in (
+    ('CASH_SNAPSHOT', PortfolioEngine._on_cash_snapshot, (), False, 'default'),
+    ('PHI_THUE', PortfolioEngine._on_tax_fee, (), False, 'default'),
+    ('DEPOSIT', PortfolioEngine._on_deposit, ('NAP_TIEN',), False, 'default'),
+    ('WITHDRAW', PortfolioEngine._on_withdraw, ('RUT_TIEN',), False, 'default'),
+    ('BAN_TIEN_VE', PortfolioEngine._on_cash_in, ('UNG_TRUOC',), False, 'default'),
+    ('HOAN_UNG', PortfolioEngine._on_advance_repay, (), False, 'default'),
+    ('PNL_UPDATE', PortfolioEngine._on_pnl_update, (), True, 'value'),
+    ('BUY', PortfolioEngine._on_buy, ('MUA',), True, 'default'),
+    ('SELL', PortfolioEngine._on_sell, ('BAN',), True, 'default'),
+    ('DIVIDEND', PortfolioEngine._on_dividend, ('CO_TUC_TIEN',), True, 'val_or_value'),
+    ('FEE', PortfolioEngine._on_fee, (), True, 'val'),
+):
+    PortfolioEngine.register_event(_etype, _handler, _aliases, _needs_symbol, _value)
+
+
+if __name__ == "__main__":
+    # Đo thời gian: state_as_of(ngày) so với replay từ đầu các sự kiện tới hết ngày đó
+    # Kết quả được kiểm tra trong tests/test_engine.py
+    # python -m processors.engine vck|vps <file.xlsx>
+    import contextlib, io, sys, time
+    from processors.adapter_vck import VCKAdapter
+    from processors.adapter_vps import VPSAdapter
+    kind, path_xlsx = sys.argv[1:3]
+    with contextlib.redirect_stdout(io.StringIO()):
+        events = (VCKAdapter if kind == 'vck' else VPSAdapter)().parse(path_xlsx)
+    eng = PortfolioEngine(kind); eng.run(events)
+    days = pd.to_datetime(pd.Series([e['date'] for e in events])).dt.normalize().drop_duplicates().sample(20, random_state=1, replace=True)
+    t_asof = t_full = 0
+    for day in days:
+        t0 = time.time(); got = eng.engine_as_of(day); t_asof += time.time() - t0
+        t0 = time.time()
+        ref = PortfolioEngine(kind); ref.last_snapshot_date = eng.last_snapshot_date; ref.today = day
+        for e in events:
+            if pd.Timestamp(e['date']).normalize() > day: break
+            ref.process_event(e)
+        t_full += time.time() - t0
+    print(f"{len(days)} ngày: state_as_of {t_asof:.2f}s, replay từ đầu {t_full:.2f}s")
\ No newline at end of file
@@ -0,0 +1,157 @@
+# File: processors/engine_checkpoint.py
+# Module: Checkpoint PortfolioEngine trên đĩa (Lần sau chỉ chạy tiếp phần sự kiện mới thay vì replay từ đầu)
+# - Checkpoint = trạng thái Engine (tiền, vốn nạp, lãi, kho lô, cycle, stats, trade_log) + số sự kiện + hash phần đầu.
+# - Engine tự đóng gói checkpoint (pickle nén zlib - msgpack/pyarrow không có trong requirements).
+# - Chỉ chốt checkpoint trước các sự kiện "hôm nay" (CASH_SNAPSHOT ghi datetime.now() đổi theo mỗi lần parse).
+# - Chỉ hash phần đầu cần kiểm (không dựng DataFrame cả list); list ngắn hơn MIN_EVENTS thì replay luôn.
+# - File .ckpt cũ/hỏng (đọc lỗi, khác version/phương pháp giá vốn, phần đầu list đã đổi) -> replay từ đầu rồi ghi đè.
+# - Đo trên list ngẫu nhiên 14 năm (95% sự kiện đã có trong checkpoint; chạy tiếp + chốt checkpoint mới / chạy lại file cũ):
+#   5000 sự kiện: 0.13s -> 0.03s / 0.03s; 30000: 0.69s -> 0.36s / 0.14s; 100000: 2.4s -> 1.1s / 0.55s.
+
+import hashlib
+import io
+import os
+import pickle
+
+import pandas as pd
+
+from processors.parse_cache import _evict
+
+STORE_DIR = os.path.join('data_cache', 'engine')
+# Dưới ngưỡng này replay từ đầu còn nhanh hơn hash + đọc + nạp checkpoint
+MIN_EVENTS = 2000
+# Chỉ chốt checkpoint mới khi có thêm ít nhất chừng này sự kiện chưa nằm trong checkpoint cũ
+# (đóng gói + ghi checkpoint tốn ngang replay vài trăm sự kiện; lần sau vẫn chạy tiếp từ checkpoint cũ)
+REFRESH_EVENTS = 1000
+
+# Bộ đếm: số lần chạy tiếp từ checkpoint / chạy lại từ đầu
+STATS = {'resumed': 0, 'replayed': 0}
+
+
+def event_key(e):
+    """Chuỗi đại diện ổn định của 1 sự kiện (mọi trường, theo thứ tự tên trường)."""
+    return '|'.join(f"{k}={e[k]!r}" for k in sorted(e))
+
+
+def segment_digest(events, ns, a, b, prev=b''):
+    """
+    Hash nối chuỗi: hash(prev + sự kiện a..b). ns: event_ns(events) mà Engine đã tính sẵn.
+    Ngày Timestamp hash qua ns (pickle Timestamp chậm), các trường khác qua pickle không memo
+    (cùng giá trị -> cùng bytes, không phụ thuộc object nào được dùng chung).
+    Chỉ cần an toàn 1 chiều: 2 list khác nhau không bao giờ cùng hash; cùng giá trị khác kiểu (1 vs 1.0) -> replay lại.
+    """
+    h = hashlib.sha256(prev)
+    h.update(ns[a:b].astype('int64').tobytes())
+    buf = io.BytesIO()
+    p = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+    p.fast = True
+    p.dump([{**e, 'date': None} if type(e.get('date')) is pd.Timestamp and e['date'].tzinfo is None else e for e in events[a:b]])
+    h.update(buf.getbuffer())
+    return h.digest()
+
+
+def prefix_digest(events, ns, bounds):
+    """
+    Hash của bounds[-1] sự kiện đầu, nối qua từng đoạn [0, bounds[0]), [bounds[0], bounds[1]), ...
+    Checkpoint mới chỉ cần hash thêm đoạn sự kiện mới (segment_digest) thay vì hash lại cả phần đầu.
+    """
+    d, a = b'', 0
+    for b in bounds: d, a = segment_digest(events, ns, a, b, d), b
+    return d
+
+
+def stable_count(events, today=None):
+    """Số sự kiện đầu list có ngày < hôm nay (phần đuôi ngày hôm nay/tương lai có thể đổi giữa 2 lần parse)."""
+    today = today if today is not None else pd.Timestamp.now().normalize()
+    k = len(events)
+    while k:
+        try:
+            if not pd.Timestamp(events[k - 1]['date']) >= today: break
+        except: pass
+        k -= 1
+    return k
+
+
+def _store_path(engine, events):
+    # Tài khoản nhận diện bằng tên Engine + sự kiện đầu tiên (lịch sử cũ không đổi giữa các lần xuất)
+    key = hashlib.sha256(f"{engine.source_name}|{event_key(events[0])}".encode('utf-8')).hexdigest()[:32]
+    return os.path.join(STORE_DIR, f"engine_{key}.ckpt")
+
+
+def _load(path):
+    try:
+        with open(path, 'rb') as f: blob = f.read()
+        os.utime(path, None)  # Đánh dấu vừa dùng (LRU của data_cache)
+        return blob
+    except OSError: return None
+
+
+def _save(path, blob):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f: f.write(blob)
+    os.replace(tmp, path)
+
+
+def run_engine(engine, events):
+    """
+    engine.run(events) có checkpoint trên đĩa. Kết quả giống chạy từ đầu.
+    Mọi lỗi của kho checkpoint đều bị bỏ qua (chỉ mất tốc độ): checkpoint không nạp được -> Engine._resume trả 0,
+    chạy lại toàn bộ và checkpoint mới ghi đè file cũ.
+    """
+    if len(events) < MIN_EVENTS: return engine.run(events)
+    path = _store_path(engine, events)
+    stable = stable_count(events)
+    engine.run(events, checkpoint=_load(path), checkpoint_at=stable, checkpoint_min=REFRESH_EVENTS)
+    STATS['resumed' if engine.resumed_from else 'replayed'] += 1
+    if engine.last_checkpoint is not None and stable != engine.resumed_from:
+        try:
+            _save(path, engine.last_checkpoint)
+            _evict(keep=path)  # Checkpoint tính chung hạn mức dung lượng với cache parse
+        except Exception as e: print(f"⚠️ Không ghi được checkpoint Engine: {e}")
+
+
+def clear_engine_checkpoints():
+    if not os.path.isdir(STORE_DIR): return
+    for f in os.listdir(STORE_DIR):
+        try: os.remove(os.path.join(STORE_DIR, f))
+        except OSError: pass
+
+
+if __name__ == "__main__":
+    # Đo thời gian: "file cũ" = 80% sự kiện đầu + đuôi hôm nay (CASH_SNAPSHOT) để có checkpoint,
+    # rồi chạy toàn bộ (tiếp từ checkpoint) so với chạy từ đầu
+    # python -m processors.engine_checkpoint vck|vps <file.xlsx>
+    # Kết quả được kiểm tra trong tests/test_engine_checkpoint.py
+    import contextlib, io, sys, time
+    from processors.adapter_vck import VCKAdapter
+    from processors.adapter_vps import VPSAdapter
+    from processors.engine import PortfolioEngine
+    kind, path_xlsx = sys.argv[1:3]
+    with contextlib.redirect_stdout(io.StringIO()):
+        events = (VCKAdapter if kind == 'vck' else VPSAdapter)().parse(path_xlsx)
+    STORE_DIR = os.path.join('/tmp', 'ptck_engine_check')
+    clear_engine_checkpoints()
+    stable = stable_count(events)
+    run_engine(PortfolioEngine(kind), events[:int(stable * 0.8)] + events[stable:])
+
+    def timed(fn):  # Tốt nhất 3 lần (máy chia sẻ dao động mạnh)
+        best = None
+        for _ in range(3):
+            t0 = time.perf_counter(); out = fn(); dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        return out, best
+
+    def resume():
+        clear_engine_checkpoints(); run_engine(PortfolioEngine(kind), events[:int(stable * 0.8)] + events[stable:])
+        t0 = time.perf_counter(); e = PortfolioEngine(kind); run_engine(e, events); return e, time.perf_counter() - t0
+
+    def rerun():
+        e = PortfolioEngine(kind); run_engine(e, events); return e
+
+    _, t_full = timed(lambda: PortfolioEngine(kind).run(events) or None)
+    res, t_res = min((resume() for _ in range(3)), key=lambda r: r[1])
+    same, t_same = timed(rerun)
+    print(f"từ đầu: {t_full:.3f}s, tiếp từ checkpoint ({res.resumed_from}/{len(events)} sự kiện, "
+          f"{'chốt' if res.last_checkpoint else 'không chốt'} checkpoint mới): {t_res:.3f}s, "
+          f"chạy lại file cũ ({same.resumed_from}/{len(events)}): {t_same:.3f}s, {STATS}")
@@ -0,0 +1,105 @@
+# File: processors/event_registry.py
+# Module: Bảng loại sự kiện -> hàm xử lý cho PortfolioEngine (Thay chuỗi if/elif so sánh chuỗi trong process_event)
+# - Mỗi loại sự kiện chuẩn (BUY, SELL, DEPOSIT...) có 1 EventSpec: hàm xử lý, có cần mã CK không, quy tắc lấy số tiền.
+# - Tên đồng nghĩa (MUA/BUY, NAP_TIEN/DEPOSIT, BAN/SELL...) trỏ về cùng 1 EventSpec -> phân giải 1 lần khi nạp list sự kiện.
+# - Loại mới (chia tách cổ phiếu, lãi margin...) đăng ký qua PortfolioEngine.register_event(...) - không sửa Engine.
+
+from collections import namedtuple
+
+# Quy tắc lấy số tiền của sự kiện (trước đây lặp lại ở từng nhánh if)
+VALUE_RULES = {
+    'default': lambda e: e.get('value', 0) if e.get('value', 0) > 0 else e.get('val', 0),  # 'value' dương, không thì 'val'
+    'value': lambda e: e.get('value', 0),                            # Giữ cả số âm (PNL_UPDATE)
+    'val': lambda e: e.get('val', 0),
+    'val_or_value': lambda e: e.get('val', 0) or e.get('value', 0),
+}
+
+# name: tên chuẩn. handler(engine, event, ts, val, allow_cash_update, symbol, state) - None = không làm gì.
+# needs_symbol: True -> bỏ qua sự kiện không có mã CK hợp lệ, handler nhận symbol + trạng thái mã (engine.data[symbol]).
+EventSpec = namedtuple('EventSpec', 'name handler needs_symbol value_of')
+
+# Loại chưa đăng ký: vẫn tạo trạng thái mã nếu có mã CK (giống nhánh else ngầm của chuỗi if/elif cũ)
+UNKNOWN = EventSpec('', None, True, VALUE_RULES['default'])
+
+
+class EventRegistry:
+    def __init__(self):
+        self.specs = {}   # tên chuẩn -> EventSpec
+        self.table = {}   # tên chuẩn + tên đồng nghĩa -> EventSpec
+
+    def register(self, etype, handler, aliases=(), needs_symbol=True, value='default'):
+        """Đăng ký (hoặc thay) loại sự kiện. value: tên trong VALUE_RULES hoặc hàm event -> số tiền."""
+        value_of = value if callable(value) else VALUE_RULES[value]
+        spec = EventSpec(etype, handler, needs_symbol, value_of)
+        # Thay handler của tên chuẩn đã có -> cập nhật cả các tên đồng nghĩa cũ
+        old = self.specs.get(etype)
+        for name, s in list(self.table.items()):
+            if old is not None and s is old: self.table[name] = spec
+        self.specs[etype] = spec
+        for name in (etype, *aliases): self.table[name] = spec
+        return spec
+
+    def resolve(self, etype):
+        return self.table.get(etype, UNKNOWN)
+
+    def resolve_all(self, events):
+        """EventSpec của từng sự kiện trong list (1 lần lúc nạp, vòng replay không tra lại)."""
+        get = self.table.get
+        return [get(e.get('type', ''), UNKNOWN) for e in events]
+
+    def signature(self):
+        """Tên loại + tên hàm xử lý - lưu trong checkpoint Engine, đổi bảng -> checkpoint cũ bị bỏ qua."""
+        return tuple(sorted((name, getattr(s.handler, '__qualname__', repr(s.handler))) for name, s in self.table.items()))
+
+    def copy(self):
+        out = EventRegistry()
+        out.specs = dict(self.specs); out.table = dict(self.table)
+        return out
+
+    def __contains__(self, etype): return etype in self.table
+
+    def __repr__(self): return f"EventRegistry({', '.join(self.specs)})"
+
+
+if __name__ == "__main__":
+    # Đo chi phí phân loại 1 sự kiện: chuỗi if/elif cũ vs tra bảng (chỉ phần chọn nhánh, không xử lý)
+    # + thời gian replay trọn vẹn mỗi sự kiện
+    # python -m processors.event_registry [số sự kiện]
+    import random, sys, time
+    import pandas as pd
+    from processors.engine import PortfolioEngine
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    r = random.Random(5)
+    types = ['MUA', 'BUY', 'BAN', 'SELL', 'CO_TUC_TIEN', 'FEE', 'PHI_THUE', 'NAP_TIEN', 'BAN_TIEN_VE', 'PNL_UPDATE', 'CASH_SNAPSHOT']
+    events = [{'type': r.choice(types)} for _ in range(n)]
+
+    def old_chain(etype):
+        if etype == 'CASH_SNAPSHOT': return 1
+        if etype == 'PHI_THUE': return 2
+        if etype in ['NAP_TIEN', 'DEPOSIT']: return 3
+        if etype in ['RUT_TIEN', 'WITHDRAW']: return 4
+        if etype in ['BAN_TIEN_VE', 'UNG_TRUOC']: return 5
+        if etype == 'HOAN_UNG': return 6
+        if etype == 'PNL_UPDATE': return 7
+        elif etype in ['MUA', 'BUY']: return 8
+        elif etype in ['BAN', 'SELL']: return 9
+        elif etype in ['CO_TUC_TIEN', 'DIVIDEND']: return 10
+        elif etype == 'FEE': return 11
+
+    reg = PortfolioEngine.EVENTS
+    t = time.perf_counter(); [old_chain(e.get('type', '')) for e in events]; t_old = time.perf_counter() - t
+    t = time.perf_counter(); [reg.resolve(e.get('type', '')) for e in events]; t_new = time.perf_counter() - t
+    t = time.perf_counter(); reg.resolve_all(events); t_all = time.perf_counter() - t
+    print(f"Phân loại {n} sự kiện: if/elif {t_old / n * 1e9:.0f}ns/sự kiện, tra bảng {t_new / n * 1e9:.0f}ns, resolve_all {t_all / n * 1e9:.0f}ns")
+
+    # Replay trọn vẹn (mua/bán/cổ tức/nạp tiền ngẫu nhiên)
+    d = pd.Timestamp('2020-01-01'); full = []
+    for i in range(n // 4):
+        d += pd.Timedelta(hours=r.randint(0, 30))
+        k = r.random()
+        if k < 0.45: full.append({'date': d, 'type': r.choice(['MUA', 'BUY']), 'ticker': f"M{r.randint(0, 20)}", 'qty': 100.0 * r.randint(1, 20), 'price': r.uniform(1e4, 9e4)})
+        elif k < 0.85: full.append({'date': d, 'type': r.choice(['BAN', 'SELL']), 'ticker': f"M{r.randint(0, 20)}", 'qty': 100.0 * r.randint(1, 20), 'price': r.uniform(1e4, 9e4)})
+        elif k < 0.95: full.append({'date': d, 'type': 'CO_TUC_TIEN', 'ticker': f"M{r.randint(0, 20)}", 'val': r.uniform(1e5, 1e7)})
+        else: full.append({'date': d, 'type': 'NAP_TIEN', 'value': r.uniform(1e7, 1e9)})
+    eng = PortfolioEngine('bench'); t = time.perf_counter(); eng.run(full); t_run = time.perf_counter() - t
+    print(f"Replay {len(full)} sự kiện: {t_run / len(full) * 1e6:.1f}µs/sự kiện")
@@ -0,0 +1,99 @@
+# File: processors/event_time.py
+# Module: Chuẩn hóa thời gian sự kiện 1 lần (int64 nano giây / số ngày) thay vì pd.Timestamp(...) ở từng bước
+# - event_ns(events): ngày của cả list -> mảng int64 ns (vector hóa, NaT = NAT_NS).
+# - chrono_order(events): thứ tự (ngày, prio) ổn định bằng np.lexsort - thay sorted(key=lambda x: (x['date'], ...)).
+# - day_ordinal(ns): số ngày kể từ 1970-01-01 -> gom nhóm theo ngày bằng số nguyên, không strftime / .date().
+# - ffill_daily(...): trạng thái thưa theo sự kiện -> ma trận (ngày x mã) forward-fill (TimeMachine, NAV theo giá thị trường).
+# - Timestamp chỉ dựng lại khi cần hiển thị (ngày bắt đầu/kết thúc cycle, cột 'Ngày' của báo cáo).
+
+import numpy as np
+import pandas as pd
+
+NS_PER_DAY = 86_400 * 10**9
+NAT_NS = np.iinfo('int64').min  # pd.NaT.value
+
+
+def to_ns(d):
+    """Timestamp/datetime/chuỗi/int ns -> int64 nano giây (NaT -> NAT_NS)."""
+    if isinstance(d, (int, np.integer)): return int(d)
+    return d.value if isinstance(d, pd.Timestamp) else pd.Timestamp(d).value
+
+
+def event_ns(events, key='date'):
+    """
+    Mảng int64 ns của e[key] cho mọi sự kiện (thiếu/không đọc được -> NAT_NS).
+    Chuỗi được đọc từng cái bằng pd.Timestamp như code cũ (to_datetime cả cột sẽ đoán 1 format chung).
+    """
+    vals = [e.get(key) for e in events]
+    try: return np.fromiter((v.value for v in vals), 'int64', len(vals))  # Adapter trả về sẵn Timestamp/NaT
+    except (AttributeError, TypeError, ValueError): pass
+    strs = [i for i, v in enumerate(vals) if isinstance(v, str)]
+    for i in strs: vals[i] = None
+    try:
+        out = pd.to_datetime(pd.Series(vals, dtype=object), errors='coerce').to_numpy('datetime64[ns]').view('int64').copy()
+    except Exception:
+        # Lệch múi giờ / ngoài khoảng ns... -> từng sự kiện
+        out = np.full(len(vals), NAT_NS, 'int64'); strs = range(len(vals))
+    for i in strs:
+        try: out[i] = pd.Timestamp(events[i].get(key)).value
+        except Exception: out[i] = NAT_NS
+    return out
+
+
+def day_ordinal(ns):
+    """Số ngày kể từ 1970-01-01 (int hoặc mảng) - cùng số <=> cùng ngày lịch."""
+    return ns // NS_PER_DAY
+
+
+def ffill_daily(n_days, rows, cols, vals, n_cols):
+    """
+    Ma trận (ngày x cột) từ các sự kiện thưa: sự kiện i đặt vals[i] vào ô (rows[i], cols[i]) (cột -1 = bỏ qua),
+    sự kiện cuối cùng trong ngày thắng, forward-fill theo cột, trước sự kiện đầu tiên của cột = 0.
+    """
+    mat = np.zeros((n_days, n_cols)); filled = np.zeros((n_days, n_cols), bool)
+    hit = cols >= 0
+    if not hit.any(): return mat
+    r = rows[hit]; c = cols[hit]; v = vals[hit]
+    # Nhiều sự kiện cùng ô: giữ sự kiện cuối (duyệt ngược, lấy lần xuất hiện đầu)
+    _, pos = np.unique((r * n_cols + c)[::-1], return_index=True)
+    pos = len(c) - 1 - pos
+    mat[r[pos], c[pos]] = v[pos]; filled[r[pos], c[pos]] = True
+    idx = np.where(filled, np.arange(n_days)[:, None], 0)  # Ô trống -> dòng 0 (= 0 nếu dòng 0 cũng trống)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return mat[idx, np.arange(n_cols)]
+
+
+def chrono_order(events, ns=None, prio=True):
+    """
+    Chỉ số sự kiện theo (ngày, prio) tăng dần, giữ thứ tự gốc khi trùng khóa
+    (giống sorted(events, key=lambda x: (x['date'], x.get('prio', 50)))).
+    """
+    ns = event_ns(events) if ns is None else ns
+    if not prio: return np.argsort(ns, kind='stable')
+    pr = np.fromiter((e.get('prio', 50) for e in events), 'float64', len(events))
+    return np.lexsort((pr, ns))
+
+
+def sort_events(events, prio=True):
+    """List sự kiện đã sắp theo chrono_order."""
+    return [events[i] for i in chrono_order(events, prio=prio).tolist()]
+
+
+if __name__ == "__main__":
+    # Đo thời gian: event_ns / sort_events so với pd.Timestamp từng sự kiện / sorted theo datetime
+    # Kết quả được kiểm tra trong tests/test_event_time.py
+    # python -m processors.event_time vck|vps <file.xlsx>
+    import contextlib, io, sys, time
+    from processors.adapter_vck import VCKAdapter
+    from processors.adapter_vps import VPSAdapter
+    kind, path_xlsx = sys.argv[1:3]
+    with contextlib.redirect_stdout(io.StringIO()):
+        events = (VCKAdapter if kind == 'vck' else VPSAdapter)().parse(path_xlsx)
+
+    t0 = time.time(); ref = [pd.Timestamp(e['date']).value for e in events]; t_old = time.time() - t0
+    t0 = time.time(); ns = event_ns(events); t_new = time.time() - t0
+    print(f"{len(events)} sự kiện: pd.Timestamp từng sự kiện {t_old * 1000:.1f}ms, event_ns {t_new * 1000:.1f}ms")
+
+    t0 = time.time(); ref = sorted(events, key=lambda x: (x['date'], x.get('prio', 50))); t_old = time.time() - t0
+    t0 = time.time(); got = sort_events(events); t_new = time.time() - t0
+    print(f"sắp xếp (ngày, prio): sorted {t_old * 1000:.1f}ms, chrono_order {t_new * 1000:.1f}ms")
@@ -0,0 +1,121 @@
+# File: processors/incremental.py
+# Module: Nạp sao kê tăng dần (Mỗi lần upload sao kê mới = toàn bộ lịch sử cũ + vài tuần mới)
+# - Nhớ dấu vân tay (hash ngày, số tiền, số dư, mô tả...) của mọi dòng đã nạp trên từng sheet (gộp thành 1 sha256).
+# - Lưu checkpoint các két của Adapter (ipo_accumulator, unit_cost_cache, rights_vault, ...) + khung sự kiện.
+# - File mới có đúng phần đầu như lần trước -> chỉ parse phần dòng phía sau, ghép vào log cũ.
+# - Không khớp (sửa lịch sử, đổi tài khoản, đổi VERSION...) hoặc dòng mới ảnh hưởng dòng cũ -> parse toàn bộ.
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+STORE_DIR = os.path.join('data_cache', 'incremental')
+
+# Bộ đếm hiển thị trong khung Debug của app
+STATS = {'incremental': 0, 'full': 0}
+
+
+def row_fingerprints(df):
+    """Hash từng dòng trên mọi cột (ngày, số tiền, số dư, mô tả...) -> mảng uint64."""
+    if df.empty: return []
+    return pd.util.hash_pandas_object(df.astype(str), index=False).tolist()
+
+
+def prefix_digest(fps, n):
+    """sha256 của n dấu vân tay dòng đầu: sửa bất kỳ dòng cũ nào (kể cả dòng giữa) đều làm đổi digest."""
+    return hashlib.sha256(np.asarray(fps[:n], dtype=np.uint64).tobytes()).hexdigest()
+
+
+def _store_path(adapter, fps):
+    # Tài khoản nhận diện bằng dòng đầu tiên (cũ nhất) của các sheet: lịch sử cũ không đổi giữa các lần xuất
+    first = '|'.join(f"{k}:{v[0]}" for k, v in sorted(fps.items()) if len(v))
+    if not first: return None
+    name = type(adapter).__name__
+    key = hashlib.sha256(f"{name}|{first}".encode('utf-8')).hexdigest()[:32]
+    return os.path.join(STORE_DIR, f"{name}_{key}.pkl")
+
+
+def _load(path):
+    try:
+        with open(path, 'rb') as f: record = pickle.load(f)
+        os.utime(path, None)  # Đánh dấu vừa dùng (LRU của data_cache - parse_cache._evict)
+        return record
+    except Exception: return None
+
+
+def _save(path, record):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f: pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _match_starts(record, adapter, fps):
+    """Vị trí bắt đầu phần dòng mới trên từng sheet, None nếu phần đầu file không còn giống lần trước."""
+    if record is None or record.get('version') != getattr(adapter, 'VERSION', None): return None
+    prefix = record.get('prefix')  # Bản ghi kiểu cũ (chỉ có dòng đầu/cuối) -> parse lại toàn bộ
+    if not prefix or set(prefix) != set(fps): return None
+    starts = {}
+    for role, (n, digest) in prefix.items():
+        cur = fps[role]
+        if len(cur) < n or prefix_digest(cur, n) != digest: return None
+        starts[role] = n
+    return starts
+
+
+def ingest(adapter, file_obj):
+    """
+    adapter.parse(file_obj) theo kiểu tăng dần. Adapter cần có ledger_sheets / parse_incremental.
+    Kết quả giống parse toàn bộ; mọi lỗi của kho checkpoint đều bị bỏ qua.
+    """
+    sheets = adapter.ledger_sheets(file_obj)
+    fps = {role: row_fingerprints(df) for role, df in sheets.items()}
+    path = _store_path(adapter, fps)
+    record = _load(path) if path and os.path.exists(path) else None
+
+    result = None
+    starts = _match_starts(record, adapter, fps)
+    if starts is not None:
+        result = adapter.parse_incremental(file_obj, starts, record['checkpoint'])
+        if result is not None: STATS['incremental'] += 1
+    if result is None:
+        STATS['full'] += 1
+        result = adapter.parse_incremental(file_obj)
+
+    events, checkpoint = result
+    if path:
+        try:
+            prefix = {role: (len(v), prefix_digest(v, len(v))) for role, v in fps.items()}
+            _save(path, {'version': getattr(adapter, 'VERSION', None), 'prefix': prefix, 'checkpoint': checkpoint})
+        except Exception as e:
+            print(f"⚠️ Không ghi được checkpoint nạp tăng dần: {e}")
+    return events
+
+
+def clear_incremental_store():
+    if not os.path.isdir(STORE_DIR): return
+    for f in os.listdir(STORE_DIR):
+        try: os.remove(os.path.join(STORE_DIR, f))
+        except OSError: pass
+
+
+if __name__ == "__main__":
+    # Test nhanh: nạp file cũ rồi file mới (= file cũ + dòng mới), so với parse toàn bộ file mới
+    # python -m processors.incremental vck|vps <file_cu.xlsx> <file_moi.xlsx>
+    import sys, time
+    from processors.adapter_vck import VCKAdapter
+    from processors.adapter_vps import VPSAdapter
+    kind, old_path, new_path = sys.argv[1:4]
+    make = VCKAdapter if kind == 'vck' else VPSAdapter
+    STORE_DIR = os.path.join('/tmp', 'ptck_incremental_check')
+    clear_incremental_store()
+    ingest(make(), old_path)
+    t0 = time.time(); inc = pd.DataFrame(ingest(make(), new_path)); t_inc = time.time() - t0
+    t0 = time.time(); full = pd.DataFrame(make().parse(new_path)); t_full = time.time() - t0
+    print(f"incremental: {t_inc:.2f}s, full: {t_full:.2f}s, {STATS}")
+    for df in (inc, full): df.loc[df['date'] >= pd.Timestamp.now().normalize(), 'date'] = pd.NaT  # datetime.now()
+    pd.testing.assert_frame_equal(inc, full, check_dtype=False)
+    print("✅ Nạp tăng dần cho kết quả giống parse toàn bộ")
@@ -0,0 +1,120 @@
+# File: processors/ingestion.py
+# Module: Nạp nhiều tài khoản song song (Mỗi tài khoản 1 process: Parse -> Gộp IPO -> Engine (checkpoint) -> Vá cổ tức)
+# - Thời gian chờ = tài khoản chậm nhất thay vì tổng tất cả tài khoản.
+# - Kết quả (sự kiện + PortfolioEngine) đều pickle được -> trả thẳng về process chính.
+# - Không tạo được process pool (môi trường hạn chế, lỗi pickle...) -> chạy tuần tự như cũ.
+
+import io
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import patch_dividend_fix
+from processors.adapter_vck import VCKAdapter
+from processors.adapter_vps import VPSAdapter
+from processors.engine import PortfolioEngine
+from processors.engine_checkpoint import run_engine
+from processors.ipo_merger import merge_ipo_events
+from processors.parse_cache import cached_parse
+from processors.workbook import _read_bytes, _source_name
+
+# Quy trình theo từng công ty chứng khoán: (Adapter, có gộp lệnh cọc IPO không)
+BROKERS = {
+    'VCK': (VCKAdapter, True),
+    'VPS': (VPSAdapter, False),
+}
+
+MAX_WORKERS = os.cpu_count() or 1
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def account_spec(name, broker, file_obj):
+    """Gói 1 tài khoản thành dict pickle được (UploadedFile của Streamlit không gửi sang process khác được)."""
+    return {'name': name, 'broker': broker, 'data': _read_bytes(file_obj), 'file_name': _source_name(file_obj)}
+
+
+def run_account(spec):
+    """
+    Chạy trọn quy trình cho 1 tài khoản (hàm top-level để ProcessPool gọi được).
+    Trả về: { name, broker, raw_events, events, engine, error }
+    Lỗi giữa chừng -> giữ nguyên phần đã chạy (giống app.py cũ): raw_events/engine có thể đã có, events = [].
+    """
+    engine = PortfolioEngine(spec['name'])
+    res = {'name': spec['name'], 'broker': spec['broker'], 'raw_events': [], 'events': [], 'engine': engine, 'error': None}
+    try:
+        adapter_cls, merge_ipo = BROKERS[spec['broker']]
+        file_obj = io.BytesIO(spec['data'])
+        file_obj.name = spec.get('file_name', '')
+
+        raw_events = cached_parse(adapter_cls(), file_obj)
+        res['raw_events'] = raw_events
+        events = merge_ipo_events(raw_events) if merge_ipo else raw_events
+        run_engine(engine, events)  # Có checkpoint trên đĩa -> chỉ chạy tiếp phần sự kiện mới
+        patch_dividend_fix.apply_dividend_patch(engine, file_obj)
+        res['events'] = events
+    except Exception as e:
+        res['error'] = str(e)
+    return res
+
+
+def _get_executor():
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            # forkserver: process con được fork từ 1 server đã import sẵn pandas (không fork cả server Streamlit đa luồng)
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            if 'forkserver' in methods: ctx.set_forkserver_preload(['processors.ingestion'])
+            _EXECUTOR = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=ctx)
+        return _EXECUTOR
+
+
+def _reset_executor():
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is not None: _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _EXECUTOR = None
+
+
+def ingest_accounts(accounts, parallel=True):
+    """
+    accounts: list các account_spec(...). Trả về list kết quả run_account theo đúng thứ tự đầu vào.
+    parallel=False hoặc chỉ có 1 tài khoản -> chạy ngay trong process hiện tại.
+    """
+    if not accounts: return []
+    if parallel and len(accounts) > 1 and MAX_WORKERS > 1:
+        try:
+            return list(_get_executor().map(run_account, accounts))
+        except (BrokenProcessPool, OSError, RuntimeError, AttributeError, ImportError, pickle.PickleError, TypeError) as e:
+            # Pool hỏng / không tạo được process / spec hoặc kết quả không pickle được
+            # (file đang mở, khóa... -> TypeError "cannot pickle"; run_account tự bắt lỗi của nó) -> bỏ pool, chạy tuần tự
+            print(f"⚠️ Nạp song song lỗi ({e}) -> chạy tuần tự")
+            _reset_executor()
+    return [run_account(spec) for spec in accounts]
+
+
+if __name__ == "__main__":
+    # Test nhanh: song song vs tuần tự cho cùng kết quả + đo thời gian
+    # python -m processors.ingestion VCK:<file_vck.xlsx> VPS:<file_vps.xlsx> ...
+    import contextlib, sys, time
+    import pandas as pd
+    specs = []
+    for i, arg in enumerate(sys.argv[1:]):
+        broker, path = arg.split(':', 1)
+        specs.append(account_spec(f"{broker}_{i}", broker, path))
+    out = {}
+    for mode in (False, True):
+        t0 = time.time()
+        with contextlib.redirect_stdout(io.StringIO()): out[mode] = ingest_accounts(specs, parallel=mode)
+        print(f"{'song song' if mode else 'tuần tự'}: {len(specs)} tài khoản, {time.time() - t0:.2f}s")
+    for a, b in zip(out[False], out[True]):
+        assert a['error'] == b['error'], (a['error'], b['error'])
+        for x, y in zip(a['engine'].generate_reports(), b['engine'].generate_reports()):
+            pd.testing.assert_frame_equal(x, y)
+        assert (a['engine'].real_cash_balance, a['engine'].total_profit) == (b['engine'].real_cash_balance, b['engine'].total_profit)
+    print("✅ Hai chế độ cho kết quả giống nhau")
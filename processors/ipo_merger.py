@@ -1,5 +1,6 @@
 # File: processors/ipo_merger.py
 # Module: Hợp nhất lệnh Đặt cọc IPO và Lệnh Mua chính thức
+from processors.event_time import sort_events
 
 def merge_ipo_events(events):
     """
@@ -7,7 +8,7 @@ def merge_ipo_events(events):
     Output: Danh sách sự kiện đã được xử lý (Gộp tiền cọc vào giá vốn).
     """
     # Sắp xếp theo ngày để đảm bảo Cọc xuất hiện trước Mua
-    sorted_events = sorted(events, key=lambda x: (x['date'], x.get('prio', 50)))
+    sorted_events = sort_events(events)  # (ngày int64 ns, prio) - không so sánh datetime/Timestamp lẫn lộn
     
     cleaned_events = []
     
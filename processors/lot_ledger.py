@@ -0,0 +1,172 @@
+# File: processors/lot_ledger.py
+# Module: Sổ lô tồn kho dạng mảng cho PortfolioEngine (Thay deque các dict)
+# - Mỗi mã 1 sổ: mảng NumPy song song (ngày ns, SL, giá gốc, mốc cổ tức, id nguồn) + con trỏ đầu sổ (head).
+# - Bán FIFO: cumsum trên cửa sổ đầu sổ rồi searchsorted, không pop từng lô trong vòng while.
+# - Phương pháp giá vốn khác (LIFO, bình quân, giá cao xuất trước): processors/cost_basis.py.
+# - Xuất báo cáo = cắt lát mảng (không copy). Nguồn/mô tả lô được intern thành id.
+# - Vẫn duyệt / len / extend như list các dict {date, vol, cost, div_mark, source, desc} -> View cũ chạy nguyên.
+
+import numpy as np
+import pandas as pd
+
+from processors.cost_basis import DUST_VOL, get_method
+from processors.event_time import NS_PER_DAY, to_ns
+
+
+class LotLedger:
+    """
+    Kho lô của 1 mã. Lô sống nằm trong [head, size) của các mảng.
+    method: phương pháp giá vốn (processors/cost_basis.py) quyết định lô nào bị lấy khi bán.
+    Bán không theo thứ tự đầu/cuối sổ (hifo) để lại lô SL = 0 ("lỗ hổng", đếm trong dead) -> bỏ qua khi đọc.
+    """
+
+    _COLS = (('date', 'int64'), ('vol', 'float64'), ('cost', 'float64'), ('mark', 'float64'), ('src', 'int32'))
+
+    def __init__(self, capacity=8, method='fifo'):
+        for name, dtype in self._COLS: setattr(self, name, np.empty(capacity, dtype))
+        self.head = 0; self.size = 0; self.dead = 0
+        self.labels = []       # id -> (source, desc)
+        self._label_ids = {}   # (source, desc) -> id
+        self.method = get_method(method)
+        self.method.reset(self)
+
+    # --- Dung lượng ---
+    def _live(self):
+        """Chỉ số các lô sống: slice nếu không có lỗ hổng, mảng chỉ số nếu có."""
+        if not self.dead: return slice(self.head, self.size)
+        return np.flatnonzero(self.vol[self.head:self.size] > 0) + self.head
+
+    def _reserve(self):
+        if self.size < len(self.vol): return
+        live = self._live(); n = len(self)
+        if 0 < len(self.vol) and n <= len(self.vol) // 2:
+            # Phần lớn sổ đã bán hết -> dồn lô sống về đầu mảng thay vì cấp phát thêm
+            for name, _ in self._COLS:
+                arr = getattr(self, name); arr[:n] = arr[live]
+        else:
+            cap = max(8, 2 * n)
+            for name, dtype in self._COLS:
+                arr = np.empty(cap, dtype); arr[:n] = getattr(self, name)[live]
+                setattr(self, name, arr)
+        self.head, self.size, self.dead = 0, n, 0
+        self.method.reset(self)
+
+    def _label(self, source, desc):
+        key = (source, desc)
+        i = self._label_ids.get(key)
+        if i is None:
+            i = self._label_ids[key] = len(self.labels)
+            self.labels.append(key)
+        return i
+
+    # --- Ghi ---
+    def append(self, date, vol, cost, mark=0.0, source='UNKNOWN', desc=''):
+        self._reserve()
+        i = self.size
+        self.date[i] = to_ns(date); self.vol[i] = vol; self.cost[i] = cost; self.mark[i] = mark
+        self.src[i] = self._label(source, desc)
+        self.size += 1
+        self.method.on_append(self, i)
+
+    def extend(self, lots):
+        """Nhận list dict lô (hoặc 1 LotLedger khác) - dùng khi gộp kho nhiều tài khoản."""
+        for b in lots:
+            self.append(b['date'], b['vol'], b['cost'], b.get('div_mark', 0.0), b.get('source', 'UNKNOWN'), b.get('desc', ''))
+
+    def consume(self, qty):
+        """
+        Bán `qty` cổ phiếu theo phương pháp giá vốn của sổ.
+        Trả về (take, idx, dust): take[i] = SL lấy từ lô idx[i] (slice/mảng chỉ số vào cost, mark, date),
+        dust = tổng phần lẻ còn sót của các lô bị bỏ khỏi kho (mỗi lô <= DUST_VOL), 0 nếu không lô nào bị bỏ.
+        """
+        return self.method.consume(self, qty)
+
+    def rebase_after(self, until, delta):
+        """
+        Cộng `delta` vào mốc cổ tức của các lô mua SAU ngày `until` (đoạn cuối sổ).
+        Trả về tổng SL các lô đó. Dùng khi hạ giá vốn chỉ cho lô mua trước ngày GDKHQ.
+        """
+        cutoff = to_ns(pd.Timestamp(until) + pd.Timedelta(days=1))
+        d = self.date[self.head:self.size]
+        before = np.flatnonzero(d < cutoff)
+        start = self.head + (int(before[-1]) + 1 if len(before) else 0)
+        self.mark[start:self.size] += delta
+        return float(self.vol[start:self.size].sum())
+
+    # --- Đọc ---
+    def columns(self):
+        """Các mảng của lô sống: date (ns), vol, cost, mark, src. Không có lỗ hổng -> lát cắt, không copy."""
+        live = self._live()
+        return {name: getattr(self, name)[live] for name, _ in self._COLS}
+
+    def sources(self):
+        return [self.labels[i][0] for i in self.src[self._live()]]
+
+    def _lot(self, i):
+        source, desc = self.labels[self.src[i]]
+        return {'date': pd.Timestamp(int(self.date[i])), 'vol': float(self.vol[i]), 'cost': float(self.cost[i]),
+                'div_mark': float(self.mark[i]), 'source': source, 'desc': desc}
+
+    def __len__(self): return self.size - self.head - self.dead
+
+    def __iter__(self):
+        for i in range(self.head, self.size):
+            if self.dead and self.vol[i] == 0: continue
+            yield self._lot(i)
+
+    def __getitem__(self, i):
+        n = len(self)
+        if i < 0: i += n
+        if not 0 <= i < n: raise IndexError('LotLedger index out of range')
+        return self._lot(self.head + i if not self.dead else int(self._live()[i]))
+
+    def __repr__(self): return f"LotLedger({len(self)} lô)"
+
+    # --- Pickle / deepcopy: chỉ lưu phần lô sống ---
+    def __getstate__(self):
+        live = self._live()
+        state = {name: getattr(self, name)[live].copy() for name, _ in self._COLS}
+        state['labels'] = self.labels
+        state['method'] = self.method.name
+        return state
+
+    def __setstate__(self, state):
+        for name, _ in self._COLS: setattr(self, name, state[name])
+        self.head, self.size, self.dead = 0, len(state['vol']), 0
+        self.labels = list(state['labels'])
+        self._label_ids = {key: i for i, key in enumerate(self.labels)}
+        self.method = get_method(state.get('method', 'fifo'))
+        self.method.reset(self)
+
+
+if __name__ == "__main__":
+    # Đo thời gian: so với list các dict (logic cũ: vòng while lấy từng lô) cho từng phương pháp
+    # Kết quả được kiểm tra trong tests/test_lot_ledger.py
+    import random, sys, time
+    n_ops = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    r = random.Random(7)
+    ops = [(r.random() < 0.55, r.randint(1, 40) * 100, r.uniform(5000, 90000)) for _ in range(n_ops)]
+    t0 = pd.Timestamp('2020-01-01')
+    pick = {'fifo': lambda inv: 0, 'lifo': lambda inv: len(inv) - 1,
+            'hifo': lambda inv: max(range(len(inv)), key=lambda j: (inv[j]['cost'], -j))}
+
+    for method in ('fifo', 'lifo', 'hifo'):
+        t = time.time(); inv = []; ref = []
+        for i, (is_buy, vol, price) in enumerate(ops):
+            if is_buy: inv.append({'date': t0 + pd.Timedelta(hours=i), 'vol': vol, 'cost': price}); continue
+            qty = vol; cost_goods = 0
+            while qty > 0 and inv:
+                j = pick[method](inv); b = inv[j]; take = min(qty, b['vol'])
+                cost_goods += take * b['cost']; b['vol'] -= take; qty -= take
+                if b['vol'] <= DUST_VOL: inv.pop(j)
+            ref.append(cost_goods)
+        t_old = time.time() - t
+
+        t = time.time(); led = LotLedger(method=method); out = []
+        for i, (is_buy, vol, price) in enumerate(ops):
+            if is_buy: led.append(t0 + pd.Timedelta(hours=i), vol, price); continue
+            take, idx, dust = led.consume(vol)
+            out.append(float(take @ led.cost[idx]) if len(take) else 0)
+        t_new = time.time() - t
+
+        print(f"{method}: list dict {t_old:.2f}s, LotLedger {t_new:.2f}s, còn {len(led)} lô")
@@ -0,0 +1,172 @@
+# File: processors/nav_history.py
+# Module: Lịch sử NAV ghi ngay trong lượt replay của PortfolioEngine (Thay NAVAnalytics / TimeMachine tự replay lại list sự kiện)
+# - Sau mỗi sự kiện: ngày ns, loại, tiền mặt, vốn nạp ròng, lãi đã chốt + tổng tồn kho chạy (SL, vốn gốc, vốn ĐC) của ĐÚNG mã vừa đổi.
+# - frame('event'): 1 dòng / sự kiện (giữ giờ trong ngày). frame('D'): trạng thái cuối mỗi ngày lịch, forward-fill tới hôm nay.
+# - Giá trị cổ phiếu = tổng vốn gốc đang giữ (basis='adj': vốn sau cổ tức); có PriceStore -> theo giá đóng cửa (chỉ frame('D')).
+# - Vá cổ tức chạy sau run() (patch_dividend_fix -> Engine.adjust_inventory_cost) ghi riêng vào cost_adjustments, cộng khi đọc basis='adj'.
+# - Tiền mặt theo đúng logic Engine (Snapshot Authority, tiền bán về qua BAN_TIEN_VE) -> 1 con số NAV cho mọi biểu đồ.
+
+import numpy as np
+import pandas as pd
+
+from processors.event_time import NS_PER_DAY, day_ordinal, ffill_daily
+from processors.price_store import unrealized_pnl
+
+COLUMNS = ('Ngày', 'Tổng Tài Sản (NAV)', 'Vốn Nạp Ròng', 'Tiền Mặt', 'Giá Trị Cổ Phiếu', 'Lãi/Lỗ Tạm Tính')
+
+
+class NAVRecorder:
+    """
+    Trạng thái tài khoản sau từng sự kiện, chỉ nối thêm. Dòng i = sau sự kiện thứ i Engine đã xử lý.
+    Ghi = nối 1 tuple (rẻ nhất trong vòng replay); mảng cột NumPy dựng 1 lần khi đọc, cache theo số dòng đã ghi.
+    """
+
+    # (ngày ns, loại, tiền mặt, vốn nạp ròng, lãi đã chốt, mã | None, SL, vốn gốc, vốn ĐC của mã đó)
+    FIELDS = ('date', 'kind', 'cash', 'deposit', 'profit', 'sym', 'vol', 'val', 'adj')
+
+    def __init__(self):
+        self.rows = []
+        self.cost_adjustments = []  # (ngày ns, mã, số tiền): vốn ĐC đổi từ ngày đó tới cuối lịch sử - không vào checkpoint
+        self._cols = None    # (số dòng lúc dựng, mảng cột)
+        self._frames = {}    # (số dòng, freq, basis, end) -> DataFrame
+
+    def record(self, ts, kind, cash, deposit, profit, symbol=None, pos=None):
+        """Ghi trạng thái sau 1 sự kiện. pos: engine.data[symbol]['open'] của mã vừa đổi (None nếu sự kiện tiền)."""
+        if pos is None: self.rows.append((ts, kind, cash, deposit, profit, None, 0.0, 0.0, 0.0))
+        else: self.rows.append((ts, kind, cash, deposit, profit, symbol, pos['vol'], pos['val'], pos['adj_val']))
+
+    def adjust_cost(self, ts, symbol, amount):
+        """
+        Vốn ĐC của `symbol` đổi `amount` từ thời điểm ts (int64 ns) tới cuối lịch sử (chỉ basis='adj').
+        Dùng cho phần hạ giá vốn sau run(): các lô được hạ vẫn đang giữ -> cả đoạn từ ts lệch đúng 1 lượng.
+        """
+        self.cost_adjustments.append((int(ts), symbol, float(amount)))
+        self._frames = {}
+
+    def _cost_shift(self, ts):
+        """Tổng phần vá vốn ĐC có hiệu lực tại từng thời điểm ts (mảng int64 ns)."""
+        out = np.zeros(len(ts))
+        for start, _, amount in self.cost_adjustments: out[ts >= start] += amount
+        return out
+
+    def __len__(self): return len(self.rows)
+
+    def __repr__(self): return f"NAVRecorder({len(self.rows)} sự kiện)"
+
+    def head(self, n):
+        """Bản sao độc lập n dòng đầu (Engine engine_as_of chạy tiếp trên bản cắt)."""
+        out = NAVRecorder(); out.rows = self.rows[:n]
+        return out
+
+    # --- Pickle / deepcopy: chỉ lưu các dòng, không lưu cache ---
+    def __getstate__(self): return {'rows': self.rows}
+
+    def __setstate__(self, state):
+        self.rows = state['rows']; self.cost_adjustments = []; self._cols = None; self._frames = {}
+
+    def columns(self):
+        """Mảng cột: date int64, cash/deposit/profit/vol/val/adj float64, sym/kind id int64 (sym -1 = không gắn mã) + nhãn."""
+        n = len(self.rows)
+        if self._cols is not None and self._cols[0] == n: return self._cols[1]
+        cols = dict(zip(self.FIELDS, zip(*self.rows))) if n else {f: () for f in self.FIELDS}
+        out = {'date': np.fromiter(cols['date'], 'int64', n)}
+        for f in ('cash', 'deposit', 'profit', 'vol', 'val', 'adj'): out[f] = np.fromiter(cols[f], 'float64', n)
+        for f in ('sym', 'kind'):
+            codes, uniq = pd.factorize(pd.Series(cols[f], dtype=object), use_na_sentinel=True)
+            out[f] = codes.astype('int64'); out[f + '_labels'] = list(uniq)
+        self._cols = (n, out); self._frames = {}
+        return out
+
+    # --- Đọc ---
+    def snapshot_flows(self):
+        """
+        (ngày [số ngày từ 1970], tiền) mà các dòng CASH_SNAPSHOT cộng/trừ vào tiền mặt (số dư thực tế - số dư Engine tự tính).
+        Phần chênh này không đến từ sự kiện nào -> lợi nhuận (analytics/returns.py) coi như nạp/rút, không tính là lãi.
+        """
+        c = self.columns()
+        if 'CASH_SNAPSHOT' not in c['kind_labels']: return np.empty(0, 'int64'), np.empty(0)
+        idx = np.flatnonzero(c['kind'] == c['kind_labels'].index('CASH_SNAPSHOT'))
+        delta = c['cash'][idx] - np.where(idx > 0, c['cash'][idx - 1], 0.0)
+        days = np.maximum.accumulate(day_ordinal(c['date']))[idx]  # Cùng lịch ngày với frame('D')
+        return days, delta
+
+    def stock_value(self, basis='val'):
+        """
+        Tổng giá trị kho (theo giá vốn) sau từng sự kiện: cộng dồn phần thay đổi của mã vừa đổi.
+        Lúc không còn mã nào đang giữ -> đúng 0 (không để lại sai số cộng dồn float).
+        """
+        c = self.columns(); n = len(c['date'])
+        vals = c['val' if basis == 'val' else 'adj']; sym = c['sym']
+        idx = np.flatnonzero(sym >= 0)
+        delta = np.zeros(n); opened = np.zeros(n)
+        if len(idx):
+            order = idx[np.lexsort((idx, sym[idx]))]  # Theo mã, trong mỗi mã theo thứ tự sự kiện
+            s = sym[order]; first = np.r_[True, s[1:] != s[:-1]]
+            for out, v in ((delta, vals[order]), (opened, (c['vol'][order] > 0).astype(float))):
+                d = np.diff(v, prepend=0.0); d[first] = v[first]
+                out[order] = d
+        total = np.cumsum(delta)
+        total[np.cumsum(opened) <= 0] = 0.0
+        return total
+
+    def frame(self, freq='D', basis='val', price_store=None, end=None):
+        """
+        freq='D': cuối mỗi ngày lịch từ ngày sự kiện đầu tới max(ngày sự kiện cuối, end) - cột như NAVAnalytics cũ.
+        freq='event': 1 dòng / sự kiện, thêm cột 'Loại' và 'Mã CK'.
+        basis: 'val' (vốn gốc) hoặc 'adj' (vốn sau cổ tức). price_store (freq='D'): giá trị kho theo giá đóng cửa.
+        Không có price_store -> cache tới lần ghi tiếp theo (dùng chung, CHỈ ĐỌC).
+        """
+        key = (len(self.rows), freq, basis, None if end is None else pd.Timestamp(end).value)
+        if price_store is None and key in self._frames: return self._frames[key]
+        if not self.rows: return pd.DataFrame()
+        c = self.columns()
+        stock = self.stock_value(basis); cash = c['cash']; dep = c['deposit']
+        patched = basis != 'val' and self.cost_adjustments
+        if freq == 'event':
+            if patched: stock = stock + self._cost_shift(np.maximum.accumulate(c['date']))
+            nav = cash + stock
+            df = pd.DataFrame({'Ngày': pd.to_datetime(c['date'].copy(), unit='ns'),
+                               'Loại': np.array(c['kind_labels'] + [None], dtype=object)[c['kind']],
+                               'Mã CK': np.array(c['sym_labels'] + [None], dtype=object)[c['sym']],
+                               'Tổng Tài Sản (NAV)': nav, 'Vốn Nạp Ròng': dep.copy(), 'Tiền Mặt': cash.copy(),
+                               'Giá Trị Cổ Phiếu': stock, 'Lãi/Lỗ Tạm Tính': nav - dep})
+        else:
+            # Ngày lũy tiến: list lệch thứ tự vài dòng vẫn lấy đúng sự kiện cuối cùng <= từng ngày
+            days = np.maximum.accumulate(day_ordinal(c['date']))
+            last_day = int(days[-1]) if end is None else max(int(days[-1]), int(day_ordinal(pd.Timestamp(end).value)))
+            range_days = np.arange(int(days[0]), last_day + 1)
+            last = np.searchsorted(days, range_days, 'right') - 1
+            cash = cash[last]; dep = dep[last]; stock = stock[last]
+            # Vá vốn ĐC theo lịch ngày (ngày GDKHQ có thể không có dòng nào của mã đó)
+            if patched: stock = stock + self._cost_shift(range_days * NS_PER_DAY)
+            if price_store is not None and c['sym_labels']:
+                # Giá thị trường: + (SL x giá đóng cửa - giá vốn) trên ma trận (ngày x mã) tồn kho cuối ngày
+                rows = days - range_days[0]; n_sym = len(c['sym_labels'])
+                vol = ffill_daily(len(range_days), rows, c['sym'], c['vol'], n_sym)
+                cost = ffill_daily(len(range_days), rows, c['sym'], c['val' if basis == 'val' else 'adj'], n_sym)
+                for start, sym, amount in (self.cost_adjustments if patched else ()):
+                    if sym in c['sym_labels']: cost[range_days * NS_PER_DAY >= start, c['sym_labels'].index(sym)] += amount
+                stock = stock + unrealized_pnl(vol, cost, price_store.close_matrix(c['sym_labels'], range_days))
+            nav = cash + stock
+            df = pd.DataFrame({'Ngày': pd.to_datetime(range_days * NS_PER_DAY), 'Tổng Tài Sản (NAV)': nav,
+                               'Vốn Nạp Ròng': dep, 'Tiền Mặt': cash, 'Giá Trị Cổ Phiếu': stock, 'Lãi/Lỗ Tạm Tính': nav - dep})
+        if price_store is None: self._frames[key] = df
+        return df
+
+
+if __name__ == "__main__":
+    # Đo thời gian: run() (đã gồm ghi NAV) + dựng frame ngày / sự kiện
+    # Kết quả được kiểm tra trong tests/test_nav_history.py (NAV cuối ngày so với engine_as_of)
+    # python -m processors.nav_history vck|vps <file.xlsx>
+    import contextlib, io, sys, time
+    from processors.adapter_vck import VCKAdapter
+    from processors.adapter_vps import VPSAdapter
+    from processors.engine import PortfolioEngine
+    kind, path_xlsx = sys.argv[1:3]
+    with contextlib.redirect_stdout(io.StringIO()):
+        events = (VCKAdapter if kind == 'vck' else VPSAdapter)().parse(path_xlsx)
+    eng = PortfolioEngine(kind)
+    t0 = time.time(); eng.run(events); t_run = time.time() - t0
+    t0 = time.time(); df = eng.nav.frame('D'); ev = eng.nav.frame('event'); t_frame = time.time() - t0
+    print(f"{len(events)} sự kiện: run() {t_run * 1000:.0f}ms (đã gồm ghi NAV), "
+          f"frame ngày ({len(df)} dòng) + sự kiện {t_frame * 1000:.1f}ms")
@@ -0,0 +1,139 @@
+# File: processors/parse_cache.py
+# Module: Cache kết quả Adapter trên đĩa (Key = SHA-256 file upload + tên Adapter + VERSION)
+# - Có pyarrow -> lưu Parquet. Không có -> lưu pickle (cùng nội dung list sự kiện).
+# - Giới hạn dung lượng cả cây data_cache (gồm checkpoint nạp tăng dần + checkpoint Engine), xóa file lâu không dùng nhất trước (LRU theo mtime).
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from processors.incremental import STATS as INC_STATS, ingest
+from processors.workbook import file_digest
+
+try:
+    import pyarrow  # noqa: F401
+    _HAS_ARROW = True
+except ImportError:
+    _HAS_ARROW = False
+
+CACHE_DIR = 'data_cache'
+MAX_CACHE_BYTES = 256 * 1024 * 1024  # 256MB
+
+# Bộ đếm hiển thị trong khung Debug của app
+STATS = {'hit': 0, 'miss': 0}
+
+
+def _cache_path(adapter, digest):
+    name = type(adapter).__name__
+    version = str(getattr(adapter, 'VERSION', '0'))
+    key = hashlib.sha256(f"{digest}|{name}|{version}".encode('utf-8')).hexdigest()
+    ext = 'parquet' if _HAS_ARROW else 'pkl'
+    return os.path.join(CACHE_DIR, f"{name}_{key}.{ext}")
+
+
+def _save(path, events):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if path.endswith('.parquet'):
+        pd.DataFrame(events).to_parquet(tmp, index=False)
+    else:
+        with open(tmp, 'wb') as f: pickle.dump(events, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)  # Ghi nguyên tử: không bao giờ đọc phải file ghi dở
+
+
+def _load(path):
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+        # Parquet trả None cho ô trống của cột chữ -> đưa về NaN như output gốc của Adapter
+        for c in df.columns:
+            if not pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_datetime64_any_dtype(df[c]):
+                df[c] = df[c].astype(object).where(df[c].notna(), np.nan)
+        return df.to_dict('records')
+    with open(path, 'rb') as f: return pickle.load(f)
+
+
+def _cache_files():
+    """(mtime, dung lượng, đường dẫn) mọi file trong CACHE_DIR và thư mục con (incremental/, engine/), bỏ file đang ghi dở."""
+    out = []
+    for root, _, names in os.walk(CACHE_DIR):
+        for f in names:
+            if f.endswith('.tmp'): continue
+            f = os.path.join(root, f)
+            try: out.append((os.path.getmtime(f), os.path.getsize(f), f))
+            except OSError: pass
+    return out
+
+
+def _evict(keep=None):
+    """
+    Xóa file cũ nhất (mtime) cho tới khi tổng dung lượng cả cây CACHE_DIR <= MAX_CACHE_BYTES.
+    Dùng chung cho cache parse, checkpoint nạp tăng dần và checkpoint Engine (mất file nào cũng chỉ mất tốc độ).
+    """
+    files = sorted(_cache_files())
+    total = sum(size for _, size, _ in files)
+    for _, size, f in files:
+        if total <= MAX_CACHE_BYTES: break
+        if f == keep: continue
+        try:
+            os.remove(f)
+            total -= size
+        except OSError: pass
+
+
+def _parse(adapter, file_obj, incremental):
+    # File mới của cùng tài khoản (lịch sử cũ + dòng mới) -> chỉ parse phần dòng mới
+    if incremental and getattr(adapter, 'columnar', False) and hasattr(adapter, 'parse_incremental'):
+        try: return ingest(adapter, file_obj)
+        except Exception as e: print(f"⚠️ Nạp tăng dần lỗi ({e}) -> parse toàn bộ")
+    return adapter.parse(file_obj)
+
+
+def cached_parse(adapter, file_obj, incremental=True):
+    """
+    adapter.parse(file_obj) có cache trên đĩa.
+    Trùng nội dung file + Adapter + VERSION -> đọc lại kết quả cũ thay vì parse lại.
+    File khác nhưng cùng tài khoản -> nạp tăng dần (processors/incremental.py).
+    Mọi lỗi của cache đều bị bỏ qua (chỉ mất tốc độ, không mất dữ liệu).
+    """
+    try:
+        path = _cache_path(adapter, file_digest(file_obj))
+    except Exception:
+        return adapter.parse(file_obj)
+
+    if os.path.exists(path):
+        try:
+            events = _load(path)
+            os.utime(path, None)  # Đánh dấu vừa dùng (LRU)
+            STATS['hit'] += 1
+            return events
+        except Exception:
+            pass  # File hỏng -> parse lại và ghi đè
+
+    STATS['miss'] += 1
+    events = _parse(adapter, file_obj, incremental)
+    if events:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            _save(path, events)
+            _evict(keep=path)
+        except Exception as e:
+            print(f"⚠️ Không ghi được cache parse: {e}")
+    return events
+
+
+def cache_info():
+    """Thống kê cho khung Debug: số hit/miss trong phiên + số file/dung lượng trên đĩa (cả checkpoint)."""
+    files = _cache_files()
+    n_files, n_bytes = len(files), sum(size for _, size, _ in files)
+    return {**STATS, **INC_STATS, 'files': n_files, 'mb': n_bytes / 1024 / 1024, 'format': 'parquet' if _HAS_ARROW else 'pickle'}
+
+
+def clear_parse_cache():
+    if not os.path.isdir(CACHE_DIR): return
+    for f in os.listdir(CACHE_DIR):
+        f = os.path.join(CACHE_DIR, f)
+        if not os.path.isfile(f): continue
+        try: os.remove(f)
+        except OSError: pass
@@ -0,0 +1,164 @@
+# File: processors/price_store.py
+# Module: Kho giá đóng cửa lịch sử trên đĩa cho NAV theo giá thị trường (mark-to-market)
+# - Mỗi mã 1 file data_market/prices/<MÃ>.csv, cột Date,Close (VND) - cùng định dạng vnindex_history.csv.
+# - Đọc hoàn toàn offline từ file cache. update() (cần mạng, tùy chọn) tải phiên mới từ VNDirect rồi ghi vào cache.
+# - close_matrix(mã, ngày): ma trận (ngày x mã) giá đóng cửa, forward-fill qua ngày nghỉ (NaN trước phiên đầu / mã không có giá).
+# - unrealized_pnl(SL, giá vốn, giá): lãi/lỗ chưa chốt từng ngày = tích SL (ngày x mã) với giá (ngày x mã) - giá vốn, ô thiếu giá = 0.
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from processors.event_time import NS_PER_DAY, day_ordinal
+
+PRICE_DIR = os.path.join('data_market', 'prices')
+DCHART_URL = "https://dchart-api.vndirect.com.vn/dchart/history?resolution=D&symbol={sym}&from={start}&to={end}"
+DCHART_UNIT = 1000  # dchart trả giá cổ phiếu theo nghìn đồng
+
+
+def clean_ticker(ticker):
+    """Tên file giá của mã (chữ hoa, bỏ khoảng trắng). None: mã rỗng/NaN hoặc mã chờ về (_WFT) - không có giá."""
+    if ticker is None or (isinstance(ticker, float) and ticker != ticker): return None
+    t = str(ticker).strip().upper()
+    if not t or t == 'NAN' or t.endswith('_WFT'): return None
+    return t
+
+
+class PriceStore:
+    """Giá đóng cửa theo mã, đọc lười từ file cache và giữ trong bộ nhớ tới khi file đổi (mtime)."""
+
+    def __init__(self, root=PRICE_DIR):
+        self.root = root
+        self._series = {}  # mã -> (mtime, ngày int64 [số ngày từ 1970], giá float64)
+
+    def path(self, ticker):
+        return os.path.join(self.root, f"{ticker}.csv")
+
+    def tickers(self):
+        """Các mã đã có file giá trong cache."""
+        try: return sorted(f[:-4] for f in os.listdir(self.root) if f.endswith('.csv'))
+        except OSError: return []
+
+    def load(self, ticker):
+        """(ngày, giá) đã sắp theo ngày của 1 mã, hoặc None nếu chưa có cache."""
+        t = clean_ticker(ticker)
+        if t is None: return None
+        p = self.path(t)
+        try: mtime = os.path.getmtime(p)
+        except OSError: return None
+        hit = self._series.get(t)
+        if hit is not None and hit[0] == mtime: return hit[1:]
+        try:
+            df = pd.read_csv(p)
+            ns = pd.to_datetime(df['Date'], errors='coerce').to_numpy('datetime64[ns]').view('int64')
+            close = pd.to_numeric(df['Close'], errors='coerce').to_numpy('float64')
+        except Exception: return None
+        ok = (ns != np.iinfo('int64').min) & ~np.isnan(close) & (close > 0)
+        days = day_ordinal(ns[ok]); close = close[ok]
+        order = np.argsort(days, kind='stable')
+        self._series[t] = (mtime, days[order], close[order])
+        return self._series[t][1:]
+
+    def close_matrix(self, tickers, days):
+        """
+        Ma trận (len(days) x len(tickers)) giá đóng cửa gần nhất <= từng ngày (days: số ngày từ 1970, tăng dần).
+        Ngày nghỉ / không giao dịch lấy phiên trước đó. NaN: trước phiên đầu tiên hoặc mã không có cache.
+        """
+        days = np.asarray(days, 'int64')
+        out = np.full((len(days), len(tickers)), np.nan)
+        for j, t in enumerate(tickers):
+            s = self.load(t)
+            if s is None or not len(s[0]): continue
+            p_days, close = s
+            idx = np.searchsorted(p_days, days, 'right') - 1
+            out[:, j] = np.where(idx >= 0, close[np.maximum(idx, 0)], np.nan)
+        return out
+
+    # --- Ghi cache ---
+    def save(self, ticker, df):
+        """Ghi DataFrame (Date, Close VND) vào cache - gộp với dữ liệu cũ, trùng ngày lấy bản mới. Ghi nguyên tử."""
+        t = clean_ticker(ticker)
+        if t is None or df is None or df.empty: return 0
+        os.makedirs(self.root, exist_ok=True)
+        p = self.path(t)
+        new = pd.DataFrame({'Date': pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d'), 'Close': df['Close'].astype(float)})
+        if os.path.exists(p):
+            try: new = pd.concat([pd.read_csv(p, dtype={'Date': str}), new])
+            except Exception: pass
+        new = new.drop_duplicates('Date', keep='last').sort_values('Date')
+        tmp = f"{p}.{os.getpid()}.tmp"
+        new.to_csv(tmp, index=False)
+        os.replace(tmp, p)
+        self._series.pop(t, None)
+        return len(new)
+
+    def update(self, tickers, start='2020-01-01', timeout=10):
+        """
+        Tải giá ngày từ VNDirect (dchart) cho các mã, từ phiên cuối đã có trong cache (hoặc `start`) tới hôm nay.
+        Cần mạng; lỗi từng mã bỏ qua (cache cũ vẫn dùng được). Trả về {mã: số phiên trong cache}.
+        """
+        import requests
+        done = {}
+        end_ts = int(time.time())
+        for ticker in tickers:
+            t = clean_ticker(ticker)
+            if t is None: continue
+            s = self.load(t)
+            first = pd.Timestamp(int(s[0][-1]) * NS_PER_DAY) if s is not None and len(s[0]) else pd.Timestamp(start)
+            try:
+                resp = requests.get(DCHART_URL.format(sym=t, start=int(first.timestamp()), end=end_ts),
+                                    headers={'User-Agent': 'Mozilla/5.0'}, timeout=timeout)
+                data = resp.json() if resp.status_code == 200 else {}
+                if not data.get('t'): continue
+                df = pd.DataFrame({'Date': pd.to_datetime(data['t'], unit='s'), 'Close': np.asarray(data['c'], float) * DCHART_UNIT})
+                done[t] = self.save(t, df)
+            except Exception: continue
+        return done
+
+
+def unrealized_pnl(vol, cost_val, prices):
+    """
+    Lãi/lỗ chưa chốt từng ngày (cộng vào giá trị kho theo giá vốn -> giá trị theo giá thị trường).
+    vol, cost_val, prices: ma trận (ngày x mã) SL đang giữ, giá trị theo giá vốn, giá đóng cửa (NaN = không có giá).
+    Chỉ tính ô có giá và SL > 0: SL x giá (tích theo hàng của 2 ma trận) - giá vốn. Không ô nào có giá -> đúng 0.
+    """
+    known = ~np.isnan(prices) & (vol > 0)
+    marked = np.einsum('dt,dt->d', np.where(known, vol, 0.0), np.where(known, prices, 0.0))
+    return marked - np.where(known, cost_val, 0.0).sum(axis=1)
+
+
+if __name__ == "__main__":
+    # Tải/cập nhật cache giá (cần mạng): python -m processors.price_store update HPG FPT ...
+    # Đo thời gian (offline, cache tạm): python -m processors.price_store
+    # Kết quả được kiểm tra trong tests/test_price_store.py
+    import sys, tempfile
+    if len(sys.argv) > 2 and sys.argv[1] == 'update':
+        print(PriceStore().update(sys.argv[2:]))
+        sys.exit()
+
+    r = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PriceStore(tmp)
+        cal = pd.bdate_range('2021-01-04', '2025-12-31')
+        names = [f"M{i:03d}" for i in range(100)]
+        for t in names:
+            store.save(t, pd.DataFrame({'Date': cal, 'Close': 1e4 * np.exp(np.cumsum(r.normal(0, 0.02, len(cal))))}))
+        days = np.arange(day_ordinal(cal[0].value), day_ordinal(cal[-1].value) + 1)
+        vol = r.integers(0, 20, (len(days), len(names))) * 100.0
+        cost = vol * 1e4
+
+        t0 = time.time(); px = store.close_matrix(names, days); t_load = time.time() - t0
+        t0 = time.time(); got = cost.sum(axis=1) + unrealized_pnl(vol, cost, px); t_new = time.time() - t0
+        # Cách cũ: vòng mã x ngày, tra giá phiên gần nhất bằng Series.asof
+        t0 = time.time()
+        series = {t: pd.read_csv(store.path(t), index_col='Date', parse_dates=True)['Close'] for t in names}
+        ref = np.zeros(len(days))
+        for i, d in enumerate(pd.to_datetime(days * NS_PER_DAY)):
+            for j, t in enumerate(names):
+                p = series[t].asof(d)
+                ref[i] += vol[i, j] * p if p == p and vol[i, j] > 0 else cost[i, j]
+        t_old = time.time() - t0
+        print(f"{len(days)} ngày x {len(names)} mã: vòng mã x ngày {t_old:.2f}s, "
+              f"close_matrix {t_load:.2f}s + unrealized_pnl {t_new * 1000:.1f}ms")
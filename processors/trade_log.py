@@ -0,0 +1,173 @@
+# File: processors/trade_log.py
+# Module: Nhật ký giao dịch dạng cột cho PortfolioEngine (Thay list các dict {'Ngày', 'Mã', 'Loại', ...})
+# - Mảng NumPy song song có kiểu cố định (ngày ns, SL, giá bán, giá vốn, lãi/lỗ) + mã, loại, nguồn intern thành id.
+# - trade_log.frame(): DataFrame dựng 1 lần, cache tới lần ghi tiếp theo -> mọi View dùng chung thay vì tự pd.DataFrame(list).
+# - Vẫn len / duyệt / cắt lát / del đuôi như list các dict -> checkpoint, state_as_of và View cũ chạy nguyên.
+
+import numpy as np
+import pandas as pd
+
+from processors.event_time import to_ns
+
+# Cột theo đúng thứ tự khóa dict cũ. 'Giá Bán' = NaN: dòng không có khóa này (lệnh MUA)
+COLUMNS = ('Ngày', 'Mã', 'Loại', 'SL', 'Giá Bán', 'Giá Vốn', 'Lãi/Lỗ', 'Nguồn')
+_CODES = (('Mã', 'sym'), ('Loại', 'kind'), ('Nguồn', 'src'))
+
+
+class TradeLog:
+    """
+    Nhật ký giao dịch chỉ nối thêm. Dòng i nằm ở vị trí i của các mảng (0 <= i < size).
+    Mã / Loại / Nguồn lưu id int32 vào bảng nhãn riêng từng cột (id -1 = None/NaN).
+    """
+
+    _ARRS = (('date', 'int64'), ('qty', 'float64'), ('sell', 'float64'), ('cost', 'float64'), ('pnl', 'float64'),
+             ('sym', 'int32'), ('kind', 'int32'), ('src', 'int32'))
+
+    def __init__(self, capacity=64):
+        for name, dtype in self._ARRS: setattr(self, name, np.empty(capacity, dtype))
+        self.size = 0
+        self.labels = {key: [] for _, key in _CODES}       # cột -> [nhãn theo id]
+        self._label_ids = {key: {} for _, key in _CODES}   # cột -> {nhãn: id}
+        self._frame = None
+
+    # --- Ghi ---
+    def _code(self, key, value):
+        if value is None or (isinstance(value, float) and value != value): return -1  # NaN không làm khóa dict được
+        ids = self._label_ids[key]
+        i = ids.get(value)
+        if i is None:
+            i = ids[value] = len(self.labels[key])
+            self.labels[key].append(value)
+        return i
+
+    def add(self, date, symbol, kind, qty, sell, cost, pnl, source):
+        """Thêm 1 dòng. sell = NaN: dòng không có 'Giá Bán'."""
+        i = self.size
+        if i == len(self.date):
+            for name, dtype in self._ARRS:
+                arr = np.empty(max(64, 2 * i), dtype); arr[:i] = getattr(self, name)[:i]
+                setattr(self, name, arr)
+        self.date[i] = to_ns(date); self.qty[i] = qty; self.sell[i] = sell; self.cost[i] = cost; self.pnl[i] = pnl
+        self.sym[i] = self._code('sym', symbol); self.kind[i] = self._code('kind', kind); self.src[i] = self._code('src', source)
+        self.size = i + 1
+        self._frame = None
+
+    def append(self, row):
+        """Nhận 1 dict như trade_log cũ."""
+        self.add(row['Ngày'], row.get('Mã'), row.get('Loại'), row.get('SL', 0), row.get('Giá Bán', np.nan),
+                 row.get('Giá Vốn', 0), row.get('Lãi/Lỗ', 0), row.get('Nguồn'))
+
+    def extend(self, rows):
+        for r in rows: self.append(r)
+
+    def __delitem__(self, key):
+        """Chỉ hỗ trợ cắt đuôi: del log[k:] (khôi phục checkpoint)."""
+        if not isinstance(key, slice) or key.stop is not None or key.step not in (None, 1):
+            raise TypeError('TradeLog chỉ hỗ trợ del log[k:]')
+        self.size = len(range(self.size)[:key.start or 0])
+        self._frame = None
+
+    # --- Đọc ---
+    def _label(self, key, code):
+        return self.labels[key][code] if code >= 0 else None
+
+    def _row(self, i):
+        row = {'Ngày': pd.Timestamp(int(self.date[i])), 'Mã': self._label('sym', self.sym[i]),
+               'Loại': self._label('kind', self.kind[i]), 'SL': float(self.qty[i])}
+        if self.sell[i] == self.sell[i]: row['Giá Bán'] = float(self.sell[i])
+        row.update({'Giá Vốn': float(self.cost[i]), 'Lãi/Lỗ': float(self.pnl[i]), 'Nguồn': self._label('src', self.src[i])})
+        return row
+
+    def frame(self):
+        """
+        DataFrame của toàn bộ nhật ký (Loại / Nguồn dạng category). Cache tới lần ghi tiếp theo.
+        Dùng chung giữa các View -> CHỈ ĐỌC; cần thêm/sửa cột thì lấy as_frame() (bản sao nông).
+        """
+        if self._frame is not None: return self._frame
+        n = self.size
+        sell = self.sell[:n]
+        has_sell = ~np.isnan(sell)
+        cols = {'Ngày': pd.to_datetime(self.date[:n].copy(), unit='ns'),
+                'Mã': np.array(self.labels['sym'] + [None], dtype=object)[self.sym[:n]],
+                'Loại': pd.Categorical.from_codes(self.kind[:n], self.labels['kind']),
+                'SL': self.qty[:n].copy(), 'Giá Bán': sell.copy(), 'Giá Vốn': self.cost[:n].copy(),
+                'Lãi/Lỗ': self.pnl[:n].copy(),
+                'Nguồn': pd.Categorical.from_codes(self.src[:n], self.labels['src'])}
+        # Thứ tự cột như pd.DataFrame(list dict): 'Giá Bán' ra cuối nếu dòng đầu không có, bỏ hẳn nếu không dòng nào có
+        order = list(COLUMNS)
+        if n and not has_sell[0]:
+            order.remove('Giá Bán')
+            if has_sell.any(): order.append('Giá Bán')
+        self._frame = pd.DataFrame({c: cols[c] for c in order})
+        return self._frame
+
+    def __len__(self): return self.size
+
+    def __iter__(self):
+        for i in range(self.size): yield self._row(i)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            # Bản sao độc lập (Engine state_as_of chạy tiếp trên bản cắt)
+            start, stop, step = key.indices(self.size)
+            if start != 0 or step != 1: return [self._row(i) for i in range(start, stop, step)]
+            out = TradeLog.__new__(TradeLog)
+            out.__setstate__(self.__getstate__(stop))
+            return out
+        n = self.size
+        if key < 0: key += n
+        if not 0 <= key < n: raise IndexError('TradeLog index out of range')
+        return self._row(key)
+
+    def __repr__(self): return f"TradeLog({self.size} dòng)"
+
+    # --- Pickle / deepcopy: chỉ lưu phần đã ghi, không lưu cache ---
+    def __getstate__(self, n=None):
+        n = self.size if n is None else n
+        state = {name: getattr(self, name)[:n].copy() for name, _ in self._ARRS}
+        state['labels'] = {key: list(v) for key, v in self.labels.items()}
+        return state
+
+    def __setstate__(self, state):
+        for name, _ in self._ARRS: setattr(self, name, state[name])
+        self.size = len(state['date'])
+        self.labels = state['labels']
+        self._label_ids = {key: {v: i for i, v in enumerate(vals)} for key, vals in self.labels.items()}
+        self._frame = None
+
+
+def as_frame(trade_log):
+    """
+    DataFrame riêng cho 1 View từ TradeLog / DataFrame / list dict.
+    TradeLog -> bản sao nông của frame() dùng chung (không copy dữ liệu, View thêm/ghi đè cột không ảnh hưởng frame gốc).
+    """
+    if isinstance(trade_log, TradeLog): return trade_log.frame().copy(deep=False)
+    if isinstance(trade_log, pd.DataFrame): return trade_log.copy(deep=False)
+    return pd.DataFrame(trade_log)
+
+
+if __name__ == "__main__":
+    # Đo thời gian 6 View đọc nhật ký: so với list các dict + pd.DataFrame (cách cũ)
+    # Kết quả được kiểm tra trong tests/test_trade_log.py
+    # python -m processors.trade_log [số dòng]
+    import random, sys, time
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    r = random.Random(3)
+    t0 = pd.Timestamp('2018-01-01')
+    rows = []
+    for i in range(n_rows):
+        kind = r.choice(['MUA', 'BÁN', 'CỔ TỨC', 'PHÍ/THUẾ'])
+        row = {'Ngày': t0 + pd.Timedelta(hours=i), 'Mã': f"M{r.randint(0, 300):03d}", 'Loại': kind, 'SL': r.randint(1, 50) * 100.0}
+        if kind != 'MUA': row['Giá Bán'] = r.uniform(5000, 90000)
+        row.update({'Giá Vốn': r.uniform(5000, 90000), 'Lãi/Lỗ': r.uniform(-1e6, 1e6), 'Nguồn': r.choice(['Giao Dịch Mua', 'Mua IPO/Deal', 'Giao Dịch Bán'])})
+        rows.append(row)
+
+    t = time.time()
+    for _ in range(6): ref = pd.DataFrame(rows)
+    t_old = time.time() - t
+    log = TradeLog(); log.extend(rows)
+    t = time.time()
+    for _ in range(6): got = as_frame(log)
+    t_new = time.time() - t
+
+    print(f"{n_rows} dòng, 6 View: pd.DataFrame(list dict) {t_old:.2f}s, frame() dùng chung {t_new:.3f}s")
@@ -1,14 +1,23 @@
 # File: processors/vck_patch.py
 # Version: FINAL PRODUCTION (Logic: Robust Column Search + Anti-Noise Fee + T+15 Tolerance)
 
+import math
+import numbers
 import pandas as pd
 import re
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
 from datetime import datetime
+from processors.workbook import load_workbook
+
+WINDOW_SECONDS = 1300000  # Lệch tối đa ~15 ngày giữa lệnh mua trong sao kê tiền và sự kiện của Adapter
 
 class VCKPatch:
-    def __init__(self):
+    def __init__(self, indexed=True):
         # Regex tìm lệnh mua
         self.regex_missing_buy = r"mua\s+([a-zA-Z0-9]+).*?kl:\s*([\d,]+).*?gia:\s*([\d,]+)"
+        # indexed=True: hợp nhất qua chỉ mục ngày/giá trị (nhanh), False: quét O(N×M) như cũ
+        self.indexed = indexed
 
     def clean_num(self, val):
         if pd.isna(val): return 0.0
@@ -23,12 +32,9 @@ class VCKPatch:
         if isinstance(file_path_or_df, pd.DataFrame):
             df = file_path_or_df
         else:
-            try:
-                try: df = pd.read_excel(file_path_or_df, engine='openpyxl')
-                except: df = pd.read_excel(file_path_or_df)
-            except: 
-                try: df = pd.read_csv(file_path_or_df)
-                except: return original_events
+            # Sheet đầu tiên của Workbook đã parse (dùng chung với Adapter)
+            try: df = load_workbook(file_path_or_df).raw()
+            except: return original_events
 
         # 2. Tìm cột thông minh (Robust Column Search)
         cols_lower = [str(c).lower().strip() for c in df.columns]
@@ -80,7 +86,49 @@ class VCKPatch:
 
         # 4. HỢP NHẤT THÔNG MINH (SMART MERGE - T+15 TOLERANCE)
         new_events = original_events.copy()
+        if self.indexed: self._merge_indexed(new_events, missing_buys)
+        else: self._merge_scan(new_events, missing_buys)
+        return new_events
+
+    def _apply_buy(self, new_events, buy_cmd, is_already_captured, target_event_index):
+        if is_already_captured:
+            return None # Skip
+
+        if target_event_index != -1:
+            # Sửa từ RUT_TIEN thành BUY
+            ev = new_events[target_event_index]
+            ev.update({
+                'type': 'BUY',
+                'ticker': buy_cmd['ticker'],
+                'qty': buy_cmd['qty'],
+                'price': buy_cmd['price'],
+                'source': 'VCK_PATCHED'
+            })
+            return target_event_index
+
+        # Thêm mới (khi chắc chắn ko trùng trong vòng 15 ngày)
+        new_events.append({
+            'date': buy_cmd['date'],
+            'type': 'BUY',
+            'ticker': buy_cmd['ticker'],
+            'qty': buy_cmd['qty'],
+            'price': buy_cmd['price'],
+            'value': buy_cmd['value'],
+            'source': 'VCK_PATCH_NEW',
+            'prio': 2
+        })
+        return len(new_events) - 1
+
+    def _merge_indexed(self, new_events, missing_buys):
+        """Smart Merge trên chỉ mục ngày/giá trị: cùng kết quả với _merge_scan, không quét O(N×M)."""
+        index = _EventIndex(new_events)
+        for buy_cmd in missing_buys:
+            is_already_captured, target_event_index = index.first_match(buy_cmd)
+            i = self._apply_buy(new_events, buy_cmd, is_already_captured, target_event_index)
+            if i is not None: index.add(i)
 
+    def _merge_scan(self, new_events, missing_buys):
+        """Chế độ cũ: quét toàn bộ sự kiện cho từng lệnh mua (giữ làm chuẩn đối chiếu)."""
         for buy_cmd in missing_buys:
             is_already_captured = False
             target_event_index = -1
@@ -90,7 +138,7 @@ class VCKPatch:
                 t_diff_seconds = abs((ev.get('date') - buy_cmd['date']).total_seconds()) if ev.get('date') else 9999999
                 
                 # [QUAN TRỌNG] Chấp nhận lệch tối đa 15 ngày (1,300,000 giây)
-                if t_diff_seconds < 1300000: 
+                if t_diff_seconds < WINDOW_SECONDS: 
                     
                     # CASE A: Adapter đã bắt đúng (Trùng Ticker + Trùng Qty) -> BỎ QUA
                     if (ev.get('type') == 'BUY' and 
@@ -100,35 +148,102 @@ class VCKPatch:
                         break 
                     
                     # CASE B: Adapter bắt nhầm là RUT_TIEN (Trùng Value) -> ĐÁNH DẤU ĐỂ SỬA
-                    val_diff = abs(ev.get('value', 0) - buy_cmd['value'])
-                    if (ev.get('type') != 'BUY' and val_diff < 50):
+                    value = _value(ev)
+                    if (ev.get('type') != 'BUY' and value is not None and abs(value - buy_cmd['value']) < 50):
                         target_event_index = i
                         break
             
-            if is_already_captured:
-                continue # Skip
-
-            if target_event_index != -1:
-                # Sửa từ RUT_TIEN thành BUY
-                ev = new_events[target_event_index]
-                ev.update({
-                    'type': 'BUY',
-                    'ticker': buy_cmd['ticker'],
-                    'qty': buy_cmd['qty'],
-                    'price': buy_cmd['price'],
-                    'source': 'VCK_PATCHED'
-                })
-            else:
-                # Thêm mới (khi chắc chắn ko trùng trong vòng 15 ngày)
-                new_events.append({
-                    'date': buy_cmd['date'],
-                    'type': 'BUY',
-                    'ticker': buy_cmd['ticker'],
-                    'qty': buy_cmd['qty'],
-                    'price': buy_cmd['price'],
-                    'value': buy_cmd['value'],
-                    'source': 'VCK_PATCH_NEW',
-                    'prio': 2
-                })
-
-        return new_events
\ No newline at end of file
+            self._apply_buy(new_events, buy_cmd, is_already_captured, target_event_index)
+
+
+def _in_window(ev, buy_cmd):
+    """Đúng biểu thức lệch ngày của _merge_scan (kể cả NaT -> nan -> False)."""
+    return (abs((ev.get('date') - buy_cmd['date']).total_seconds()) if ev.get('date') else 9999999) < WINDOW_SECONDS
+
+
+def _value(ev):
+    """value của sự kiện nếu là số, không thì None (value=None / chuỗi không bao giờ khớp CASE B)."""
+    v = ev.get('value', 0)
+    return v if isinstance(v, numbers.Real) else None
+
+
+def _to_ns(d):
+    try: return None if d is None or pd.isna(d) else pd.Timestamp(d).value
+    except: return None
+
+
+class _EventIndex:
+    """
+    Chỉ mục cho Smart Merge. Sự kiện đầu tiên (index nhỏ nhất) trong cửa sổ ±15 ngày thỏa 1 trong 2:
+    - CASE A: BUY cùng ticker + lệch qty < 1  -> buys[ticker] = [(ngày ns, i)] sắp theo ngày, bisect cửa sổ.
+    - CASE B: không phải BUY + lệch value < 50 -> others[value // 50] = [i] tăng dần, chỉ xét 3 xô kề nhau.
+    Mọi ứng viên vẫn được kiểm lại bằng đúng biểu thức của bản quét cũ.
+    """
+    _BUCKET = 50
+    _WINDOW_NS = (WINDOW_SECONDS + 1) * 10**9  # Nới 1 giây, điều kiện chính xác do _in_window quyết định
+
+    def __init__(self, events):
+        self.events = events
+        self.buys = defaultdict(list)
+        self.others = defaultdict(list)
+        self._other_key = {}
+        for i in range(len(events)): self.add(i)
+
+    def add(self, i):
+        """Đưa sự kiện i vào chỉ mục (gọi lại sau khi sự kiện bị sửa thành BUY)."""
+        ev = self.events[i]
+        if i in self._other_key: self.others[self._other_key.pop(i)].remove(i)
+        ns = _to_ns(ev.get('date'))
+        if ns is None: return # Không có ngày -> không bao giờ nằm trong cửa sổ
+        if ev.get('type') == 'BUY':
+            insort(self.buys[ev.get('ticker')], (ns, i))
+            return
+        v = _value(ev)
+        if v is None or v != v: return # Không phải số / NaN
+        key = math.floor(v / self._BUCKET)
+        insort(self.others[key], i)
+        self._other_key[i] = key
+
+    def first_match(self, buy_cmd):
+        """(is_already_captured, target_event_index) giống vòng lặp của _merge_scan."""
+        ns = _to_ns(buy_cmd['date'])
+        if ns is None: return False, -1
+        best, captured = None, False
+
+        lst = self.buys.get(buy_cmd['ticker'], [])
+        lo = bisect_left(lst, (ns - self._WINDOW_NS, -1))
+        hi = bisect_right(lst, (ns + self._WINDOW_NS, len(self.events)))
+        for _, i in lst[lo:hi]:
+            if best is not None and i > best: continue
+            ev = self.events[i]
+            if _in_window(ev, buy_cmd) and abs(ev.get('qty', 0) - buy_cmd['qty']) < 1:
+                best, captured = i, True
+
+        key = math.floor(buy_cmd['value'] / self._BUCKET)
+        for k in (key - 1, key, key + 1):
+            for i in self.others.get(k, ()):
+                if best is not None and i > best: break
+                ev = self.events[i]
+                if _in_window(ev, buy_cmd) and abs(_value(ev) - buy_cmd['value']) < 50:
+                    best, captured = i, False
+                    break
+
+        if best is None: return False, -1
+        return (True, -1) if captured else (False, best)
+
+
+if __name__ == "__main__":
+    # Test nhanh: đối chiếu Smart Merge có chỉ mục với bản quét cũ + đo thời gian
+    # python -m processors.vck_patch <file.xlsx>
+    import copy, sys, time
+    from processors.adapter_vck import VCKAdapter
+    path = sys.argv[1]
+    events = VCKAdapter().parse(path)
+    res = {}
+    for mode in (False, True):
+        p = VCKPatch(indexed=mode)
+        t0 = time.time()
+        res[mode] = pd.DataFrame(p.apply_patch(copy.deepcopy(events), path))
+        print(f"{'indexed' if mode else 'scan'}: {len(res[mode])} events, {time.time() - t0:.2f}s")
+    pd.testing.assert_frame_equal(res[False], res[True])
+    print("✅ Hai chế độ cho kết quả giống nhau")
@@ -0,0 +1,271 @@
+# File: processors/workbook.py
+# Module: Workbook đã parse (Mỗi sheet chỉ decode XLSX đúng 1 lần cho mỗi file upload)
+# Dùng chung cho VCKAdapter, VPSAdapter, VCKPatch, patch_dividend_fix và history_VCK.
+# Backend đọc XLSX chọn được: calamine (nếu cài python-calamine) > openpyxl_stream > pandas, lỗi thì tự lùi.
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+try:
+    import python_calamine  # noqa: F401
+    _HAS_CALAMINE = True
+except ImportError:
+    _HAS_CALAMINE = False
+
+# 'auto' = thử lần lượt _AUTO_ORDER. Đặt tên backend cụ thể để ép dùng (vẫn lùi về pandas nếu lỗi).
+READER_BACKEND = 'auto'
+_AUTO_ORDER = ('calamine', 'openpyxl_stream', 'pandas')
+
+# Cache theo hash nội dung file: { sha256: ParsedWorkbook }
+_WORKBOOK_CACHE = OrderedDict()
+_CACHE_SIZE = 8
+_LOCK = threading.Lock()
+
+
+def normalize_col(c):
+    """Chuẩn hóa tên cột mặc định: bỏ khoảng trắng 2 đầu + chữ thường."""
+    return str(c).strip().lower()
+
+
+def _source_name(source):
+    if isinstance(source, (str, os.PathLike)): return str(source)
+    return str(getattr(source, 'name', '') or '')
+
+
+def _read_bytes(source):
+    """Lấy toàn bộ bytes của file (Path / UploadedFile / BytesIO / file object)."""
+    if isinstance(source, (bytes, bytearray)): return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f: return f.read()
+    if hasattr(source, 'getvalue'): return source.getvalue()
+    if hasattr(source, 'read'):
+        try: source.seek(0)
+        except: pass
+        data = source.read()
+        try: source.seek(0)
+        except: pass
+        return data
+    raise TypeError(f"Không đọc được nguồn dữ liệu: {type(source)}")
+
+
+# =================================================================
+# BACKEND ĐỌC XLSX: cùng giao diện sheet_names + read(sheet, header, nrows),
+# kiểu dữ liệu ô (ngày, số, chuỗi có dấu phân cách nghìn) giống hệt pd.read_excel.
+# =================================================================
+class _PandasReader:
+    name = 'pandas'
+    engine = None
+
+    def __init__(self, data):
+        self._xls = pd.ExcelFile(io.BytesIO(data), engine=self.engine)
+        self.sheet_names = list(self._xls.sheet_names)
+
+    def read(self, sheet_name, header=0, nrows=None):
+        return pd.read_excel(self._xls, sheet_name=sheet_name, header=header, nrows=nrows)
+
+
+class _CalamineReader(_PandasReader):
+    """Reader viết bằng Rust (python-calamine), pandas hỗ trợ sẵn qua engine='calamine'."""
+    name = 'calamine'
+    engine = 'calamine'
+
+    def __init__(self, data):
+        if not _HAS_CALAMINE: raise ImportError("python-calamine chưa được cài")
+        super().__init__(data)
+
+
+_EXCEL_ERRORS = {'#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A'}
+
+
+# Chữ ký đầu file Excel: XLSX (ZIP) và XLS (OLE2)
+_EXCEL_MAGIC = (b'PK\x03\x04', b'\xd0\xcf\x11\xe0')
+
+
+def _convert_value(v):
+    """Giống OpenpyxlReader._convert_cell của pandas nhưng trên giá trị thô (values_only)."""
+    if v is None: return ""
+    if isinstance(v, float) or (isinstance(v, int) and not isinstance(v, bool)):
+        i = int(v)
+        return i if i == v else float(v)
+    return v
+
+
+def _convert_cell(c):
+    """Như _convert_value nhưng biết kiểu ô: chỉ ô lỗi thật (data_type 'e') thành NaN, chữ '#REF!' gõ tay giữ nguyên."""
+    return np.nan if c.data_type == 'e' else _convert_value(c.value)
+
+
+class _OpenpyxlStreamReader:
+    """openpyxl read-only, iter_rows(values_only=True): không dựng object Cell cho từng ô."""
+    name = 'openpyxl_stream'
+
+    def __init__(self, data):
+        from openpyxl import load_workbook as _open_xlsx
+        self._book = _open_xlsx(io.BytesIO(data), read_only=True, data_only=True, keep_links=False)
+        self.sheet_names = list(self._book.sheetnames)
+
+    def read(self, sheet_name, header=0, nrows=None):
+        ws = self._book[sheet_name]
+        ws.reset_dimensions()
+        # Số dòng cần đọc khi có nrows (giống BaseExcelReader._calc_rows)
+        need = None if nrows is None else (1 if header is None else 1 + header) + nrows
+        rows, suspect = self._scan(ws, need, typed=False)
+        # values_only không phân biệt ô lỗi với chữ '#REF!' gõ tay -> có nghi vấn thì đọc lại kèm kiểu ô
+        if suspect: rows, _ = self._scan(ws, need, typed=True)
+        if not rows: return pd.DataFrame()
+        width = max(len(r) for r in rows)
+        rows = [r + [""] * (width - len(r)) for r in rows]
+        return TextParser(rows, header=header, nrows=nrows, skip_blank_lines=False).read(nrows=nrows)
+
+    @staticmethod
+    def _scan(ws, need, typed):
+        rows, last, suspect = [], -1, False
+        for i, row in enumerate(ws.iter_rows(values_only=not typed)):
+            if typed: row = [_convert_cell(c) for c in row]
+            else:
+                row = [_convert_value(v) for v in row]
+                suspect = suspect or any(isinstance(v, str) and v in _EXCEL_ERRORS for v in row)
+            while row and row[-1] == "": row.pop()
+            if row: last = i
+            rows.append(row)
+            if need is not None and len(rows) >= need: break
+        return rows[:last + 1], suspect
+
+
+READERS = {'pandas': _PandasReader, 'openpyxl_stream': _OpenpyxlStreamReader, 'calamine': _CalamineReader}
+
+
+def _open_reader(data, backend=None):
+    """Mở file bằng backend đầu tiên dùng được. Tất cả đều lỗi -> ném lỗi cuối cùng."""
+    backend = backend or READER_BACKEND
+    order = _AUTO_ORDER if backend == 'auto' else (backend, 'pandas')
+    err = None
+    for name in order:
+        try: return READERS[name](data)
+        except Exception as e: err = e
+    raise err
+
+
+class ParsedWorkbook:
+    """
+    Giữ các sheet của 1 file sao kê dưới dạng DataFrame.
+    - Sheet chỉ được decode khi có người hỏi tới (lazy) và chỉ decode 1 lần.
+    - File CSV được coi như workbook có 1 sheet tên 'sheet1'.
+    """
+    def __init__(self, data, name='', digest=None, backend=None):
+        self.data = data
+        self.name = name
+        self.digest = digest or hashlib.sha256(data).hexdigest()
+        self._reader = None
+        self._frames = {}
+        self._lock = threading.Lock()
+
+        self.is_csv = name.lower().endswith('.csv')
+        if not self.is_csv:
+            try: self._reader = _open_reader(data, backend)
+            except:
+                if data[:4] in _EXCEL_MAGIC: raise  # Đúng là file Excel nhưng hỏng -> báo lỗi, không đọc như CSV
+                self.is_csv = True  # Không phải Excel -> thử đọc như CSV
+
+        self.backend = self._reader.name if self._reader is not None else 'csv'
+        self.sheet_names = list(self._reader.sheet_names) if self._reader is not None else ['sheet1']
+        # Map tên sheet chữ thường -> tên gốc (giống cách các Adapter vẫn dò sheet)
+        self.sheet_map = {s.lower(): s for s in self.sheet_names}
+
+    def find_sheet(self, *keywords, exclude=()):
+        """Tìm sheet đầu tiên có chứa 1 trong các từ khóa (so khớp chữ thường)."""
+        return next((self.sheet_map[s] for s in self.sheet_map
+                     if any(k in s for k in keywords) and not any(x in s for x in exclude)), None)
+
+    def read(self, sheet_name=None, header=0, nrows=None):
+        """Đọc sheet qua backend (không cache) - dùng khi cần header/nrows khác mặc định."""
+        if sheet_name is None: sheet_name = self.sheet_names[0]
+        if self._reader is None:
+            return pd.read_csv(io.BytesIO(self.data), header=header, nrows=nrows)
+        try: return self._reader.read(sheet_name, header=header, nrows=nrows)
+        except Exception:
+            if self._reader.name == 'pandas': raise
+            # Backend nhanh lỗi với sheet này -> đọc lại bằng pandas mặc định
+            return _PandasReader(self.data).read(sheet_name, header=header, nrows=nrows)
+
+    def raw(self, sheet_name=None):
+        """DataFrame gốc (header=0) của sheet. Không được sửa trực tiếp -> dùng sheet()."""
+        if sheet_name is None: sheet_name = self.sheet_names[0]
+        with self._lock:
+            if sheet_name not in self._frames:
+                self._frames[sheet_name] = self.read(sheet_name)
+            return self._frames[sheet_name]
+
+    def sheet(self, sheet_name=None, normalize=normalize_col):
+        """Bản sao nông của sheet với tên cột đã chuẩn hóa (normalize=None: giữ tên gốc)."""
+        df = self.raw(sheet_name).copy(deep=False)
+        if normalize is not None:
+            df.columns = [normalize(c) for c in df.columns]
+        return df
+
+
+def load_workbook(source):
+    """
+    Trả về ParsedWorkbook cho nguồn dữ liệu, dùng lại bản đã parse nếu nội dung file trùng hash.
+    Chấp nhận: đường dẫn, UploadedFile của Streamlit, BytesIO, bytes hoặc chính ParsedWorkbook.
+    """
+    if isinstance(source, ParsedWorkbook): return source
+    data = _read_bytes(source)
+    digest = hashlib.sha256(data).hexdigest()
+    with _LOCK:
+        wb = _WORKBOOK_CACHE.get(digest)
+        if wb is not None:
+            _WORKBOOK_CACHE.move_to_end(digest)
+            return wb
+
+    wb = ParsedWorkbook(data, _source_name(source), digest)
+    with _LOCK:
+        _WORKBOOK_CACHE[digest] = wb
+        while len(_WORKBOOK_CACHE) > _CACHE_SIZE:
+            _WORKBOOK_CACHE.popitem(last=False)
+    return wb
+
+
+def file_digest(source):
+    """SHA-256 nội dung file (không decode XLSX) - dùng làm key cho cache trên đĩa."""
+    if isinstance(source, ParsedWorkbook): return source.digest
+    return hashlib.sha256(_read_bytes(source)).hexdigest()
+
+
+def clear_workbook_cache():
+    with _LOCK: _WORKBOOK_CACHE.clear()
+
+
+def set_reader_backend(name):
+    """Chọn backend đọc XLSX ('auto', 'calamine', 'openpyxl_stream', 'pandas') cho các file nạp sau."""
+    global READER_BACKEND
+    if name != 'auto' and name not in READERS: raise ValueError(f"Backend không hợp lệ: {name}")
+    READER_BACKEND = name
+    clear_workbook_cache()
+
+
+if __name__ == "__main__":
+    # Test nhanh: mọi backend cho cùng DataFrame (cả kiểu dữ liệu) + đo thời gian
+    # python -m processors.workbook <file.xlsx>
+    import sys, time
+    data = _read_bytes(sys.argv[1])
+    res = {}
+    for name, cls in READERS.items():
+        try: reader = cls(data)
+        except Exception as e:
+            print(f"{name}: bỏ qua ({e})")
+            continue
+        t0 = time.time()
+        res[name] = {sh: reader.read(sh) for sh in reader.sheet_names}
+        res[name]['_head'] = reader.read(reader.sheet_names[0], header=None, nrows=20)
+        print(f"{name}: {time.time() - t0:.2f}s")
+    for name, frames in res.items():
+        for sh, df in frames.items(): pd.testing.assert_frame_equal(res['pandas'][sh], df)
+    print("✅ Các backend cho kết quả giống nhau")
@@ -0,0 +1,55 @@
+# File: tests/conftest.py
+# Chạy từ gốc repo: python -m pytest -q tests
+import os
+import random
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processors.engine import PortfolioEngine  # noqa: E402
+
+
+def _random_events(n, seed=5, start='2022-01-03', n_sym=8):
+    # Sự kiện Engine ngẫu nhiên: nạp/rút, mua/bán (tên chuẩn + đồng nghĩa), cổ tức, phí; nhiều sự kiện/ngày + CASH_SNAPSHOT cuối
+    r = random.Random(seed)
+    d = pd.Timestamp(start)
+    out = [{'date': d, 'type': 'NAP_TIEN', 'value': 5e9}]
+    for _ in range(n - 1):
+        d += pd.Timedelta(hours=r.randint(0, 30))
+        sym = f"M{r.randint(0, n_sym - 1)}"
+        k = r.random()
+        if k < 0.40: out.append({'date': d, 'type': r.choice(['MUA', 'BUY']), 'ticker': sym, 'qty': 100.0 * r.randint(1, 20), 'price': r.uniform(1e4, 9e4)})
+        elif k < 0.75: out.append({'date': d, 'type': r.choice(['BAN', 'SELL']), 'ticker': sym, 'qty': 100.0 * r.randint(1, 20), 'price': r.uniform(1e4, 9e4)})
+        elif k < 0.85: out.append({'date': d, 'type': 'CO_TUC_TIEN', 'ticker': sym, 'val': r.uniform(1e5, 1e7)})
+        elif k < 0.90: out.append({'date': d, 'type': 'PHI_THUE', 'value': r.uniform(1e4, 1e6)})
+        elif k < 0.95: out.append({'date': d, 'type': 'NAP_TIEN', 'value': r.uniform(1e7, 1e9)})
+        else: out.append({'date': d, 'type': 'RUT_TIEN', 'value': r.uniform(1e6, 1e8)})
+    # Như VCK: số dư thực tế chốt cuối list -> mọi sự kiện trước đó được cộng/trừ tiền (Snapshot Authority)
+    out[-1] = {'date': d + pd.Timedelta(days=1), 'type': 'CASH_SNAPSHOT', 'val': 1e9}
+    return out
+
+
+@pytest.fixture
+def make_events():
+    return _random_events
+
+
+@pytest.fixture
+def events():
+    return _random_events(600)
+
+
+@pytest.fixture
+def snapshot_engine():
+    # Như VCK: CASH_SNAPSHOT cuối list đặt lại tiền mặt (lệch 500 triệu so với số Engine tự tính).
+    # Ngày cố định (thứ 3) thay datetime.now() để ngày đặt lại luôn là ngày giao dịch.
+    events = [
+        {'date': pd.Timestamp('2025-01-02'), 'type': 'NAP_TIEN', 'value': 1e9},
+        {'date': pd.Timestamp('2025-01-03'), 'type': 'BUY', 'ticker': 'HPG', 'qty': 1000, 'price': 20000, 'value': 2e7},
+        {'date': pd.Timestamp('2025-06-03 10:30'), 'type': 'CASH_SNAPSHOT', 'val': 1.48e9},
+    ]
+    eng = PortfolioEngine('vck'); eng.run(events)
+    return eng
@@ -0,0 +1,89 @@
+# File: tests/test_adapter_vps.py
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from processors.adapter_vps import VPSAdapter
+
+
+def _vps_file(path, cash, ck, pnl):
+    # Sao kê VPS xếp mới -> cũ: truyền vào theo thời gian, ghi ra đảo ngược
+    with pd.ExcelWriter(path) as w:
+        pd.DataFrame(cash[::-1], columns=['Ngày', 'Mô tả', 'Phát sinh giảm', 'Phát sinh tăng', 'Số dư']).to_excel(w, sheet_name='Tiền', index=False)
+        pd.DataFrame(ck[::-1], columns=['Ngày', 'Mã CK', 'Mô tả', 'Tăng', 'Giảm']).to_excel(w, sheet_name='CK', index=False)
+        pd.DataFrame(pnl, columns=['Ngày', 'Mã CK', 'Lãi lỗ']).to_excel(w, sheet_name='Lãi lỗ', index=False)
+
+
+def _workbook(path):
+    d = lambda day: datetime(2024, 3, day)
+    cash = [
+        [d(1), 'Nộp tiền vào tài khoản', 0, 900_000_000, 900_000_000],
+        [d(2), 'Issued more shares 500 HPG', 5_000_000, 0, 895_000_000],
+        [d(2), 'Nop tien mua 300 cp FPT', 3_600_000, 0, 891_400_000],
+        [d(4), 'Mua SSI KL 1,000 SSI', 25_000_000, 0, 866_400_000],
+        [d(8), 'Mua SSI KL 1,000 SSI', 27_000_000, 0, 839_400_000],
+        [d(9), 'Issued more shares 200 HPG', 2_400_000, 0, 837_000_000],
+        [d(10), 'Phí giao dịch SSI', '52,000', 0, 836_948_000],
+    ]
+    ck = [
+        [d(3), 'HPG_WFT', 'Phát hành thêm HPG', 500, 0],   # Khớp két Quyền qua mã gốc HPG
+        [d(3), 'FPT_WFT', 'Lưu ký FPT', 300, 0],           # Khớp két IPO FPT
+        [d(5), 'HPG', 'Chuyển chứng khoán HPG', 500, 0],   # Giá cache từ lần khớp quyền 10.000
+        [d(6), 'SSI', 'Mua SSI', 100, 0],                  # Cách 4/8 hai ngày mua -> hòa, lấy ngày trước
+        [d(7), 'SSI', 'Mua SSI', 100, 0],                  # Gần ngày 8 hơn
+        [d(12), 'HPG_WFT', 'Quyền mua HPG', 200, 0],
+        [d(13), 'HPG', 'Chuyển chứng khoán HPG', 200, 0],  # Giá cache mới 12.000
+        [d(18), 'SSI', 'Mua SSI', 100, 0],                 # Cách ngày 8 đúng 10 ngày -> vẫn khớp
+        [d(19), 'SSI', 'Mua SSI', 100, 0],                 # Quá 10 ngày -> giá 0
+        [d(20), 'SSI', 'Bán SSI', 0, 300],
+    ]
+    pnl = [[d(20), 'SSI', 150_000], [None, 'HPG', -20_000], ['khong ro', 'FPT', 30_000], ['21/03/2024', 'VND', 0]]
+    _vps_file(path, cash, ck, pnl)
+
+
+def _linear_lookup(adapter, sym, d_obj):
+    # Bản cũ: dò lần lượt lệch 0, -1, +1, -2, +2 ... ±10 ngày trên buy_aggregator
+    for delta in sorted(range(-10, 11), key=abs):
+        data = adapter.buy_aggregator.get((sym, (d_obj + timedelta(days=delta)).strftime('%Y-%m-%d')))
+        if data and data['qty'] > 0: return data['cost'] / data['qty']
+    return 0
+
+
+def test_price_index_matches_linear_search():
+    r = random.Random(8)
+    adapter = VPSAdapter()
+    d0 = datetime(2024, 1, 1)
+    for _ in range(60):
+        key = (r.choice(['HPG', 'FPT']), (d0 + timedelta(days=r.randrange(0, 90, 2))).strftime('%Y-%m-%d'))
+        adapter.buy_aggregator[key]['qty'] += r.choice([0, 100, 200])  # qty 0 -> không có giá
+        adapter.buy_aggregator[key]['cost'] += r.randrange(1, 50) * 100_000
+    index = adapter._build_price_index()
+    # Ngày chẵn có giá, ngày lẻ nằm giữa 2 ngày cách đều (hòa -> ngày trước); giờ trong ngày không ảnh hưởng; ngoài ±10 ngày -> 0
+    queries = [(sym, d0 + timedelta(days=k, hours=h)) for sym in ('HPG', 'FPT', 'SSI') for k in range(-15, 110) for h in (0, 23)]
+    expected = [_linear_lookup(adapter, sym, d) for sym, d in queries]
+    assert [adapter._lookup_price(index, sym, d) for sym, d in queries] == expected
+    probed = adapter._probe_price(pd.Series([s for s, _ in queries]), pd.Series([d for _, d in queries]), index)
+    assert probed.tolist() == pytest.approx(expected)
+    assert 0 in expected and len(set(expected)) > 10
+
+
+def test_columnar_matches_row_mode(tmp_path):
+    path = str(tmp_path / 'vps.xlsx')
+    _workbook(path)
+    col = pd.DataFrame(VPSAdapter(columnar=True).parse(path))
+    row = pd.DataFrame(VPSAdapter(columnar=False).parse(path))
+    pd.testing.assert_frame_equal(col, row, check_dtype=False)
+
+    buys = row[row['type'] == 'BUY'].set_index(['date', 'ticker'])['price']
+    assert buys[(datetime(2024, 3, 3), 'HPG_WFT')] == 10_000
+    assert buys[(datetime(2024, 3, 3), 'FPT_WFT')] == 12_000
+    assert buys[(datetime(2024, 3, 5), 'HPG')] == 10_000
+    assert buys[(datetime(2024, 3, 13), 'HPG')] == 12_000
+    assert buys[(datetime(2024, 3, 6), 'SSI')] == 25_000
+    assert buys[(datetime(2024, 3, 7), 'SSI')] == 27_000
+    assert buys[(datetime(2024, 3, 18), 'SSI')] == 27_000
+    assert buys[(datetime(2024, 3, 19), 'SSI')] == 0
+    pnl = row[row['type'] == 'PNL_UPDATE']
+    assert len(pnl) == 3 and pnl['date'].isna().sum() == 2  # Dòng không có ngày -> NaT, không phải giờ chạy
@@ -0,0 +1,35 @@
+# File: tests/test_batch_engine.py
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from processors.batch_engine import BatchEngine
+from processors.engine import PortfolioEngine
+
+
+def _same(eng, reports):
+    for x, y in zip(eng.generate_reports(), reports): pd.testing.assert_frame_equal(x, y)
+
+
+def test_batch_matches_separate_engines(make_events):
+    # Mỗi tài khoản 1 list riêng, lệch ngày nhau (ngày chốt số dư khác nhau)
+    accounts = {f"KH{a}": make_events(150 + 40 * a, seed=a, start=f"2022-0{a + 1}-03") for a in range(5)}
+    single = {}
+    for a, evs in accounts.items():
+        single[a] = PortfolioEngine(a); single[a].run(evs)
+    batch = BatchEngine().run(accounts)
+    for a in accounts:
+        _same(single[a], batch.generate_reports(a))
+        assert (single[a].real_cash_balance, single[a].total_profit) == (batch.accounts[a].real_cash_balance, batch.accounts[a].total_profit)
+
+    # List gắn mã tài khoản, các tài khoản xen kẽ nhau (thứ tự trong từng tài khoản giữ nguyên)
+    lists = [[{**e, 'account': a} for e in evs] for a, evs in accounts.items()]
+    tagged = [e for grp in itertools.zip_longest(*lists) for e in grp if e is not None]
+    for a, eng in BatchEngine().run(tagged).accounts.items(): _same(single[a], eng.generate_reports())
+
+    # Báo cáo gộp
+    cash = batch.cash_report(); hold = batch.holdings(consolidated=True); lots = batch.lots()
+    assert np.isclose(hold['Vốn Gốc (Mua)'].sum(), (lots['SL Tồn'] * lots['Giá Vốn Gốc']).sum())
+    assert np.isclose(cash['Tiền Mặt'].iloc[-1], sum(e.real_cash_balance for e in single.values()))
+    pd.testing.assert_frame_equal(batch.cycles(), batch.generate_reports()[1], check_dtype=False)
@@ -0,0 +1,22 @@
+# File: tests/test_engine.py
+import pandas as pd
+
+from processors.engine import PortfolioEngine
+
+
+def _same_reports(a, b):
+    for x, y in zip(a.generate_reports(), b.generate_reports()): pd.testing.assert_frame_equal(x, y)
+
+
+def test_state_as_of_matches_replay(events, monkeypatch):
+    monkeypatch.setattr(PortfolioEngine, 'SNAPSHOT_EVERY', 50)  # Nhiều snapshot trên list nhỏ
+    eng = PortfolioEngine('t'); eng.run(events)
+    days = pd.Series([e['date'] for e in events]).dt.normalize().drop_duplicates().sample(12, random_state=1)
+    for day in days:
+        got = eng.engine_as_of(day)
+        ref = PortfolioEngine('t'); ref.last_snapshot_date = eng.last_snapshot_date; ref.today = day
+        for e in events:
+            if pd.Timestamp(e['date']).normalize() > day: break
+            ref.process_event(e)
+        _same_reports(got, ref)
+        assert (got.real_cash_balance, got.total_profit, len(got.trade_log)) == (ref.real_cash_balance, ref.total_profit, len(ref.trade_log))
@@ -0,0 +1,78 @@
+# File: tests/test_engine_checkpoint.py
+import pickle
+import zlib
+
+import pandas as pd
+import pytest
+
+from processors import engine_checkpoint
+from processors.engine import PortfolioEngine
+
+
+@pytest.fixture
+def events(events):
+    # CASH_SNAPSHOT ghi lúc parse (datetime.now() như VCK) -> không nằm trong checkpoint
+    return events[:-1] + [{**events[-1], 'date': pd.Timestamp.now()}]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine_checkpoint, 'STORE_DIR', str(tmp_path / 'engine'))
+    monkeypatch.setattr(engine_checkpoint, 'MIN_EVENTS', 0)
+    monkeypatch.setattr(engine_checkpoint, 'REFRESH_EVENTS', 1)
+    monkeypatch.setattr(engine_checkpoint, '_evict', lambda keep=None: None)
+    return tmp_path
+
+
+def _same(a, b):
+    for x, y in zip(a.generate_reports(), b.generate_reports()): pd.testing.assert_frame_equal(x, y)
+    assert (a.real_cash_balance, a.total_deposit, a.total_profit) == (b.real_cash_balance, b.total_deposit, b.total_profit)
+    assert a.trade_log_frame().equals(b.trade_log_frame()) and len(a.all_raw_events) == len(b.all_raw_events)
+    pd.testing.assert_frame_equal(a.nav.frame('event'), b.nav.frame('event'))
+
+
+def test_resume_matches_full_replay(events, store):
+    # "File cũ" = 80% sự kiện đầu + CASH_SNAPSHOT cuối; file mới chạy tiếp từ checkpoint
+    stable = engine_checkpoint.stable_count(events)
+    old = events[:int(stable * 0.8)] + events[stable:]
+    engine_checkpoint.run_engine(PortfolioEngine('t'), old)
+    full = PortfolioEngine('t'); full.run(events)
+    res = PortfolioEngine('t'); engine_checkpoint.run_engine(res, events)
+    assert res.resumed_from == int(stable * 0.8) and engine_checkpoint.STATS['resumed']
+    _same(full, res)
+    # Checkpoint mới (hash nối tiếp đoạn mới) vẫn nạp được cho lần sau
+    again = PortfolioEngine('t'); engine_checkpoint.run_engine(again, events)
+    assert again.resumed_from == stable
+    _same(full, again)
+
+
+@pytest.mark.parametrize('damage', ['garbage', 'truncated', 'old_version'])
+def test_bad_checkpoint_file_falls_back_to_full_replay(events, store, damage):
+    engine_checkpoint.run_engine(PortfolioEngine('t'), events)
+    path = engine_checkpoint._store_path(PortfolioEngine('t'), events)
+    with open(path, 'rb') as f: blob = f.read()
+    if damage == 'garbage': blob = b'\x00 khong phai checkpoint'
+    elif damage == 'truncated': blob = blob[:len(blob) // 2]
+    else:
+        cp = pickle.loads(zlib.decompress(blob))
+        blob = zlib.compress(pickle.dumps({**cp, 'version': cp['version'] - 1}))
+    with open(path, 'wb') as f: f.write(blob)
+
+    res = PortfolioEngine('t'); engine_checkpoint.run_engine(res, events)
+    assert res.resumed_from == 0
+    full = PortfolioEngine('t'); full.run(events)
+    _same(full, res)
+    # File hỏng đã bị ghi đè bằng checkpoint mới -> lần sau chạy tiếp được
+    again = PortfolioEngine('t'); engine_checkpoint.run_engine(again, events)
+    assert again.resumed_from == engine_checkpoint.stable_count(events)
+
+
+def test_changed_prefix_replays_from_start(events, store):
+    stable = engine_checkpoint.stable_count(events)
+    first = PortfolioEngine('t'); first.run(events, checkpoint_at=stable)
+    edited = [dict(e) for e in events]
+    edited[10]['qty'] = edited[10].get('qty', 0) + 100
+    res = PortfolioEngine('t'); res.run(edited, checkpoint=first.last_checkpoint)
+    assert res.resumed_from == 0
+    ref = PortfolioEngine('t'); ref.run(edited)
+    _same(ref, res)
@@ -0,0 +1,23 @@
+# File: tests/test_event_time.py
+import random
+
+import pandas as pd
+
+from processors.event_time import day_ordinal, event_ns, sort_events
+
+
+def test_event_time_matches_timestamp_and_sorted(events):
+    r = random.Random(2)
+    shuffled = [{**e, 'prio': r.randint(1, 5)} for e in events]
+    r.shuffle(shuffled)
+    ns = event_ns(shuffled)
+    assert ns.tolist() == [pd.Timestamp(e['date']).value for e in shuffled]
+    ref = sorted(shuffled, key=lambda x: (x['date'], x.get('prio', 50)))
+    assert all(a is b for a, b in zip(ref, sort_events(shuffled)))
+    assert day_ordinal(ns).tolist() == [e['date'].date().toordinal() - 719163 for e in shuffled]  # 719163 = date(1970, 1, 1).toordinal()
+
+
+def test_event_ns_reads_strings_and_missing_dates():
+    got = event_ns([{'date': '2024-03-05'}, {'date': pd.Timestamp('2024-03-06 10:00')}, {}])
+    assert got[:2].tolist() == [pd.Timestamp('2024-03-05').value, pd.Timestamp('2024-03-06 10:00').value]
+    assert pd.Timestamp(int(got[2])) is pd.NaT
@@ -0,0 +1,82 @@
+# File: tests/test_incremental.py
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from processors import incremental
+from processors.adapter_vck import VCKAdapter
+
+
+def _vck_file(path, cash, ck):
+    with pd.ExcelWriter(path) as w:
+        pd.DataFrame(cash, columns=['Ngày GD', 'Nội dung', 'Phát sinh tăng', 'Phát sinh giảm', 'Số dư']).to_excel(w, sheet_name='Tiền', index=False)
+        pd.DataFrame(ck, columns=['Ngày', 'Mã CK', 'Trạng thái', 'Nội dung', 'Phát sinh tăng', 'Phát sinh giảm']).to_excel(w, sheet_name='CK', index=False)
+
+
+def _frame(events):
+    df = pd.DataFrame(events)
+    df.loc[df['type'] == 'CASH_SNAPSHOT', 'date'] = pd.NaT  # datetime.now()
+    return df
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental, 'STORE_DIR', str(tmp_path / 'incremental'))
+    return tmp_path
+
+
+def test_new_ipo_cash_for_old_pending_row_matches_full_parse(store):
+    # Dòng CK "chờ giao dịch" HPG đã nạp lần trước; sao kê mới thêm tiền IPO HPG -> giá vốn dòng cũ phải tính lại
+    cash = [
+        [datetime(2024, 1, 2), 'Nop tien vao tai khoan', 50_000_000, 0, 50_000_000],
+        [datetime(2024, 1, 3), 'Thanh toan mua IPO 1000 HPG', 0, 10_000_000, 40_000_000],
+    ]
+    ck = [[datetime(2024, 1, 5), 'HPG', 'Chờ giao dịch', 'Luu ky HPG', 1000, 0]]
+    old, new = store / 'old.xlsx', store / 'new.xlsx'
+    _vck_file(old, cash, ck)
+    _vck_file(new, cash + [[datetime(2024, 1, 8), 'Thanh toan mua IPO 600 HPG', 0, 6_000_000, 34_000_000]], ck)
+
+    incremental.ingest(VCKAdapter(), str(old))
+    inc = _frame(incremental.ingest(VCKAdapter(), str(new)))
+    full = _frame(VCKAdapter().parse(str(new)))
+    pd.testing.assert_frame_equal(inc, full, check_dtype=False)
+    wft = full[full['ticker'] == 'HPG_WFT']
+    assert wft['value'].sum() == 16_000_000
+
+
+def test_new_rows_are_parsed_incrementally(store):
+    cash = [[datetime(2024, 1, 2), 'Nop tien vao tai khoan', 50_000_000, 0, 50_000_000]]
+    ck = [[datetime(2024, 1, 3), 'HPG', 'Bình thường', 'Mua khop HPG gia: 20,000', 1000, 0]]
+    old, new = store / 'old.xlsx', store / 'new.xlsx'
+    _vck_file(old, cash, ck)
+    _vck_file(new, cash + [[datetime(2024, 2, 1), 'Nop tien vao tai khoan', 5_000_000, 0, 55_000_000]],
+              ck + [[datetime(2024, 2, 2), 'FPT', 'Bình thường', 'Mua khop FPT gia: 90,000', 100, 0]])
+
+    incremental.ingest(VCKAdapter(), str(old))
+    before = dict(incremental.STATS)
+    inc = _frame(incremental.ingest(VCKAdapter(), str(new)))
+    assert incremental.STATS['incremental'] == before['incremental'] + 1
+    pd.testing.assert_frame_equal(inc, _frame(VCKAdapter().parse(str(new))), check_dtype=False)
+
+
+def test_edited_middle_row_forces_full_parse(store):
+    # Dòng đầu và dòng cuối đã nạp giữ nguyên, chỉ sửa số tiền dòng giữa -> không được dùng lại sự kiện cũ
+    cash = [
+        [datetime(2024, 1, 2), 'Nop tien vao tai khoan', 50_000_000, 0, 50_000_000],
+        [datetime(2024, 1, 3), 'Nop tien vao tai khoan', 5_000_000, 0, 55_000_000],
+        [datetime(2024, 1, 4), 'Rut tien ve ngan hang', 0, 1_000_000, 54_000_000],
+    ]
+    ck = [[datetime(2024, 1, 3), 'HPG', 'Bình thường', 'Mua khop HPG gia: 20,000', 1000, 0]]
+    edited = [list(r) for r in cash]
+    edited[1][2] = 7_000_000
+    old, new = store / 'old.xlsx', store / 'new.xlsx'
+    _vck_file(old, cash, ck)
+    _vck_file(new, edited + [[datetime(2024, 2, 1), 'Nop tien vao tai khoan', 1_000_000, 0, 57_000_000]], ck)
+
+    incremental.ingest(VCKAdapter(), str(old))
+    before = dict(incremental.STATS)
+    inc = _frame(incremental.ingest(VCKAdapter(), str(new)))
+    assert incremental.STATS['full'] == before['full'] + 1
+    pd.testing.assert_frame_equal(inc, _frame(VCKAdapter().parse(str(new))), check_dtype=False)
+    assert 7_000_000 in set(inc['val'])
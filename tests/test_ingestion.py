@@ -0,0 +1,13 @@
+# File: tests/test_ingestion.py
+import threading
+
+from processors import ingestion
+
+
+def test_unpicklable_spec_falls_back_to_serial(monkeypatch):
+    # Spec không gửi sang process khác được (khóa / file đang mở) -> chạy tuần tự, không ném lỗi ra ngoài
+    monkeypatch.setattr(ingestion, 'MAX_WORKERS', 2)
+    specs = [{'name': f"TK{i}", 'broker': 'KHONG_CO', 'data': b'', 'file_name': '', 'lock': threading.Lock()} for i in range(2)]
+    out = ingestion.ingest_accounts(specs)
+    assert [r['name'] for r in out] == ['TK0', 'TK1']
+    assert all(r['error'] for r in out)  # run_account tự bắt lỗi broker không hợp lệ
@@ -0,0 +1,50 @@
+# File: tests/test_lot_ledger.py
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from processors.lot_ledger import DUST_VOL, LotLedger
+
+PICK = {'fifo': lambda inv: 0, 'lifo': lambda inv: len(inv) - 1,
+        'hifo': lambda inv: max(range(len(inv)), key=lambda j: (inv[j]['cost'], -j))}
+
+
+@pytest.mark.parametrize('method', list(PICK))
+def test_ledger_matches_list_of_dicts(method):
+    # Logic cũ: list các dict, vòng while lấy từng lô
+    r = random.Random(7)
+    ops = [(r.random() < 0.55, r.randint(1, 40) * 100, r.uniform(5000, 90000)) for _ in range(3000)]
+    t0 = pd.Timestamp('2020-01-01')
+    inv, ref = [], []
+    led, out = LotLedger(method=method), []
+    for i, (is_buy, vol, price) in enumerate(ops):
+        if is_buy:
+            inv.append({'date': t0 + pd.Timedelta(hours=i), 'vol': vol, 'cost': price})
+            led.append(t0 + pd.Timedelta(hours=i), vol, price)
+            continue
+        qty = vol; cost_goods = 0
+        while qty > 0 and inv:
+            j = PICK[method](inv); b = inv[j]; take = min(qty, b['vol'])
+            cost_goods += take * b['cost']; b['vol'] -= take; qty -= take
+            if b['vol'] <= DUST_VOL: inv.pop(j)
+        ref.append(cost_goods)
+        take, idx, dust = led.consume(vol)
+        out.append(float(take @ led.cost[idx]) if len(take) else 0)
+    assert len(led) == len(inv) and all(a['vol'] == b['vol'] and a['cost'] == b['cost'] for a, b in zip(led, inv))
+    assert np.allclose(out, ref, rtol=1e-12)
+
+
+@pytest.mark.parametrize('method', ['fifo', 'lifo', 'average', 'hifo'])
+def test_consume_accounts_for_all_dust(method):
+    # Lệnh bán chạm nhiều lô: SL rời kho = SL lấy + phần lẻ bị bỏ (cộng dồn mọi lô, không chỉ lô cuối)
+    led = LotLedger(method=method)
+    t0 = pd.Timestamp('2024-01-01')
+    for k, (vol, cost) in enumerate([(100.00004, 30000.0), (100.00003, 20000.0), (100.0, 10000.0)]):
+        led.append(t0 + pd.Timedelta(days=k), vol, cost)
+    before = sum(b['vol'] for b in led)
+    take, idx, dust = led.consume(200)
+    assert take.sum() == pytest.approx(200)
+    assert before - sum(b['vol'] for b in led) == pytest.approx(take.sum() + dust, abs=1e-9)
+    assert len(led) == 1 and 0 < dust <= DUST_VOL
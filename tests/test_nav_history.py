@@ -0,0 +1,50 @@
+# File: tests/test_nav_history.py
+import numpy as np
+import pandas as pd
+
+from processors.engine import PortfolioEngine
+from processors.price_store import PriceStore
+
+
+def test_daily_nav_matches_engine_as_of(events):
+    eng = PortfolioEngine('t'); eng.run(events)
+    df = eng.nav.frame('D'); ev = eng.nav.frame('event')
+    assert len(ev) == len(events) and df['Ngày'].is_monotonic_increasing
+    daily = df.set_index('Ngày')
+    for day in pd.Series(df['Ngày']).sample(15, random_state=2):
+        ref = eng.engine_as_of(day)
+        row = daily.loc[day]
+        assert np.isclose(row['Tiền Mặt'], ref.real_cash_balance) and np.isclose(row['Vốn Nạp Ròng'], ref.total_deposit)
+        assert np.isclose(row['Giá Trị Cổ Phiếu'], sum(s['open']['val'] for s in ref.data.values()), rtol=1e-9, atol=1e-3)
+    assert np.isclose(ev['Tiền Mặt'].iloc[-1], eng.real_cash_balance)
+
+
+def test_dividend_patch_lowers_adj_nav_from_ex_date(events, tmp_path):
+    # Vá cổ tức sau run() (patch_dividend_fix -> adjust_inventory_cost): NAV basis='adj' phải hạ từ ngày GDKHQ
+    eng = PortfolioEngine('t'); eng.run(events)
+    sym, state = next((s, st) for s, st in eng.data.items() if len(st['inventory']) > 1)
+    lots = list(state['inventory'])
+    ex_date = lots[len(lots) // 2]['date'].normalize() + pd.Timedelta(days=1)
+    vol_adj = sum(b['vol'] for b in lots if b['date'] < ex_date + pd.Timedelta(days=1))
+    assert vol_adj > 0
+    # Mọi mã có giá đóng cửa từ ngày đầu -> NAV theo giá thị trường không phụ thuộc giá vốn
+    store = PriceStore(str(tmp_path))
+    cal = pd.date_range(events[0]['date'].normalize(), eng.today)
+    for s in eng.data: store.save(s, pd.DataFrame({'Date': cal, 'Close': 2e4}))
+    before_d = eng.nav.frame('D', 'adj').copy(); before_ev = eng.nav.frame('event', 'adj').copy()
+    before_mkt = eng.nav.frame('D', 'adj', price_store=store)
+    eng.adjust_inventory_cost(sym, 500.0, until=ex_date)
+
+    ev = eng.nav.frame('event', 'adj')
+    assert np.isclose(ev['Giá Trị Cổ Phiếu'].iloc[-1], sum(st['open']['adj_val'] for st in eng.data.values()), rtol=1e-9, atol=1e-3)
+    shift = (ev['Giá Trị Cổ Phiếu'] - before_ev['Giá Trị Cổ Phiếu']).to_numpy()
+    after = (ev['Ngày'] >= ex_date).to_numpy()
+    assert np.allclose(shift[after], -500.0 * vol_adj) and np.allclose(shift[~after], 0)
+    daily = eng.nav.frame('D', 'adj')
+    step = (daily['Tổng Tài Sản (NAV)'] - before_d['Tổng Tài Sản (NAV)']).to_numpy()
+    assert np.allclose(step[(daily['Ngày'] >= ex_date).to_numpy()], -500.0 * vol_adj)
+    assert np.allclose(step[(daily['Ngày'] < ex_date).to_numpy()], 0)
+    pd.testing.assert_frame_equal(eng.nav.frame('D', 'adj', price_store=store), before_mkt)
+    # Vốn gốc không đổi; engine_as_of (không gồm phần vá) cũng không đổi
+    pd.testing.assert_frame_equal(eng.nav.frame('D', 'val'), eng.nav.head(len(eng.nav)).frame('D', 'val'))
+    assert not eng.engine_as_of(daily['Ngày'].iloc[-1]).nav.cost_adjustments
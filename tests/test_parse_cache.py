@@ -0,0 +1,29 @@
+# File: tests/test_parse_cache.py
+import os
+
+from processors import parse_cache
+
+
+def _write(path, n_bytes, mtime):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f: f.write(b'x' * n_bytes)
+    os.utime(path, (mtime, mtime))
+
+
+def test_evict_counts_checkpoint_subdirectories(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_cache, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(parse_cache, 'MAX_CACHE_BYTES', 2500)
+    old_inc = str(tmp_path / 'incremental' / 'VCKAdapter_a.pkl')
+    old_eng = str(tmp_path / 'engine' / 'engine_a.ckpt')
+    parse = str(tmp_path / 'VCKAdapter_b.pkl')
+    new_eng = str(tmp_path / 'engine' / 'engine_b.ckpt')
+    _write(old_inc, 1000, 100)
+    _write(old_eng, 1000, 200)
+    _write(parse, 1000, 300)
+    _write(new_eng, 1000, 400)
+    _write(str(tmp_path / 'engine' / 'engine_c.ckpt.1.tmp'), 5000, 50)  # File đang ghi dở: không đụng tới
+
+    parse_cache._evict(keep=new_eng)
+    left = sorted(os.path.relpath(f, tmp_path) for _, _, f in parse_cache._cache_files())
+    assert left == [os.path.join('VCKAdapter_b.pkl'), os.path.join('engine', 'engine_b.ckpt')]
+    assert parse_cache.cache_info()['files'] == 2
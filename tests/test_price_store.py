@@ -0,0 +1,28 @@
+# File: tests/test_price_store.py
+import numpy as np
+import pandas as pd
+
+from processors.event_time import NS_PER_DAY, day_ordinal
+from processors.price_store import PriceStore, unrealized_pnl
+
+
+def test_close_matrix_matches_asof_loop(tmp_path):
+    r = np.random.default_rng(1)
+    store = PriceStore(str(tmp_path))
+    cal = pd.bdate_range('2024-01-01', '2024-06-30')
+    names = [f"M{i:03d}" for i in range(6)]
+    for t in names:
+        store.save(t, pd.DataFrame({'Date': cal, 'Close': 1e4 * np.exp(np.cumsum(r.normal(0, 0.02, len(cal))))}))
+    # Từ trước phiên đầu tiên (chưa có giá -> giữ giá vốn) tới sau phiên cuối
+    days = np.arange(day_ordinal(cal[0].value) - 5, day_ordinal(cal[-1].value) + 5)
+    vol = r.integers(0, 20, (len(days), len(names))) * 100.0
+    cost = vol * 1e4
+    got = cost.sum(axis=1) + unrealized_pnl(vol, cost, store.close_matrix(names, days))
+    # Cách cũ: vòng mã x ngày, tra giá phiên gần nhất bằng Series.asof
+    series = {t: pd.read_csv(store.path(t), index_col='Date', parse_dates=True)['Close'] for t in names}
+    ref = np.zeros(len(days))
+    for i, d in enumerate(pd.to_datetime(days * NS_PER_DAY)):
+        for j, t in enumerate(names):
+            p = series[t].asof(d)
+            ref[i] += vol[i, j] * p if p == p and vol[i, j] > 0 else cost[i, j]
+    assert np.allclose(got, ref, rtol=1e-12)
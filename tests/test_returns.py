@@ -0,0 +1,62 @@
+# File: tests/test_returns.py
+import numpy as np
+import pandas as pd
+
+from analytics.returns import DAYS_PER_YEAR, MIN_BASE, period_returns
+
+
+def test_cash_snapshot_is_a_flow_not_a_return(snapshot_engine):
+    eng = snapshot_engine
+    assert np.isclose(eng.real_cash_balance, 1.48e9)
+    got = period_returns({'vck': eng}, at=[eng.last_snapshot_date], windows=('1M', '3M'))
+    assert np.allclose(got['TWR (%)'], 0.0, atol=1e-9)
+    assert np.allclose(got['XIRR (%)'], 0.0, atol=1e-6)
+    assert np.allclose(got['Nạp/Rút ròng'], 5e8)
+
+
+def _books(n_acc):
+    r = np.random.default_rng(7)
+    cal = pd.date_range('2022-01-01', '2023-12-31')
+    books = {}
+    for a in range(n_acc):
+        start = r.integers(0, 200)
+        dep = np.zeros(len(cal)); dep[start] = 1e9
+        k = r.choice(np.arange(start + 1, len(cal)), 8, replace=False); dep[k] = r.normal(0, 2e8, 8)
+        nav = np.zeros(len(cal))
+        for i in range(start, len(cal)): nav[i] = max(nav[i - 1] + dep[i], 0) * (1 + r.normal(3e-4, 0.012))
+        books[f"TK{a}"] = pd.DataFrame({'Ngày': cal[start:], 'Tổng Tài Sản (NAV)': nav[start:], 'Vốn Nạp Ròng': np.cumsum(dep)[start:]})
+    return books
+
+
+def _ref_xirr(flows, t):
+    f = lambda x: sum(c * np.exp(-x * y) for c, y in zip(flows, t))
+    a, b = -10.0, 10.0
+    if np.sign(f(a)) * np.sign(f(b)) >= 0: return np.nan
+    for _ in range(200):
+        m = 0.5 * (a + b)
+        if np.sign(f(m)) == np.sign(f(a)): a = m
+        else: b = m
+    return np.expm1(0.5 * (a + b))
+
+
+def test_period_returns_match_per_window_loop():
+    # Cách cũ: từng tài khoản x từng ngày chốt x từng kỳ, TWR nối chuỗi từng ngày, XIRR chia đôi
+    books = _books(3)
+    got = period_returns(books)
+    assert len(got) and got['TWR (%)'].notna().any()
+    for _, row in got.iterrows():
+        df = books[row['Tài khoản']].set_index('Ngày')
+        win = df.loc[(df.index > row['Từ ngày']) & (df.index <= row['Ngày'])]
+        nav0 = df['Tổng Tài Sản (NAV)'].get(row['Từ ngày'], 0.0)
+        dep0 = df['Vốn Nạp Ròng'].get(row['Từ ngày'], 0.0)
+        growth, prev, prev_dep, flows, t = 1.0, nav0, dep0, [-nav0], [0.0]
+        for d, x in win.iterrows():
+            f = x['Vốn Nạp Ròng'] - prev_dep
+            if prev + f > MIN_BASE: growth *= x['Tổng Tài Sản (NAV)'] / (prev + f)
+            if f: flows.append(-f); t.append((d - row['Từ ngày']).days / DAYS_PER_YEAR)
+            prev, prev_dep = x['Tổng Tài Sản (NAV)'], x['Vốn Nạp Ròng']
+        twr = (growth - 1) * 100 if nav0 > MIN_BASE or len(flows) > 1 else np.nan  # Kỳ chưa có vốn -> NaN
+        flows.append(prev); t.append((row['Ngày'] - row['Từ ngày']).days / DAYS_PER_YEAR)
+        assert (np.isnan(twr) and np.isnan(row['TWR (%)'])) or np.isclose(twr, row['TWR (%)'], rtol=1e-9, atol=1e-9), row
+        x = _ref_xirr(flows, t) * 100
+        assert (np.isnan(x) and np.isnan(row['XIRR (%)'])) or np.isclose(x, row['XIRR (%)'], rtol=1e-6, atol=1e-6), (row, x)
@@ -0,0 +1,47 @@
+# File: tests/test_risk.py
+import numpy as np
+import pandas as pd
+
+from analytics import risk
+from analytics.risk import CONFIDENCE, TRADING_DAYS, risk_frame
+
+
+def test_risk_frame_matches_pandas_rolling(monkeypatch):
+    monkeypatch.setattr(risk, '_CACHE', {})
+    monkeypatch.setattr(risk, 'STATS', {'hit': 0, 'miss': 0})
+    r = np.random.default_rng(11)
+    cal = pd.date_range('2020-01-01', periods=365 * 2)
+    m_ret = r.normal(2e-4, 0.011, len(cal))
+    vni = pd.DataFrame({'Date': cal, 'Close': 1000 * np.cumprod(1 + m_ret)})
+    dep = np.zeros(len(cal)); dep[0] = 1e9; dep[r.choice(np.arange(1, len(cal)), 10, replace=False)] = r.normal(0, 1e8, 10)
+    nav = np.zeros(len(cal))
+    p_ret = 1e-4 + 1.2 * m_ret + r.normal(0, 0.006, len(cal))
+    for i in range(len(cal)): nav[i] = ((nav[i - 1] if i else 0) + dep[i]) * (1 + p_ret[i])
+    book = pd.DataFrame({'Ngày': cal, 'Tổng Tài Sản (NAV)': nav, 'Vốn Nạp Ròng': np.cumsum(dep)})
+    window = 21
+
+    got = risk_frame(book, window, vni, rf=0.03)
+    assert risk_frame(book, window, vni, rf=0.03) is got and risk.STATS == {'hit': 1, 'miss': 1}
+    # Cách thông thường: pandas rolling / rolling().apply trên chuỗi lợi nhuận ngày giao dịch
+    rp = got['Lợi nhuận ngày (%)'] / 100; rm = got['VN-Index ngày (%)'] / 100; rf_d = 0.03 / TRADING_DAYS
+    roll = rp.rolling(window)
+    ref = pd.DataFrame({
+        'Biến động năm (%)': roll.std() * np.sqrt(TRADING_DAYS) * 100,
+        'Sharpe': (roll.mean() - rf_d) / roll.std() * np.sqrt(TRADING_DAYS),
+        'Sortino': (roll.mean() - rf_d) / roll.apply(lambda x: np.sqrt((np.minimum(x - rf_d, 0) ** 2).mean()), raw=True) * np.sqrt(TRADING_DAYS),
+        'Beta': roll.cov(rm) / rm.rolling(window).var(),
+        'Tương quan': roll.corr(rm),
+        'VaR lịch sử (%)': -roll.quantile(1 - CONFIDENCE) * 100,
+        'CVaR lịch sử (%)': -roll.apply(lambda x: x[x <= np.quantile(x, 1 - CONFIDENCE)].mean(), raw=True) * 100,
+        'Ulcer': (1 + rp).cumprod().rolling(window).apply(lambda p: np.sqrt((((p / np.maximum.accumulate(p) - 1) * 100) ** 2).mean()), raw=True),
+    })
+    for c in ref.columns:
+        assert np.allclose(got[c], ref[c], rtol=1e-7, atol=1e-9, equal_nan=True), c
+
+
+
+def test_risk_ignores_cash_snapshot_jump(snapshot_engine):
+    df = risk_frame(snapshot_engine, window=5, benchmark=None)
+    assert (df['Ngày'] == snapshot_engine.last_snapshot_date.normalize()).any()
+    assert np.allclose(df['Lợi nhuận ngày (%)'], 0.0, atol=1e-9)
+    assert np.allclose(df['Biến động năm (%)'].dropna(), 0.0, atol=1e-9)
@@ -0,0 +1,29 @@
+# File: tests/test_trade_log.py
+import pickle
+import random
+
+import pandas as pd
+
+from processors.trade_log import TradeLog, as_frame
+
+
+def _rows(n):
+    r = random.Random(3)
+    t0 = pd.Timestamp('2018-01-01')
+    rows = []
+    for i in range(n):
+        kind = r.choice(['MUA', 'BÁN', 'CỔ TỨC', 'PHÍ/THUẾ'])
+        row = {'Ngày': t0 + pd.Timedelta(hours=i), 'Mã': f"M{r.randint(0, 30):03d}", 'Loại': kind, 'SL': r.randint(1, 50) * 100.0}
+        if kind != 'MUA': row['Giá Bán'] = r.uniform(5000, 90000)
+        row.update({'Giá Vốn': r.uniform(5000, 90000), 'Lãi/Lỗ': r.uniform(-1e6, 1e6), 'Nguồn': r.choice(['Giao Dịch Mua', 'Mua IPO/Deal', 'Giao Dịch Bán'])})
+        rows.append(row)
+    return rows
+
+
+def test_trade_log_matches_list_of_dicts():
+    rows = _rows(500)
+    log = TradeLog(); log.extend(rows)
+    pd.testing.assert_frame_equal(as_frame(log), pd.DataFrame(rows), check_dtype=False, check_categorical=False)
+    assert list(log) == rows and log[5] == rows[5] and len(log[:100]) == 100
+    back = pickle.loads(pickle.dumps(log)); del back[10:]
+    assert list(back) == rows[:10] and list(log[:10]) == rows[:10]
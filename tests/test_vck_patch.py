@@ -0,0 +1,63 @@
+# File: tests/test_vck_patch.py
+import copy
+import random
+
+import pandas as pd
+import pytest
+
+from processors.vck_patch import WINDOW_SECONDS, VCKPatch
+
+
+def _random_case(seed, n_events=300, n_buys=120):
+    # Sự kiện Adapter + lệnh mua thiếu ngẫu nhiên, dồn vào các mép: cửa sổ ±15 ngày (±1 giây), lệch value ±50, NaT, value None
+    r = random.Random(seed)
+    base = pd.Timestamp('2024-01-01')
+    tickers, qtys = ['HPG', 'FPT', 'SSI'], [100.0, 200.0, 500.0]
+    buys = []
+    for _ in range(n_buys):
+        d = base + pd.Timedelta(seconds=r.randint(0, 60 * 86400))
+        if r.random() < 0.03: d = pd.NaT
+        buys.append({'date': d, 'value': float(r.choice([1_000_000, 2_000_000, 5_000_000]) + r.choice([0, 25, 49.5, 50, 75])),
+                     'ticker': r.choice(tickers), 'qty': r.choice(qtys), 'price': 10_000.0})
+    events = []
+    for _ in range(n_events):
+        ref = r.choice(buys)
+        anchor = ref['date'] if ref['date'] is not pd.NaT else base
+        edge = r.choice([-0.5, -1e-6, 0, 1e-6, 0.5, 1.5])  # Quanh mép cửa sổ theo giây
+        sign = r.choice([-1, 1])
+        d = anchor + sign * pd.Timedelta(seconds=WINDOW_SECONDS + edge) if r.random() < 0.5 else anchor + pd.Timedelta(seconds=r.randint(-WINDOW_SECONDS, WINDOW_SECONDS))
+        d = r.choice([d, d, d, d, d, d.to_pydatetime(), pd.NaT, None])
+        k = r.random()
+        if k < 0.35:
+            ev = {'date': d, 'type': 'BUY', 'ticker': r.choice(tickers), 'qty': ref['qty'] + r.choice([0, 0.5, 1, 5])}
+        else:
+            value = ref['value'] + r.choice([-50, -49.99, -25, 0, 25, 49.99, 50, 51, 120])
+            ev = {'date': d, 'type': r.choice(['RUT_TIEN', 'PHI_THUE', 'NAP_TIEN']),
+                  'value': r.choice([value] * 8 + [None, float('nan'), str(value)])}
+            if r.random() < 0.05: del ev['value']
+        events.append(ev)
+    return events, buys
+
+
+@pytest.mark.parametrize('seed', range(12))
+def test_indexed_merge_matches_scan(seed):
+    events, buys = _random_case(seed)
+    scan, indexed = copy.deepcopy(events), copy.deepcopy(events)
+    VCKPatch(indexed=False)._merge_scan(scan, copy.deepcopy(buys))
+    VCKPatch(indexed=True)._merge_indexed(indexed, copy.deepcopy(buys))
+    assert indexed == scan
+    patched = [ev for ev in scan if ev.get('source') == 'VCK_PATCHED']
+    assert patched and any(ev.get('source') == 'VCK_PATCH_NEW' for ev in scan)
+
+
+def test_rewritten_event_is_reindexed_as_buy():
+    # Lệnh 1 sửa RUT_TIEN thành BUY HPG 100 -> lệnh 2 (cùng mã, cùng KL) phải thấy đã bắt, không thêm mới
+    d = pd.Timestamp('2024-03-01')
+    events = [{'date': d, 'type': 'RUT_TIEN', 'value': 1_000_000.0}]
+    buys = [{'date': d, 'value': 1_000_020.0, 'ticker': 'HPG', 'qty': 100.0, 'price': 10_000.0},
+            {'date': d + pd.Timedelta(days=3), 'value': 9_000_000.0, 'ticker': 'HPG', 'qty': 100.0, 'price': 90_000.0}]
+    for indexed in (False, True):
+        out = copy.deepcopy(events)
+        p = VCKPatch(indexed=indexed)
+        (p._merge_indexed if indexed else p._merge_scan)(out, copy.deepcopy(buys))
+        assert len(out) == 1 and out[0]['type'] == 'BUY' and out[0]['source'] == 'VCK_PATCHED'
@@ -0,0 +1,43 @@
+# File: tests/test_workbook.py
+import io
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from processors import workbook
+from processors.workbook import ParsedWorkbook
+
+
+def _xlsx_bytes():
+    # Cột 'Ghi chú': ô lỗi thật (#REF! kiểu 'e') và chữ '#REF!' gõ tay (kiểu 's')
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Tiền'
+    ws.append(['Ngày', 'Ghi chú', 'Số tiền'])
+    ws.append(['02/01/2024', '#REF!', 1000])
+    ws.append(['03/01/2024', 'x', 2000])
+    ws['B3'].value = '#REF!'
+    ws['B3'].data_type = 's'
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def test_only_error_cells_become_nan():
+    data = _xlsx_bytes()
+    expected = workbook._PandasReader(data).read('Tiền')
+    got = workbook._OpenpyxlStreamReader(data).read('Tiền')
+    pd.testing.assert_frame_equal(got, expected)
+    assert pd.isna(got.loc[0, 'Ghi chú']) and got.loc[1, 'Ghi chú'] == '#REF!'
+
+
+def test_broken_excel_raises_instead_of_csv():
+    data = _xlsx_bytes()
+    with pytest.raises(Exception):
+        ParsedWorkbook(data[:len(data) // 2], 'sao_ke.xlsx')
+    with pytest.raises(Exception):
+        ParsedWorkbook(b'\xd0\xcf\x11\xe0' + b'\x00' * 512, 'sao_ke.xls')
+    # Nội dung không phải Excel (CSV đặt đuôi .xlsx) -> vẫn đọc như CSV
+    wb = ParsedWorkbook('Ngày,Số tiền\n02/01/2024,1000\n'.encode('utf-8'), 'sao_ke.xlsx')
+    assert wb.is_csv and wb.raw()['Số tiền'].tolist() == [1000]
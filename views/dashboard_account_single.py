@@ -71,16 +71,19 @@ def display(engine, title, df_sum, df_cyc, df_inv, df_warn):
     # ----------------------------------------------------
     df_nav_history = pd.DataFrame()
     
-    # Bước 1: Thử dùng TimeMachine (Cách chuẩn)
+    # Bước 1: Lịch sử NAV ghi sẵn trong lượt replay của Engine (không replay lại), không có thì TimeMachine
     try:
-        # Ưu tiên dùng 'events' vì chứa cả Nạp/Rút
-        source_data = getattr(engine, 'events', [])
-        if not source_data: 
-            source_data = getattr(engine, 'trade_log', []) # Fallback sang trade_log
-            
-        if source_data:
-            tm = TimeMachine(source_data)
-            df_nav_history = tm.run()
+        if hasattr(engine, 'get_nav_chart_data'):
+            df_nav_history = engine.get_nav_chart_data()
+        else:
+            # Ưu tiên dùng 'events' vì chứa cả Nạp/Rút
+            source_data = getattr(engine, 'events', [])
+            if not source_data: 
+                source_data = getattr(engine, 'trade_log', []) # Fallback sang trade_log
+                
+            if source_data:
+                tm = TimeMachine(source_data)
+                df_nav_history = tm.run()
     except Exception:
         df_nav_history = pd.DataFrame() # Reset nếu lỗi
 
@@ -96,8 +99,8 @@ def display(engine, title, df_sum, df_cyc, df_inv, df_warn):
         if hasattr(engine, 'trade_log') and engine.trade_log:
             try:
                 # Tìm ngày giao dịch đầu tiên
-                dates = [pd.to_datetime(x.get('date', x.get('Ngày'))) for x in engine.trade_log if x.get('date') or x.get('Ngày')]
-                if dates: start_date = min(dates)
+                dates = engine.trade_log_frame()['Ngày'].dropna()
+                if not dates.empty: start_date = dates.min()
             except: pass
             
         # Tạo DataFrame thủ công
@@ -239,7 +242,8 @@ def display(engine, title, df_sum, df_cyc, df_inv, df_warn):
     with t5: # Nhật ký
         log_data = getattr(engine, 'trade_log', []) or getattr(engine, 'events', [])
         if log_data:
-            st.dataframe(pd.DataFrame(log_data).style.format({
+            df_log = engine.trade_log_frame() if getattr(engine, 'trade_log', None) else pd.DataFrame(log_data)
+            st.dataframe(df_log.style.format({
                 'SL': fmt_num, 'Giá Bán': fmt_vnd, 'Giá Vốn': fmt_vnd, 'Lãi/Lỗ': fmt_vnd
             }), use_container_width=True, column_config=col_cfg)
         else: st.info("Chưa có nhật ký.")
\ No newline at end of file